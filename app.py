@@ -1,18 +1,39 @@
-from flask import Flask, render_template, request, jsonify, send_file, Response
+from flask import Flask, render_template, request, jsonify, send_file, Response, g
+from flask.json.provider import DefaultJSONProvider
 # 크롤러 모듈(safety_margin_calc_naver)이 아니라 storage에서 가져온다.
 # 크롤러 모듈은 requests·lxml·FinanceDataReader·tqdm을 최상단에서 임포트하는데,
 # 웹앱은 그중 무엇도 쓰지 않는다.
-from storage import download_from_supabase
+from storage import download_bytes_from_supabase, download_manifest
+from search_index import SearchIndex, normalize as normalize_query
+from snapshot import SnapshotStore
+from changes import ChangeLog
+from events import Broadcaster, open_stream as open_event_stream
+import metrics
+import profiling
 from datetime import datetime
 import os
+import gc
+import signal
 import threading
 import time
 import json
 import math
-from io import BytesIO
+import gzip
+import hashlib
+import base64
+import re
+import tempfile
+from collections import OrderedDict
+from collections.abc import Mapping
 import random
 import sys
 
+# brotli는 선택 사항이다. 없으면 gzip만 내보낸다.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # 표준 출력 설정 두 가지를 고정한다.
 # 1) encoding: Windows 콘솔 기본값(cp949)은 로그의 이모지를 표현하지 못해
 #    UnicodeEncodeError를 던진다. 이 예외가 요청 처리 중에 터지면 응답이
@@ -34,6 +55,77 @@ NCAV_FILE = 'ncav_results.json'
 # 캐시 수명(초). 크롤링이 하루 1회이므로 짧게 잡을 이유가 없다.
 CACHE_TTL = int(os.getenv('CACHE_TTL', '3600'))
 
+# 만료된 데이터를 즉시 내주고 갱신은 백그라운드 스레드 하나가 맡는다.
+# 끄면 만료 후 첫 요청이 다운로드를 기다리고, 그동안 도착한 요청은 모두
+# 그 뒤에 줄을 선다.
+CACHE_STALE_WHILE_REVALIDATE = os.getenv('CACHE_STALE_WHILE_REVALIDATE', '1').strip() in ('1', 'true', 'True')
+# 만료 이만큼 전(초)에 미리 갱신을 시작한다. 0이면 만료된 뒤에 시작한다.
+CACHE_REFRESH_AHEAD = int(os.getenv('CACHE_REFRESH_AHEAD', '0'))
+
+# 받은 데이터를 컬럼형 바이너리 스냅샷(snapshot.py)으로 써 둘 디렉터리.
+# 같은 호스트의 프로세스들이 같은 디렉터리를 보면 파일 하나를 mmap으로
+# 공유하고, 매니페스트의 버전과 같은 스냅샷이 있으면 다운로드도 파싱도
+# 하지 않는다. 비우면 쓰지 않는다. /dev/shm 같은 메모리 디렉터리를 권장한다.
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', '').strip()
+
+# /changes가 답할 수 있는 최근 데이터 버전 수. 그보다 오래된 버전을 가진
+# 클라이언트는 전체를 다시 받는다.
+CHANGES_HISTORY = int(os.getenv('CHANGES_HISTORY', '8'))
+
+# 데이터 버전 알림(/events). 연결을 오래 붙잡는 스트림이라 함수 실행 시간이
+# 짧은 서버리스(Vercel)에서는 기본으로 끈다. 꺼져 있으면 204로 답하고,
+# 브라우저의 EventSource는 204를 받으면 다시 접속하지 않는다.
+EVENTS_ENABLED = os.getenv('EVENTS_ENABLED', '0' if os.getenv('VERCEL') else '1').strip() in ('1', 'true', 'True')
+# 발행자가 새 버전을 확인하는 주기(초)
+EVENTS_POLL_INTERVAL = int(os.getenv('EVENTS_POLL_INTERVAL', '15'))
+# 유휴 연결에 보내는 하트비트 주기(초)와 끊겼을 때 재접속 대기(밀리초)
+EVENTS_HEARTBEAT = 25
+EVENTS_RETRY_MS = 10000
+# 워커 하나가 열어 둘 SSE 스트림 수. gthread 워커에서는 스트림마다 스레드
+# 하나를 붙잡으므로 GUNICORN_THREADS보다 한참 작아야 API 요청이 쓸 스레드가
+# 남는다. 넘치면 204와 Retry-After로 답하고, 브라우저는 그동안
+# /events/latest를 EVENTS_FALLBACK_POLL초마다 불러 알림을 대신한다.
+EVENTS_MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', '16'))
+EVENTS_FALLBACK_POLL = int(os.getenv('EVENTS_FALLBACK_POLL', '60'))
+# 자리가 없을 때 다시 접속해 보라고 알려 주는 대기(초)
+EVENTS_FULL_RETRY_SECONDS = 120
+
+# 여러 워커의 지표를 모을 디렉터리. 비우면 /metrics는 응답한 워커의 값만 낸다.
+METRICS_DIR = os.getenv('METRICS_DIR', '').strip()
+# 워커가 METRICS_DIR에 자기 값을 쓰는 주기(초)
+METRICS_FLUSH_SECONDS = int(os.getenv('METRICS_FLUSH_SECONDS', '15'))
+# 주면 /metrics에 Authorization: Bearer <토큰>이 있어야 한다
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '').strip()
+
+# 요청 프로파일링. 이 비율(0~1)의 요청을 cProfile로 재서 PROFILE_DIR에 pstats로 쓴다.
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+# 주면 X-Profile-Token 헤더가 이 값과 같은 요청은 비율과 관계없이 잰다
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '').strip()
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/ivc-profile')
+# PROFILE_DIR에 남겨 둘 최대 파일 수
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '200'))
+
+# ── 지표 ──────────────────────────────────────────
+# /filter가 느릴 때 정렬(파생 뷰), 직렬화, 갱신 대기 중 무엇 때문인지
+# 가를 수 있도록 단계마다 따로 잰다.
+REQUESTS = metrics.Counter('ivc_requests_total', '라우트별 요청 수', ('route', 'method', 'status'))
+REQUEST_SECONDS = metrics.Histogram('ivc_request_duration_seconds', '라우트별 처리 시간(초)', ('route',))
+RESPONSE_BYTES = metrics.Histogram('ivc_response_bytes', '라우트별 응답 본문 크기(바이트)', ('route',),
+                                   buckets=metrics.SIZE_BUCKETS)
+DATA_CACHE = metrics.Counter('ivc_data_cache_total',
+                             '데이터 캐시 조회. hit 신선, stale 만료된 것을 내주고 뒤에서 갱신, miss 갱신을 기다림',
+                             ('file', 'result'))
+RESPONSE_CACHE = metrics.Counter('ivc_response_cache_total', '직렬화한 응답·페이지 캐시 조회', ('cache', 'result'))
+DOWNLOAD_SECONDS = metrics.Histogram('ivc_download_seconds', '데이터 파일을 받는 데 걸린 시간(초)', ('file', 'source'))
+DOWNLOAD_BYTES = metrics.Counter('ivc_download_bytes_total', '받은 데이터 파일 바이트', ('file', 'source'))
+PARSE_SECONDS = metrics.Histogram('ivc_parse_seconds', '데이터 파일 JSON 파싱 시간(초)', ('file',))
+DERIVE_SECONDS = metrics.Histogram('ivc_derive_seconds', '파생 뷰(정렬·색인) 생성 시간(초)', ('file',))
+BUILD_SECONDS = metrics.Histogram('ivc_response_build_seconds', '캐시에 없는 응답 객체를 만드는 시간(초)', ('endpoint',))
+SERIALIZE_SECONDS = metrics.Histogram('ivc_response_serialize_seconds', '응답 JSON 직렬화·압축 시간(초)', ('endpoint',))
+DATA_VERSION = metrics.Gauge('ivc_data_version_info', '지금 제공 중인 데이터 버전 (값은 항상 1)', ('file', 'version'))
+DATA_AGE = metrics.Gauge('ivc_data_age_seconds', '데이터를 마지막으로 받거나 확인한 뒤 지난 시간(초)', ('file',))
+REFRESH_FAILURES = metrics.Gauge('ivc_refresh_failures', '연속 갱신 실패 횟수', ('file',))
+
 
 class RemoteDataCache:
     """Supabase Storage의 JSON을 메모리에 캐싱한다.
@@ -42,61 +134,347 @@ class RemoteDataCache:
     - 다운로드에 실패하면 이전 데이터를 계속 제공한다. 빈 목록을 내보내
       화면이 통째로 비는 것보다 오래된 데이터가 낫다.
     - 여러 워커 스레드가 동시에 만료를 감지해도 다운로드는 한 번만 한다.
+    - derive를 주면 다운로드가 성공할 때마다 한 번만 파생 뷰를 만든다.
+      요청마다 정렬·정제를 반복하지 않고 view()로 그 결과를 꺼내 쓴다.
+    - version은 받은 파일 바이트의 해시다. 내용이 같으면 어느 워커,
+      어느 시점에 받았든 같은 값이라 ETag 등의 기준으로 쓸 수 있다.
+    - 갱신할 때는 크롤러가 함께 올리는 매니페스트부터 본다. 해시가 가진
+      것과 같으면 큰 파일을 받지도 파싱하지도 않는다.
+    - 데이터가 한 번이라도 있으면 요청은 네트워크를 기다리지 않는다.
+      만료(또는 CACHE_REFRESH_AHEAD만큼 앞서)되면 백그라운드 스레드 하나가
+      갱신하고, 그동안은 기존 데이터를 내준다. 처음 한 번만 기다린다.
+    - SNAPSHOT_DIR이 있으면 받은 데이터를 스냅샷 파일로 바꿔 mmap한 것을
+      쓴다. 행은 dict가 아니라 읽기 전용 Mapping이다.
+    - on_update를 주면 뷰가 새 버전으로 바뀌기 직전에 (이전 뷰, 새 뷰)로
+      부른다. 변경분 기록 등에 쓴다.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, derive=None, on_update=None):
         self.filename = filename
+        self._derive = derive
+        self._on_update = on_update
         self._data = None
+        self._view = None
+        self.version = ''
         self._fetched_at = 0.0
         self._lock = threading.Lock()
 
+        # 갱신 상태. status()로 밖에 드러낸다.
+        self._refreshing = False
+        self._state_lock = threading.Lock()
+        self.last_refresh_seconds = None
+        self.last_error = None
+        self.failures = 0       # 연속 실패 횟수
+
+        # gunicorn 워커는 마스터가 받아 둔 데이터를 그대로 쓰고 스스로
+        # 갱신하지 않는다. 새 데이터는 마스터가 워커를 다시 띄워 넘겨준다.
+        self.pinned = False
+
+        self._snapshots = SnapshotStore(SNAPSHOT_DIR, filename) if SNAPSHOT_DIR else None
+
+    def _age(self):
+        return time.monotonic() - self._fetched_at
+
     def _fresh(self):
-        return self._data is not None and (time.monotonic() - self._fetched_at) < CACHE_TTL
+        return self._data is not None and self._age() < CACHE_TTL
+
+    def status(self) -> dict:
+        """갱신 상태 요약. 모니터링용."""
+        return {
+            'file': self.filename,
+            'version': self.version,
+            'loaded': self._data is not None,
+            'age_seconds': round(self._age(), 1) if self._data is not None else None,
+            'refreshing': self._refreshing,
+            'last_refresh_seconds': self.last_refresh_seconds,
+            'last_error': self.last_error,
+            'failures': self.failures,
+        }
 
     def _load_local(self):
         """로컬 개발 환경에 파일이 있으면 그것을 쓴다."""
         if not os.path.exists(self.filename):
             return None
         try:
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(self.filename, 'rb') as f:
+                return f.read()
         except Exception as e:
             print(f"⚠️ 로컬 {self.filename} 로드 실패: {e}", flush=True)
             return None
 
+    def _fetch(self):
+        """(데이터, 버전). 어디서도 못 받으면 (None, None)."""
+        # Supabase가 원본이다. 로컬 파일은 자격증명이 없거나 Supabase가
+        # 죽었을 때를 위한 폴백일 뿐이다. 순서가 반대면 한번 생긴
+        # 로컬 파일이 원격 갱신을 영구히 가려버린다.
+        for source, load in (('Supabase', lambda: download_bytes_from_supabase(self.filename)),
+                             ('로컬', self._load_local)):
+            started = time.perf_counter()
+            raw = load()
+            if raw is None:
+                continue
+            parse_started = time.perf_counter()
+            DOWNLOAD_SECONDS.observe((self.filename, source), parse_started - started)
+            DOWNLOAD_BYTES.inc((self.filename, source), len(raw))
+            try:
+                data = json.loads(raw.decode('utf-8'))
+            except Exception as e:
+                print(f"⚠️ {source} {self.filename} 파싱 실패: {e}", flush=True)
+                continue
+            PARSE_SECONDS.observe((self.filename,), time.perf_counter() - parse_started)
+            print(f"✅ {source}에서 {self.filename} 로드 ({len(data)}개 항목)", flush=True)
+            return data, _content_version(hashlib.sha256(raw).hexdigest())
+        return None, None
+
+    def _upstream_version(self):
+        """매니페스트가 가리키는 데이터 버전. 볼 필요가 없거나 없으면 None."""
+        # 처음 받을 때는 비교할 버전이 없으므로, 스냅샷을 찾을 때만 본다
+        if self._data is None and self._snapshots is None:
+            return None
+        meta = download_manifest(self.filename)
+        return _content_version(meta['sha256']) if meta else None
+
     def get(self):
-        if self._fresh():
-            return self._data
+        """원본 데이터. 읽기 전용으로만 다룰 것."""
+        self._ensure()
+        return self._data if self._data is not None else []
+
+    def view(self):
+        """derive로 만든 파생 뷰. derive가 없으면 원본과 같다."""
+        self._ensure()
+        if self._view is None:
+            return self._derive([], '') if self._derive else []
+        return self._view
+
+    def refresh_now(self) -> bool:
+        """지금 바로 (기다려서) 갱신한다. 버전이 바뀌었으면 True."""
+        with self._lock:
+            before = self.version
+            self._refresh()
+            return self.version != before
 
+    def _after_fork(self, pinned):
+        # fork 순간 다른 스레드가 쥐고 있던 락은 자식에서 영영 풀리지 않는다
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+        self.pinned = pinned
+
+    def _ensure(self):
+        if self.pinned and self._data is not None:
+            DATA_CACHE.inc((self.filename, 'hit'))
+            return
+        if self._data is not None:
+            age = self._age()
+            if age < CACHE_TTL - CACHE_REFRESH_AHEAD:
+                DATA_CACHE.inc((self.filename, 'hit'))
+                return
+            if CACHE_STALE_WHILE_REVALIDATE:
+                # 기존 데이터를 그대로 내주고 갱신은 뒤에서 한다
+                DATA_CACHE.inc((self.filename, 'stale' if age >= CACHE_TTL else 'hit'))
+                self._refresh_in_background()
+                return
+            if age < CACHE_TTL:
+                DATA_CACHE.inc((self.filename, 'hit'))
+                return
+
+        DATA_CACHE.inc((self.filename, 'miss'))
         with self._lock:
             # 락을 기다리는 동안 다른 스레드가 이미 갱신했을 수 있다
             if self._fresh():
-                return self._data
-
-            # Supabase가 원본이다. 로컬 파일은 자격증명이 없거나 Supabase가
-            # 죽었을 때를 위한 폴백일 뿐이다. 순서가 반대면 한번 생긴
-            # 로컬 파일이 원격 갱신을 영구히 가려버린다.
-            data = download_from_supabase(self.filename)
-            if data is None:
-                data = self._load_local()
-
-            if data is None:
-                # 갱신 실패. 재시도 폭주를 막기 위해 타임스탬프는 갱신하고
-                # 기존 데이터(있으면)를 그대로 제공한다.
-                self._fetched_at = time.monotonic()
-                if self._data is None:
-                    print(f"❗ {self.filename} 를 가져오지 못했고 캐시도 비어 있음", flush=True)
-                    return []
-                print(f"⚠️ {self.filename} 갱신 실패 → 이전 데이터 유지", flush=True)
-                return self._data
-
-            self._data = data
+                return
+            self._refresh()
+
+    def _refresh_in_background(self):
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh,
+                         name=f'refresh-{self.filename}', daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                # 앞선 갱신이 방금 끝났다면 다시 받지 않는다
+                if self._data is not None and self._age() < CACHE_TTL - CACHE_REFRESH_AHEAD:
+                    return
+                self._refresh()
+        except Exception as e:
+            # 스레드 안의 예외는 아무도 받아주지 않는다. 여기서 삼키지 않으면
+            # _refreshing이 영영 풀리지 않아 이후 갱신이 멈춘다.
+            self.last_error = f'{type(e).__name__}: {e}'
+            print(f"❗ {self.filename} 백그라운드 갱신 오류: {e}", flush=True)
+        finally:
+            with self._state_lock:
+                self._refreshing = False
+
+    def _refresh(self):
+        """다운로드해서 교체한다. self._lock을 쥔 상태로 호출할 것."""
+        started = time.monotonic()
+        upstream = self._upstream_version()
+        if upstream and upstream == self.version:
+            self._mark_unchanged(started, '매니페스트')
+            return
+
+        data = version = None
+        if upstream and self._snapshots is not None:
+            # 같은 호스트의 다른 프로세스가 이미 받아 둔 버전이면 그대로 연다
+            started_snapshot = time.perf_counter()
+            data = self._snapshots.load(upstream)
+            if data is not None:
+                DOWNLOAD_SECONDS.observe((self.filename, '스냅샷'), time.perf_counter() - started_snapshot)
+                version = upstream
+                print(f"✅ 스냅샷에서 {self.filename} 로드 ({len(data)}개 항목)", flush=True)
+
+        if data is None:
+            data, version = self._fetch()
+            if data is not None and version == self.version:
+                # 매니페스트가 없어 전체를 받았지만 내용은 그대로다. 뷰와 응답
+                # 캐시를 살리기 위해 교체하지 않는다.
+                self._mark_unchanged(started, '해시')
+                return
+            if data is not None and self._snapshots is not None:
+                # 파싱한 목록 대신 mmap한 스냅샷을 들고 있는다. 쓰지 못하면
+                # 목록을 그대로 쓴다.
+                data = self._snapshots.save(data, version) or data
+
+        view = None
+        error = None if data is not None else '다운로드 실패'
+        if data is not None and self._derive:
+            try:
+                derive_started = time.perf_counter()
+                view = self._derive(data, version)
+                DERIVE_SECONDS.observe((self.filename,), time.perf_counter() - derive_started)
+            except Exception as e:
+                print(f"⚠️ {self.filename} 파생 뷰 생성 실패: {e}", flush=True)
+                error = f'파생 뷰 생성 실패: {e}'
+                data = None
+
+        self.last_refresh_seconds = round(time.monotonic() - started, 3)
+
+        if data is None:
+            # 갱신 실패. 재시도 폭주를 막기 위해 타임스탬프는 갱신하고
+            # 기존 데이터(있으면)를 그대로 제공한다.
             self._fetched_at = time.monotonic()
-            return self._data
+            self.last_error = error
+            self.failures += 1
+            if self._data is None:
+                print(f"❗ {self.filename} 를 가져오지 못했고 캐시도 비어 있음", flush=True)
+            else:
+                print(f"⚠️ {self.filename} 갱신 실패 {self.failures}회째 → 이전 데이터 유지 "
+                      f"({self.last_refresh_seconds:.2f}초)", flush=True)
+            return
+
+        if self._on_update is not None and view is not None:
+            # 새 뷰를 내놓기 전에 부른다. 새 버전을 본 요청이 그 버전의
+            # 변경분을 찾지 못하는 순간이 없게 한다.
+            try:
+                self._on_update(self._view, view)
+            except Exception as e:
+                print(f"⚠️ {self.filename} 갱신 후처리 실패: {e}", flush=True)
+
+        # 뷰를 먼저 만들어 두고 한꺼번에 바꾼다. 락 밖의 읽기 스레드가
+        # 새 원본과 옛 뷰를 섞어 보는 시간을 줄인다.
+        self._data = data
+        self._view = view if self._derive else data
+        self.version = version
+        self._fetched_at = time.monotonic()
+        self.last_error = None
+        self.failures = 0
+        print(f"🔄 {self.filename} 갱신 완료 ({self.last_refresh_seconds:.2f}초, 버전 {version})", flush=True)
+
+    def _mark_unchanged(self, started, how):
+        self.last_refresh_seconds = round(time.monotonic() - started, 3)
+        self._fetched_at = time.monotonic()
+        self.last_error = None
+        self.failures = 0
+        print(f"⏩ {self.filename} 변경 없음 ({how} 확인, {self.last_refresh_seconds:.2f}초)", flush=True)
+
+
+def _content_version(sha256_hex):
+    """파일 해시로 만든 데이터 버전. 크롤러가 올린 매니페스트와 비교할 수 있다."""
+    return sha256_hex[:16]
+
+
+def _is_nan(value):
+    return isinstance(value, float) and math.isnan(value)
+
+
+def _scrub(stock):
+    """NaN을 None으로 바꾼 사본. JSON 표준에는 NaN이 없어 브라우저가 파싱하지 못한다."""
+    return {k: (None if _is_nan(v) else v) for k, v in stock.items()}
+
+
+def _margin_key(stock):
+    # None이나 NaN은 아주 작은 값으로 치환해서 맨 뒤로 보낸다
+    m = stock.get('safety_margin')
+    return float('-inf') if m is None or _is_nan(m) else m
+
+
+def _ncav_key(stock):
+    # 크롤러가 저장할 때 쓰는 정렬 기준과 같다
+    return stock.get('ncav_ratio') or float('-inf')
+
 
+def _scrubbed(data):
+    # 스냅샷의 행은 쓸 때 이미 NaN이 None이 되었고, 읽기 전용이라 사본도 필요 없다
+    return data if getattr(data, 'scrubbed', False) else (_scrub(s) for s in data)
 
-_results_cache = RemoteDataCache(RESULTS_FILE)
-_ncav_cache = RemoteDataCache(NCAV_FILE)
+
+class ResultsView:
+    """안전마진 결과의 파생 뷰.
+
+    NaN을 정제한 사본을 안전마진 내림차순으로 한 번만 정렬해 둔다.
+    원본(캐시된 다운로드 결과)은 건드리지 않으므로 요청 처리 중에
+    어떤 엔드포인트도 다른 엔드포인트가 볼 데이터를 바꿀 수 없다.
+    """
+
+    def __init__(self, data, version=''):
+        self.version = version
+        self.ranked = sorted(_scrubbed(data), key=_margin_key, reverse=True)
+        self.by_code = {s['code']: s for s in self.ranked if s.get('code')}
+        self.last_update = _latest_timestamp(self.ranked)
+        self.search_index = SearchIndex(self.ranked)
+
+    def top(self, limit, min_dividend=None, offset=0):
+        """정렬 순서를 유지한 채 offset번째부터 limit개. 필터가 있으면 조건에 맞는 것만."""
+        if min_dividend is None:
+            return self.ranked[offset:offset + max(limit, 0)]
+        picked = []
+        skipped = 0
+        for stock in self.ranked:
+            if len(picked) >= limit:
+                break
+            dy = stock.get('dividend_yield')
+            if isinstance(dy, (int, float)) and dy >= min_dividend:
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                picked.append(stock)
+        return picked
+
+
+class NcavView:
+    """NCAV 결과의 파생 뷰. 값을 못 구한 종목(no_data)은 처음부터 뺀다."""
+
+    def __init__(self, data, version=''):
+        self.version = version
+        # NCAV를 구할 수 없는 종목은 목록에서 제외한다. 보험·은행처럼
+        # 재무상태표에 유동자산 구분이 없는 업종이며, 크롤러가 매 실행
+        # 재조회하지 않도록 마커만 남겨둔 항목이다.
+        rows = (s for s in _scrubbed(data) if not s.get('no_data'))
+        self.ranked = sorted(rows, key=_ncav_key, reverse=True)
+        self.positive = [s for s in self.ranked if s.get('ncav_positive')]
+        self.by_code = {s['code']: s for s in self.ranked if s.get('code')}
+
+
+# 안전마진 결과의 버전별 변경분. /changes가 쓴다.
+_results_changes = ChangeLog(CHANGES_HISTORY)
+
+_results_cache = RemoteDataCache(RESULTS_FILE, derive=ResultsView, on_update=_results_changes.record)
+_ncav_cache = RemoteDataCache(NCAV_FILE, derive=NcavView)
+_caches = (_results_cache, _ncav_cache)
 
 
 def _latest_timestamp(data):
@@ -128,17 +506,535 @@ def _latest_timestamp(data):
 
 
 def get_results_data():
-    """안전마진 결과와 마지막 갱신 시각을 반환."""
-    data = _results_cache.get()
-    return data, _latest_timestamp(data)
+    """안전마진 결과(정렬·정제된 뷰)와 마지막 갱신 시각을 반환."""
+    view = _results_cache.view()
+    return view.ranked, view.last_update
+
+
+def get_results_view():
+    return _results_cache.view()
+
+
+def get_ncav_view():
+    return _ncav_cache.view()
+
+
+# 우선주 이름 꼬리. 삼성전자우, 현대차2우B, CJ4우(전환) 같은 형태다.
+# 숫자는 보통주 이름의 일부일 수도 있으므로 떼지 않은 쪽을 먼저 찾아본다.
+_PREFERRED_SUFFIXES = (re.compile(r'우[A-Z]?(\(전환\))?$'),
+                       re.compile(r'\d우[A-Z]?(\(전환\))?$'))
+
+
+def build_share_class_index(names):
+    """우선주 코드 → 보통주 코드 색인을 만든다.
+
+    종목코드 끝자리가 0이 아니면 우선주 후보다. 이름에서 우선주 꼬리를
+    떼어낸 것과 같은 이름의 보통주를 찾고, 코드 앞 5자리가 같은 쪽을
+    우선한다. 끝자리만 0으로 바꾸는 추측은 신형 우선주 코드(끝자리 K 등)나
+    앞자리가 다른 종목에서 틀리므로, 이름으로 못 찾았을 때 그 코드가 실제로
+    존재하는 경우에만 쓴다.
+
+    :param names: {종목코드: 종목명}
+    :return: {우선주 코드: 보통주 코드}
+    """
+    commons_by_name = {}
+    for code, name in names.items():
+        if code.endswith('0') and name:
+            commons_by_name.setdefault(name, []).append(code)
+
+    index = {}
+    for code, name in names.items():
+        if not code or code.endswith('0'):
+            continue
+        candidates = []
+        for suffix in _PREFERRED_SUFFIXES:
+            base = suffix.sub('', name or '')
+            if base != name and base in commons_by_name:
+                candidates = commons_by_name[base]
+                break
+        common = next((c for c in candidates if c[:5] == code[:5]), None)
+        if common is None and candidates:
+            common = candidates[0]
+        if common is None and code[:-1] + '0' in names:
+            common = code[:-1] + '0'
+        if common is not None:
+            index[code] = common
+    return index
+
+
+class MarketView:
+    """안전마진 결과와 NCAV 결과를 합친 뷰.
+
+    둘 중 어느 캐시든 갱신되면 get_market_view()가 새로 만든다. 엔드포인트는
+    종목마다 사전 조회만 하면 되고, 요청마다 수천 개짜리 dict를 다시
+    만들지 않는다.
+    """
 
+    def __init__(self, results, ncav):
+        self.results = results
+        self.ncav = ncav
+        self.version = f'{results.version}.{ncav.version}'
+
+        names = {s['code']: s.get('name', '') for s in ncav.ranked if s.get('code')}
+        names.update({code: s.get('name', '') for code, s in results.by_code.items()})
+        self.common_of = build_share_class_index(names)
+
+        # 안전마진 종목 → NCAV 비율·시가총액. 우선주는 보통주의 값을 쓴다.
+        self.ncav_ratio = {}
+        self.marcap = {}
+        for code in results.by_code:
+            row = self._lookup(ncav.by_code, code)
+            self.ncav_ratio[code] = row.get('ncav_ratio') if row else None
+            self.marcap[code] = row.get('marcap') if row else None
+
+        # NCAV 종목 → 배당수익률. 행마다 사본을 만들어 두지 않고, 응답에
+        # 나가는 몇십 개에만 with_dividend()로 붙인다.
+        self.dividend_of = {}
+        for s in ncav.ranked:
+            margin = self._lookup(results.by_code, s['code'])
+            self.dividend_of[s['code']] = margin.get('dividend_yield') if margin else None
+        self.ncav_ranked = ncav.ranked
+        self.ncav_positive = ncav.positive
+        self.ncav_positive_count = len(self.ncav_positive)
+
+        self._screen = None
+        self._screen_lock = threading.Lock()
+        self._valuation = None
+
+    def _lookup(self, table, code):
+        row = table.get(code)
+        if row is None and code in self.common_of:
+            row = table.get(self.common_of[code])
+        return row
+
+    def with_ncav(self, stock):
+        """안전마진 행에 NCAV 비율을 붙인 사본."""
+        return dict(stock, ncav_ratio=self.ncav_ratio.get(stock.get('code')))
+
+    def screened(self, stock):
+        """/screen이 내보내는 행. NCAV 비율과 시가총액을 붙인 사본."""
+        code = stock.get('code')
+        return dict(stock, ncav_ratio=self.ncav_ratio.get(code), marcap=self.marcap.get(code))
+
+    def screen_table(self):
+        """/screen용 컬럼 배열. numpy가 필요하므로 처음 쓸 때 만든다."""
+        if self._screen is None:
+            with self._screen_lock:
+                if self._screen is None:
+                    from screen import ScreenTable
+                    rows = self.results.ranked
+                    codes = [s.get('code') for s in rows]
+                    self._screen = ScreenTable(rows, {
+                        'ncav_ratio': [self.ncav_ratio.get(c) for c in codes],
+                        'marcap': [self.marcap.get(c) for c in codes],
+                    })
+        return self._screen
+
+    def valuation_table(self):
+        """/whatif용 원재료 배열. numpy가 필요하므로 처음 쓸 때 만든다."""
+        if self._valuation is None:
+            with self._screen_lock:
+                if self._valuation is None:
+                    from valuation import ValuationTable
+                    self._valuation = ValuationTable(self.results.ranked)
+        return self._valuation
+
+    def with_dividend(self, stock):
+        """NCAV 행에 배당수익률을 붙인 사본."""
+        return dict(stock, dividend_yield=self.dividend_of.get(stock.get('code')))
+
+
+_market = None
+_market_lock = threading.Lock()
+
+
+def get_market_view():
+    """현재 두 캐시의 뷰로 만든 MarketView. 뷰가 바뀌었을 때만 다시 만든다."""
+    global _market
+    results, ncav = get_results_view(), get_ncav_view()
+    market = _market
+    if market is not None and market.results is results and market.ncav is ncav:
+        return market
+    with _market_lock:
+        market = _market
+        if market is None or market.results is not results or market.ncav is not ncav:
+            market = MarketView(results, ncav)
+            _market = market
+        return market
+
+
+# ── 응답 캐시 ──────────────────────────────────────
+# 데이터는 캐시가 갱신될 때만 바뀌는데 클라이언트는 같은 조회(상위 30개
+# 등)를 계속 다시 부른다. (엔드포인트, 정규화한 파라미터, 데이터 버전)을
+# 키로 직렬화한 바이트와 압축본을 보관하고, 버전에서 나온 ETag가 맞으면
+# 본문 없이 304로 답한다.
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '512'))
+# 이보다 작은 응답은 압축해도 헤더 비용에 묻힌다
+COMPRESS_MIN_BYTES = 512
+
+
+class CachedResponse:
+    """직렬화·압축을 마친 JSON 응답 하나."""
+
+    def __init__(self, body: bytes, etag: str):
+        self.body = body
+        self.etag = etag
+        self.gzip = None
+        self.br = None
+        if len(body) >= COMPRESS_MIN_BYTES:
+            self.gzip = gzip.compress(body, compresslevel=6)
+            if brotli is not None:
+                self.br = brotli.compress(body, quality=5)
+
+
+class ResponseCache:
+    """크기 제한이 있는 LRU. 데이터 버전이 키에 들어가므로 옛 버전 항목은
+    따로 지우지 않아도 밀려난다."""
+
+    def __init__(self, size, name):
+        self.name = name
+        self._size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._items[key] = entry
+            self._items.move_to_end(key)
+            while len(self._items) > self._size:
+                self._items.popitem(last=False)
+
+
+_responses = ResponseCache(RESPONSE_CACHE_SIZE, 'json')
 
-def get_ncav_data():
-    """NCAV 스크리닝 결과를 반환."""
-    return _ncav_cache.get()
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """같은 키의 동시 계산을 하나로 합친다.
+
+    장중에는 같은 조회(/filter?limit=30 등)가 같은 순간에 몰린다. 캐시가
+    비어 있을 때 먼저 온 스레드 하나만 계산하고, 그동안 같은 키로 온
+    스레드는 기다렸다가 그 결과(예외면 예외)를 함께 받는다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+_inflight = SingleFlight()
+
+
+def _cached_entry(cache, key, make):
+    """cache에서 key를 꺼낸다. 없으면 make()로 만들어 넣되, 동시에 여럿이
+    없음을 보았어도 한 번만 만든다."""
+    entry = cache.get(key)
+    if entry is not None:
+        RESPONSE_CACHE.inc((cache.name, 'hit'))
+        return entry
+    RESPONSE_CACHE.inc((cache.name, 'miss'))
+
+    def fill():
+        # 앞선 계산이 방금 끝나 캐시에 넣었을 수 있다
+        entry = cache.get(key)
+        if entry is None:
+            entry = make()
+            cache.put(key, entry)
+        return entry
+    return _inflight.do(key, fill)
+
+
+def _encoded(entry):
+    """요청의 Accept-Encoding에 맞는 (본문, Content-Encoding, ETag)."""
+    accepted = request.accept_encodings
+    if entry.br is not None and accepted['br']:
+        return entry.br, 'br', entry.etag + '-br'
+    if entry.gzip is not None and accepted['gzip']:
+        return entry.gzip, 'gzip', entry.etag + '-gz'
+    return entry.body, None, entry.etag
+
+
+def cached_json(endpoint, params, version, build):
+    """build()의 결과를 JSON으로 캐싱해 응답한다.
+
+    :param params: 응답을 결정하는 파라미터를 정규화한 튜플
+    :param version: 응답이 기대는 데이터의 버전
+    :param build: 캐시에 없을 때 응답 객체를 만드는 함수
+    """
+    key = (endpoint, params, version)
+
+    def make():
+        started = time.perf_counter()
+        obj = build()
+        built = time.perf_counter()
+        body = (app.json.dumps(obj) + '\n').encode('utf-8')
+        entry = CachedResponse(body, hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:20])
+        BUILD_SECONDS.observe((endpoint,), built - started)
+        SERIALIZE_SECONDS.observe((endpoint,), time.perf_counter() - built)
+        return entry
+    entry = _cached_entry(_responses, key, make)
+
+    # 압축 방식마다 ETag를 달리 붙이지만(강한 검증자는 표현마다 달라야
+    # 한다), 어느 것이 돌아와도 같은 데이터이므로 모두 일치로 본다.
+    body, encoding, etag = _encoded(entry)
+    if request.method in ('GET', 'HEAD') and any(
+            request.if_none_match.contains(entry.etag + suffix) for suffix in ('', '-gz', '-br')):
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype='application/json')
+        if encoding:
+            resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(etag)
+    resp.headers['Vary'] = 'Accept-Encoding'
+    # 클라이언트가 /changes?since=에 넘길 값
+    resp.headers['X-Data-Version'] = version
+    # 브라우저가 응답을 저장하되 쓸 때마다 ETag로 재검증하게 한다.
+    # 데이터가 그대로면 304라 본문이 오가지 않는다.
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+# ── 페이지 나누기·필드 선택 ──────────────────────────
+# 목록 엔드포인트(/filter, /ncav, /screen)는 cursor 또는 offset으로 이어서
+# 받을 수 있고, fields=code,name,...으로 필요한 키만 받을 수 있다. 커서는
+# 데이터 버전을 담고 있어서, 중간에 데이터가 바뀌면 순위가 밀린 페이지를
+# 조용히 섞어 주는 대신 409로 처음부터 다시 받으라고 알린다.
+class PageError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def encode_cursor(version, offset):
+    raw = json.dumps([version, offset]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def page_params(version):
+    """요청의 (offset, fields). cursor가 있으면 offset보다 우선한다."""
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            cursor_version, offset = json.loads(raw)
+            offset = int(offset)
+        except Exception:
+            raise PageError('잘못된 커서입니다.')
+        if cursor_version != version:
+            raise PageError('데이터가 갱신되어 커서가 만료되었습니다. 처음부터 다시 불러오세요.', 409)
+    else:
+        offset = request.args.get('offset', default=0, type=int)
+    if offset < 0:
+        raise PageError('offset은 0 이상이어야 합니다.')
+    fields = tuple(f for f in request.args.get('fields', '').split(',') if f) or None
+    return offset, fields
+
+
+def next_cursor(version, offset, count, total):
+    """다음 페이지의 커서. 남은 것이 없으면 None."""
+    end = offset + count
+    return encode_cursor(version, end) if count and end < total else None
+
+
+def project(rows, fields):
+    """fields에 있는 키만 남긴 행 목록. fields가 없으면 그대로."""
+    if not fields:
+        return rows
+    return [{f: row.get(f) for f in fields} for row in rows]
+
+
+# ── 데이터 버전 알림 (SSE) ──────────────────────────
+# 워커마다 발행자 스레드 하나가 EVENTS_POLL_INTERVAL마다 뷰의 버전을 보고,
+# 바뀌었으면 Broadcaster에 올린다. 뷰를 꺼내는 것 자체가 만료된 캐시의
+# 백그라운드 갱신을 일으키므로, API 요청이 없어도 새 크롤링을 알아챈다.
+# preload 모드의 워커는 데이터가 고정이라 알릴 일이 없다. 새 데이터는 새
+# 워커가 들고 오고, 옛 워커가 내려가며 스트림을 닫으면(close_event_streams)
+# 브라우저가 새 워커에 다시 붙어 접속 직후의 알림으로 받는다.
+_broadcaster = Broadcaster(EVENTS_MAX_STREAMS)
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def _version_event(market, previous=None):
+    """알림 내용. previous(안전마진 버전) 이후 바뀐 종목 수를 함께 싣는다."""
+    results = market.results
+    delta = _results_changes.since(previous, results.version) if previous else None
+    return {
+        'version': market.version,
+        'price_date': results.last_update,
+        'changed': len(delta[0]) if delta else None,
+        'removed': len(delta[1]) if delta else None,
+    }
+
+
+def start_event_publisher():
+    """발행자 스레드를 (아직 없으면) 띄운다. 첫 /events 요청에서 부른다."""
+    global _publisher
+    if _publisher is not None:
+        return
+    with _publisher_lock:
+        if _publisher is not None:
+            return
+        market = get_market_view()
+        _broadcaster.publish(_version_event(market))
+
+        def loop():
+            published = market
+            while not _broadcaster.closed:
+                time.sleep(EVENTS_POLL_INTERVAL)
+                try:
+                    current = get_market_view()
+                    if current.version != published.version:
+                        _broadcaster.publish(_version_event(current, published.results.version))
+                        print(f"📣 새 데이터 버전 알림 {current.version}", flush=True)
+                        published = current
+                except Exception as e:
+                    print(f"❗ 버전 알림 오류: {e}", flush=True)
+
+        _publisher = threading.Thread(target=loop, name='event-publisher', daemon=True)
+        _publisher.start()
+
+
+def close_event_streams():
+    """열린 /events 스트림을 모두 끝낸다. 워커가 내려갈 때 gunicorn 설정이 부른다."""
+    _broadcaster.close()
+
+
+# ── 워커 간 공유 스냅샷 (gunicorn preload) ─────────────
+# preload_app으로 띄우면 마스터가 fork 전에 데이터를 받아 뷰까지 만들어 둔다.
+# 워커는 그 메모리를 copy-on-write로 공유하므로 워커마다 다운로드·파싱하지
+# 않고, 첫 요청도 Supabase를 기다리지 않는다. 데이터가 바뀌면 마스터가 받아
+# 스스로에게 SIGHUP을 보낸다. gunicorn은 preload 상태에서 앱을 다시
+# 임포트하지 않고 새 워커를 마스터에서 fork한 뒤 옛 워커를 정리하므로,
+# 새 워커는 새 스냅샷을 물려받는다. 설정은 gunicorn.conf.py에 있다.
+_snapshot_master = False
+
+
+def _freeze():
+    # 지금 있는 객체를 GC 추적 대상에서 뺀다. 워커의 GC가 이 객체들의
+    # 헤더를 건드리지 않아야 공유 페이지가 복사되지 않는다.
+    # 리프레셔가 다시 부를 때는 먼저 풀어 준다. 얼린 객체는 수거되지 않으므로
+    # 그대로 두면 이전 버전의 데이터가 마스터에 계속 쌓인다.
+    gc.unfreeze()
+    gc.collect()
+    gc.freeze()
+
+
+def _warm_views():
+    """워커가 첫 요청에서 만들 것들을 마스터에서 미리 만든다."""
+    market = get_market_view()
+    market.screen_table()
+    market.valuation_table()
+
+
+def preload_snapshot():
+    """gunicorn 마스터가 워커를 띄우기 전에 부른다."""
+    global _snapshot_master
+    _snapshot_master = True
+    started = time.monotonic()
+    for cache in _caches:
+        cache.refresh_now()
+    _warm_views()
+    _freeze()
+    print(f"📦 스냅샷 준비 완료 ({time.monotonic() - started:.2f}초, "
+          f"버전 {get_market_view().version})", flush=True)
+
+
+def start_snapshot_refresher(interval=None):
+    """마스터에서 주기적으로 갱신을 확인하고, 바뀌면 워커를 교체한다."""
+    interval = interval or CACHE_TTL
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                # 매니페스트 확인으로 끝나는 경우가 대부분이라 가볍다
+                changed = [cache.refresh_now() for cache in _caches]
+                if not any(changed):
+                    continue
+                _warm_views()
+                _freeze()
+                print(f"📦 새 스냅샷 {get_market_view().version} → 워커 교체", flush=True)
+                os.kill(os.getpid(), signal.SIGHUP)
+            except Exception as e:
+                print(f"❗ 스냅샷 갱신 오류: {e}", flush=True)
+
+    threading.Thread(target=loop, name='snapshot-refresher', daemon=True).start()
+
+
+def _after_fork_in_child():
+    global _market_lock, _publisher, _publisher_lock, _inflight, _metrics_flusher
+    for cache in _caches:
+        cache._after_fork(pinned=_snapshot_master)
+    _market_lock = threading.Lock()
+    if _market is not None:
+        _market._screen_lock = threading.Lock()
+        if _market._screen is not None:
+            _market._screen._lock = threading.Lock()
+    _responses._lock = threading.Lock()
+    _pages._lock = threading.Lock()
+    _inflight = SingleFlight()
+    metrics.reset_after_fork()
+    _metrics_flusher = None
+    _results_changes._lock = threading.Lock()
+    _broadcaster.reset_after_fork()
+    _publisher = None
+    _publisher_lock = threading.Lock()
+
+
+# 마스터에서 갱신 스레드가 도는 중에 fork될 수 있다. 자식에는 fork한
+# 스레드만 남으므로 그 순간 잡혀 있던 락을 새로 만든다. (Windows에는 fork가 없다)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class _JSONProvider(DefaultJSONProvider):
+    """스냅샷의 행(읽기 전용 Mapping)도 dict처럼 직렬화한다."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Mapping):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
 
 
 app = Flask(__name__)
+app.json = _JSONProvider(app)
 
 # 검색엔진에 노출되는 절대 URL의 기준. 호스팅을 옮기거나 커스텀 도메인을
 # 붙일 때 환경변수만 바꾸면 canonical·og:url·sitemap이 모두 따라온다.
@@ -147,44 +1043,181 @@ SITE_URL = os.getenv('SITE_URL', 'https://intrinsic-value-calculator.onrender.co
 
 @app.context_processor
 def inject_site_url():
-    return {'site_url': SITE_URL}
+    return {'site_url': SITE_URL, 'events_enabled': EVENTS_ENABLED, 'events_poll_ms': EVENTS_FALLBACK_POLL * 1000}
+
+
+# ── 지표 수집 ──────────────────────────────────────
+_metrics_flusher = None
+
+
+def _start_metrics_flusher():
+    """METRICS_DIR에 이 워커의 값을 주기적으로 쓰는 스레드를 (한 번) 띄운다."""
+    global _metrics_flusher
+    _metrics_flusher = threading.Thread(target=_flush_metrics_forever, name='metrics-flusher', daemon=True)
+    _metrics_flusher.start()
+
+
+def _flush_metrics_forever():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            metrics.write_worker_snapshot(METRICS_DIR, str(os.getpid()))
+        except Exception as e:
+            print(f"⚠️ 지표 기록 실패: {e}", flush=True)
+
+
+def remove_worker_metrics():
+    """워커가 내려갈 때 METRICS_DIR의 자기 파일을 지운다. gunicorn 설정이 부른다."""
+    if METRICS_DIR:
+        metrics.remove_worker_snapshot(METRICS_DIR, str(os.getpid()))
+
+
+@metrics.on_collect
+def _collect_data_gauges():
+    DATA_VERSION.clear()
+    for cache in _caches:
+        status = cache.status()
+        if status['loaded']:
+            DATA_VERSION.set((cache.filename, status['version']), 1)
+            DATA_AGE.set((cache.filename,), status['age_seconds'])
+        REFRESH_FAILURES.set((cache.filename,), status['failures'])
+
+
+@app.before_request
+def _start_request_timer():
+    if METRICS_DIR and _metrics_flusher is None:
+        _start_metrics_flusher()
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(resp):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # 라우트 규칙(/filter 등)으로 묶는다. 실제 경로를 쓰면 라벨이 무한히 늘어난다
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe((route,), time.perf_counter() - started)
+        REQUESTS.inc((route, request.method, str(resp.status_code)))
+        if resp.content_length is not None:
+            RESPONSE_BYTES.observe((route,), resp.content_length)
+    return resp
+
+
+def _profile_wanted():
+    if PROFILE_TOKEN and request.headers.get('X-Profile-Token') == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+@app.before_request
+def _start_profile():
+    if (PROFILE_SAMPLE_RATE > 0 or PROFILE_TOKEN) and _profile_wanted():
+        g.profiler = profiling.start_request()
+
+
+@app.after_request
+def _finish_profile(resp):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        try:
+            name = profiling.finish_request(profiler, PROFILE_DIR, route, PROFILE_KEEP)
+            resp.headers['X-Profile'] = name
+        except OSError as e:
+            print(f"⚠️ 프로파일 저장 실패: {e}", flush=True)
+    return resp
+
+
+@app.teardown_request
+def _drop_profile(exc):
+    # after_request까지 가지 못한 요청. 켜 둔 채로 두면 이 스레드의 다음 요청이 모두 느려진다
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 텍스트 형식 지표. 모든 시계열에 worker(pid) 라벨이 붙는다."""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return Response(status=401)
+    worker = str(os.getpid())
+    snap = metrics.snapshot()
+    snaps = {worker: snap}
+    if METRICS_DIR:
+        metrics.write_worker_snapshot(METRICS_DIR, worker, snap)
+        # 몇 번의 주기 동안 갱신되지 않은 파일은 죽은 워커의 것이다
+        snaps = metrics.read_worker_snapshots(METRICS_DIR, max_age=METRICS_FLUSH_SECONDS * 4)
+        snaps[worker] = snap
+    resp = Response(metrics.render(snaps), mimetype='text/plain')
+    resp.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return resp
+
+# 격언 데이터. 배포 후에는 바뀌지 않으므로 처음 한 번만 읽는다.
+_quotes = None
+_NO_QUOTE = {
+    'quote': '격언을 불러올 수 없습니다.',
+    'author': '',
+    'source': '',
+    'original': ''
+}
+
 
-# 격언 데이터 로드
 def load_quotes():
-    try:
-        with open('investment_quotes.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data['quotes']
-    except Exception as e:
-        print(f"격언 데이터 로드 중 오류 발생: {e}")
-        return []
+    global _quotes
+    if _quotes is None:
+        try:
+            with open('investment_quotes.json', 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                _quotes = data['quotes']
+        except Exception as e:
+            print(f"격언 데이터 로드 중 오류 발생: {e}")
+            _quotes = []
+    return _quotes
+
+
+def pick_quote():
+    """(격언 번호, 격언). 격언이 없으면 번호는 None."""
+    quotes = load_quotes()
+    if not quotes:
+        return None, _NO_QUOTE
+    i = random.randrange(len(quotes))
+    return i, quotes[i]
+
+
+# 렌더링한 페이지. 페이지는 (화면, 격언, 데이터 버전)으로 정해지고 격언이
+# 몇 개뿐이라 조합이 적다. JSON 응답과 LRU를 나눠 써서 서로 밀어내지 않게 한다.
+_pages = ResponseCache(64, 'page')
+
+
+def cached_page(key, render):
+    """render()로 만든 HTML을 key별로 캐싱해 응답한다."""
+    def make():
+        body = render().encode('utf-8')
+        return CachedResponse(body, hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:20])
+    entry = _cached_entry(_pages, key, make)
+    # 격언이 무작위라 같은 주소도 매번 다른 본문이다. 재검증(ETag)은 붙이지 않는다.
+    body, encoding, _ = _encoded(entry)
+    resp = Response(body, mimetype='text/html')
+    if encoding:
+        resp.headers['Content-Encoding'] = encoding
+    resp.headers['Vary'] = 'Accept-Encoding'
+    return resp
+
 
 @app.route('/')
 def index():
-    quotes = load_quotes()
-    quote = random.choice(quotes) if quotes else {
-        'quote': '격언을 불러올 수 없습니다.',
-        'author': '',
-        'source': '',
-        'original': ''
-    }
-    return render_template('index.html', quote=quote)
+    i, quote = pick_quote()
+    return cached_page(('index', i), lambda: render_template('index.html', quote=quote))
 
 @app.route('/top-stocks')
 def top_stocks():
     try:
-        _, last_update = get_results_data()
-        
-        # 격언 데이터 로드
-        quotes = load_quotes()
-        quote = random.choice(quotes) if quotes else {
-            'quote': '격언을 불러올 수 없습니다.',
-            'author': '',
-            'source': '',
-            'original': ''
-        }
-        
-        return render_template('top-stocks.html', last_update=last_update, quote=quote)
+        # last_update는 뷰가 데이터 버전마다 한 번 계산해 둔다
+        view = get_results_view()
+        i, quote = pick_quote()
+        return cached_page(('top-stocks', i, view.version),
+                           lambda: render_template('top-stocks.html', last_update=view.last_update, quote=quote))
     except Exception as e:
         return render_template('top-stocks.html', error=str(e))
 
@@ -195,77 +1228,184 @@ def search():
         return jsonify([])
     
     try:
-        data, last_update = get_results_data()
-
-        # 종목명으로 검색
-        results = [stock for stock in data if query.lower() in stock['name'].lower()]
-        return jsonify({
-            'stocks': results[:20],  # 최대 30개 결과 반환
-            'last_update': last_update
-        })
+        view = get_results_view()
+
+        # 종목명·초성·종목코드로 검색. 완전 일치 > 앞부분 일치 > 중간 일치 순
+        def build():
+            return {
+                'stocks': view.search_index.search(query, limit=20),  # 최대 20개 결과 반환
+                'last_update': view.last_update
+            }
+        return cached_json('search', (normalize_query(query),), view.version, build)
     except Exception as e:
         return jsonify({'error': str(e)})
 
 @app.route('/filter')
 def filter_stocks():
     try:
-        data, _ = get_results_data()
-        stocks = list(data)  # 캐시 원본 보호를 위해 복사
-        
-        # 안전마진 기준으로 정렬 (None이나 NaN은 맨 뒤로)
-        stocks.sort(key=lambda x: float('-inf') if x.get('safety_margin') is None or math.isnan(x.get('safety_margin', float('-inf'))) else x.get('safety_margin', float('-inf')), reverse=True)
-        # print("안전마진 기준으로 정렬 완료")
-        
-        # 배당수익률 필터링
+        # 뷰는 이미 안전마진 내림차순(None·NaN은 맨 뒤)으로 정렬되어 있고
+        # NaN도 null로 정제되어 있다. 요청마다 하는 일은 앞에서 limit개를
+        # 고르는 것뿐이다.
+        market = get_market_view()
         dividend_filter = request.args.get('dividend', type=float)
-        if dividend_filter is not None:
-            # print(f"배당수익률 {dividend_filter}% 이상 필터링 시작")
-            filtered_stocks = []
-            for stock in stocks:
-                try:
-                    dividend_yield = stock.get('dividend_yield')
-                    if dividend_yield is not None and not math.isnan(dividend_yield) and dividend_yield >= dividend_filter:
-                        filtered_stocks.append(stock)
-                except (TypeError, ValueError):
-                    continue
-            stocks = filtered_stocks
-            #print(f"배당수익률 필터링 후 {len(stocks)}개 종목 남음")
-        
-        # 상위 N개 종목 반환
         limit = request.args.get('limit', default=30, type=int)
-        # print(f"상위 {limit}개 종목 선택")
-        # 실제 결과 개수와 요청된 limit 중 작은 값 사용
-        actual_limit = min(limit, len(stocks))
-        
-        # NaN 값을 null로 변환
-        for stock in stocks:
-            for key, value in stock.items():
-                if isinstance(value, float) and math.isnan(value):
-                    stock[key] = None
-
-        result_stocks = stocks[:actual_limit]
-
-        # NCAV 데이터 합치기 (우선주는 보통주 NCAV 매핑)
-        ncav_data = get_ncav_data()
-        if ncav_data:
-            ncav_dict = {s['code']: s for s in ncav_data}
-            for stock in result_stocks:
-                code = stock.get('code', '')
-                ncav = ncav_dict.get(code)
-                if not ncav and code[-1] != '0':
-                    # 우선주 → 보통주 코드(끝자리 0)로 매핑
-                    ncav = ncav_dict.get(code[:-1] + '0')
-                stock['ncav_ratio'] = ncav.get('ncav_ratio') if ncav else None
-
-        result = {
-            'stocks': result_stocks,
-            'actual_limit': len(result_stocks)
-        }
-        return jsonify(result)
+        offset, fields = page_params(market.version)
+
+        def build():
+            # 다음 페이지가 있는지 알기 위해 하나 더 고른다
+            picked = market.results.top(limit + 1, min_dividend=dividend_filter, offset=offset)
+            more = len(picked) > limit
+            # NCAV 비율 합치기 (우선주는 보통주 NCAV). 조인은 뷰를 만들 때 끝나
+            # 있고, 뷰의 행은 여러 요청이 공유하므로 붙인 사본을 내보낸다.
+            result_stocks = [market.with_ncav(stock) for stock in picked[:max(limit, 0)]]
+            return {
+                'stocks': project(result_stocks, fields),
+                'actual_limit': len(result_stocks),
+                'next_cursor': encode_cursor(market.version, offset + len(result_stocks)) if more else None,
+            }
+        return cached_json('filter', (limit, dividend_filter, offset, fields), market.version, build)
+    except PageError as e:
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         print(f"필터링 중 오류 발생: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# /screen에 limit이 없을 때 돌려줄 종목 수
+SCREEN_DEFAULT_LIMIT = 50
+
+
+@app.route('/screen')
+def screen_stocks():
+    """다조건 스크리닝.
+
+    min_<필드>·max_<필드>로 범위를 걸고(경계 포함, 여러 개면 모두 만족),
+    sort=<필드>&order=asc|desc로 정렬하고, fields=code,name,...으로 내보낼
+    키를 고른다. 필드는 screen.FIELDS의 이름이다 (price는 current_price).
+    """
+    try:
+        market = get_market_view()
+        from screen import FIELDS
+
+        ranges = {}
+        for arg in request.args:
+            prefix, _, field = arg.partition('_')
+            if prefix not in ('min', 'max') or not field:
+                continue
+            if field not in FIELDS:
+                return jsonify({'error': f'알 수 없는 필드: {field}', 'fields': sorted(FIELDS)}), 400
+            value = request.args.get(arg, type=float)
+            if value is None or math.isnan(value):
+                return jsonify({'error': f'{arg} 값이 숫자가 아닙니다.'}), 400
+            low, high = ranges.get(field, (None, None))
+            ranges[field] = (value, high) if prefix == 'min' else (low, value)
+        ranges = tuple(sorted((field, low, high) for field, (low, high) in ranges.items()))
+
+        sort = request.args.get('sort') or None
+        if sort is not None and sort not in FIELDS:
+            return jsonify({'error': f'알 수 없는 정렬 필드: {sort}', 'fields': sorted(FIELDS)}), 400
+        descending = request.args.get('order', 'desc').lower() != 'asc'
+        limit = max(request.args.get('limit', default=SCREEN_DEFAULT_LIMIT, type=int), 0)
+        offset, fields = page_params(market.version)
+
+        def build():
+            table = market.screen_table()
+            picked = table.screen(ranges, sort, descending)
+            stocks = [market.screened(table.rows[i]) for i in picked[offset:offset + limit]]
+            return {
+                'stocks': project(stocks, fields),
+                'total': len(picked),
+                'next_cursor': next_cursor(market.version, offset, len(stocks), len(picked)),
+            }
+        return cached_json('screen', (ranges, sort, descending, limit, offset, fields), market.version, build)
+    except PageError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        print(f"스크리닝 중 오류: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# /whatif에 limit이 없을 때 돌려줄 종목 수와 최대치
+WHATIF_DEFAULT_LIMIT = 30
+WHATIF_MAX_LIMIT = 200
+
+
+def _whatif_float(name, default, low, high):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return float(default)
+    try:
+        value = float(value)
+    except ValueError:
+        raise PageError(f'{name} 값이 숫자가 아닙니다.')
+    if not (low <= value <= high):
+        raise PageError(f'{name}은 {low:g} 이상 {high:g} 이하여야 합니다.')
+    return value
+
+
+def whatif_params():
+    """요청의 공식 파라미터를 valuation.intrinsic_values 인자로 정규화한다."""
+    from valuation import EPS_WEIGHTS, EPS_MULTIPLE, BPS_WEIGHT
+
+    raw = request.args.get('eps_weights')
+    if raw:
+        try:
+            weights = tuple(float(w) for w in raw.split(','))
+        except ValueError:
+            raise PageError('eps_weights는 숫자 세 개여야 합니다. (3년전,2년전,직전년도)')
+        if len(weights) != 3 or any(not (0 <= w <= 100) for w in weights) or sum(weights) <= 0:
+            raise PageError('eps_weights는 0~100 사이 숫자 세 개이고 합이 0보다 커야 합니다. (3년전,2년전,직전년도)')
+    else:
+        weights = tuple(float(w) for w in EPS_WEIGHTS)
+    return {
+        'eps_weights': weights,
+        'eps_multiple': _whatif_float('eps_multiple', EPS_MULTIPLE, 0, 100),
+        'bps_weight': _whatif_float('bps_weight', BPS_WEIGHT, 0, 1),
+        'treasury_adjust': request.args.get('treasury', '1').strip().lower() not in ('0', 'false', 'no'),
+    }
+
+
+@app.route('/whatif')
+def whatif_stocks():
+    """내재가치 공식을 바꿔 본 안전마진 순위.
+
+    eps_weights=1,2,3(3년전·2년전·직전년도 EPS 가중치), eps_multiple=10,
+    bps_weight=0.5(내재가치에서 BPS의 비중), treasury=1(자사주 조정)이
+    지금 공식이다. 저장된 연도별 EPS·BPS로 전 종목을 다시 계산해 상위
+    limit개를 돌려준다. 원재료가 아직 저장되지 않은 종목은 순위에서 빠지고,
+    몇 종목이 계산됐는지는 coverage로 알린다.
+    """
+    try:
+        market = get_market_view()
+        params = whatif_params()
+        limit = min(max(request.args.get('limit', default=WHATIF_DEFAULT_LIMIT, type=int), 0), WHATIF_MAX_LIMIT)
+        offset, fields = page_params(market.version)
+
+        def build():
+            table = market.valuation_table()
+            picked, values, margins, total = table.top(offset + limit, **params)
+            stocks = []
+            for i, value, margin in zip(picked[offset:].tolist(), values[offset:].tolist(), margins[offset:].tolist()):
+                stock = market.with_ncav(table.rows[i])
+                # 저장된 값은 지금 공식의 결과다. 비교할 수 있게 남겨 둔다
+                stock['base_intrinsic_value'] = stock.get('intrinsic_value')
+                stock['base_safety_margin'] = stock.get('safety_margin')
+                stock['intrinsic_value'] = value
+                stock['safety_margin'] = margin
+                stocks.append(stock)
+            return {
+                'stocks': project(stocks, fields),
+                'total': total,
+                'coverage': {'valued': table.covered, 'stocks': len(table.rows)},
+                'params': dict(params, eps_weights=list(params['eps_weights'])),
+                'next_cursor': next_cursor(market.version, offset, len(stocks), total),
+            }
+        key = tuple(sorted(params.items()))
+        return cached_json('whatif', (key, limit, offset, fields), market.version, build)
+    except PageError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        print(f"what-if 계산 중 오류: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/watchlist/add', methods=['POST'])
 def add_to_watchlist():
     try:
@@ -283,14 +1423,13 @@ def add_to_watchlist():
         # print(f"Processing stock: {code}, price: {purchase_price}, quantity: {purchase_quantity}")  # 디버깅 로그 추가
 
         # Read stock information from cache
-        data, _ = get_results_data()
-        stock = next((s for s in data if s['code'] == code), None)
+        stock = get_results_view().by_code.get(code)
         if not stock:
             return jsonify({'error': 'Stock not found'}), 404
 
         # Add purchase price and quantity to stock data
-        stock['purchase_price'] = purchase_price
-        stock['purchase_quantity'] = purchase_quantity
+        # 캐시의 행을 고치면 다른 사용자의 응답에 매수가가 섞여 나간다
+        stock = dict(stock, purchase_price=purchase_price, purchase_quantity=purchase_quantity)
         
         # print("Returning stock data:", stock)  # 디버깅 로그 추가
         return jsonify(stock)
@@ -312,79 +1451,129 @@ def remove_from_watchlist():
         print(f"관심종목 제거 중 오류: {str(e)}")  # 서버 로그에 오류 출력
         return jsonify({'error': str(e)}), 500
 
+# ── 내보내기 ─────────────────────────────────────
+# 만든 파일을 (조회 조건, 데이터 버전)별로 두는 곳. 서버리스에서는 /tmp만
+# 쓸 수 있으므로 기본값도 그 아래다.
+EXPORT_DIR = os.getenv('EXPORT_DIR') or os.path.join(tempfile.gettempdir(), 'ivc-export')
+_exports = None
+
+
+def _export_cache():
+    global _exports
+    if _exports is None:
+        from export import ExportCache
+        _exports = ExportCache(EXPORT_DIR)
+    return _exports
+
+
+def _send_export(key, fmt, filename, sheet_name, columns, rows):
+    """rows를 fmt 파일로 만들어(캐시에 있으면 그대로) 첨부로 보낸다."""
+    from export import MIMETYPES, write_csv, write_xlsx
+
+    def write(path):
+        if fmt == 'csv':
+            write_csv(path, columns, rows)
+        else:
+            write_xlsx(path, sheet_name, columns, rows)
+
+    f = _export_cache().open(key, fmt, write)
+    return send_file(f, mimetype=MIMETYPES[fmt], as_attachment=True,
+                     download_name=f'{filename}.{fmt}',
+                     last_modified=os.fstat(f.fileno()).st_mtime)
+
+
+@app.route('/export')
+def export_stocks():
+    """조회 결과를 엑셀(xlsx) 또는 CSV로 내보낸다.
+
+    클라이언트가 받은 목록을 되돌려 보내는 대신 /filter·/ncav와 같은
+    파라미터를 받아 서버의 뷰에서 행을 꺼낸다.
+
+    - source=filter: limit, dividend (안전마진 순위)
+    - source=ncav: limit, positive, dividend (NCAV 순위)
+    - source=watchlist: codes=000660,005930 (주어진 순서대로)
+    - format=xlsx(기본)|csv. limit을 생략하면 전 종목이다.
+    """
+    from export import MARGIN_COLUMNS, NCAV_COLUMNS
+
+    try:
+        source = request.args.get('source', 'filter')
+        fmt = request.args.get('format', 'xlsx').lower()
+        if fmt not in ('xlsx', 'csv'):
+            return jsonify({'error': f'지원하지 않는 형식: {fmt}'}), 400
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit < 0:
+            return jsonify({'error': 'limit은 0 이상이어야 합니다.'}), 400
+        dividend_filter = request.args.get('dividend', type=float)
+        # dividend=0도 걸러 낸 결과다. 0은 거짓이므로 None과 비교한다
+        dividend_suffix = f'_배당수익률{dividend_filter:g}%이상' if dividend_filter is not None else ''
+        size = f'상위{limit}종목' if limit is not None else '전체종목'
+
+        market = get_market_view()
+        if source == 'filter':
+            ranked = market.results.ranked
+            rows = market.results.top(len(ranked) if limit is None else limit, min_dividend=dividend_filter)
+            params = (limit, dividend_filter)
+            filename, sheet_name, columns = f'안전마진_{size}{dividend_suffix}', '안전마진 상위종목', MARGIN_COLUMNS
+        elif source == 'ncav':
+            only_positive = request.args.get('positive', 'false').lower() == 'true'
+            data = ncav_selection(market, only_positive, dividend_filter)
+            rows = [market.with_dividend(s) for s in data[:limit]]
+            params = (only_positive, limit, dividend_filter)
+            filename, sheet_name, columns = f'NCAV_{size}{dividend_suffix}', 'NCAV 상위종목', NCAV_COLUMNS
+        elif source == 'watchlist':
+            codes = tuple(c for c in request.args.get('codes', '').split(',') if c)
+            by_code = market.results.by_code
+            rows = [by_code[c] for c in codes if c in by_code]
+            params = codes
+            filename, sheet_name, columns = '관심종목', '관심종목', MARGIN_COLUMNS
+        else:
+            return jsonify({'error': f'알 수 없는 source: {source}'}), 400
+
+        if not rows:
+            return jsonify({'error': '내보낼 데이터가 없습니다.'}), 400
+        return _send_export((source, params, market.version), fmt, filename, sheet_name, columns, rows)
+    except Exception as e:
+        print(f"내보내기 중 오류: {str(e)}")
+        return jsonify({'error': f'내보내기 중 오류가 발생했습니다: {str(e)}'}), 500
+
+
 @app.route('/watchlist/export', methods=['POST'])
 def export_watchlist():
-    # pandas는 이 엔드포인트에서만 쓰인다. 최상단에서 임포트하면 모든 요청이
-    # 그 비용을 치르는데, 서버리스에서는 콜드 스타트마다 1초 안팎이 붙는다.
-    # 엑셀 내보내기는 드물게 쓰이므로 필요할 때만 로드한다.
-    import pandas as pd
+    """예전 클라이언트용. 보내온 목록의 종목코드로 서버 데이터를 내보낸다.
+
+    새 화면은 GET /export를 쓴다. 서비스 워커가 옛 스크립트를 들고 있는
+    브라우저를 위해 남겨 둔다.
+    """
+    from export import MARGIN_COLUMNS
 
     try:
         data = request.get_json()
         if not data:
             return jsonify({'error': '데이터가 필요합니다.'}), 400
 
-        # 필터링된 종목 내보내기
-        # print(data)
-        stocks = data['stocks']
-        sheet_name = '안전마진 상위종목'
+        stocks = data.get('stocks') or []
+        if not stocks:
+            return jsonify({'error': '내보낼 데이터가 없습니다.'}), 400
+
         limit = data.get('limit', 30)
-        dividend_filter = data.get('dividend_filter')
+        # 옛 클라이언트는 숫자나 문자열로 보낸다. 0도 조건이므로 None과 비교한다
+        try:
+            dividend_filter = data.get('dividend_filter')
+            dividend_filter = None if dividend_filter in (None, '') else float(dividend_filter)
+        except (TypeError, ValueError):
+            dividend_filter = None
         filename = f'안전마진_상위{limit}종목'
-        if dividend_filter:
-            filename += f'_배당수익률{dividend_filter}%이상'
-        filename += '.xlsx'
+        if dividend_filter is not None:
+            filename += f'_배당수익률{dividend_filter:g}%이상'
 
-        if not stocks or len(stocks) == 0:
+        view = get_results_view()
+        codes = tuple(s.get('code') for s in stocks if s.get('code'))
+        rows = [view.by_code[c] for c in codes if c in view.by_code]
+        if not rows:
             return jsonify({'error': '내보낼 데이터가 없습니다.'}), 400
-        
-        # DataFrame 생성
-        df = pd.DataFrame(stocks)
-        
-        # 필요한 컬럼만 선택
-        columns = ['code', 'name', 'current_price', 'intrinsic_value', 'safety_margin', 'treasury_ratio', 'dividend_yield', 'last_updated']
-        df = df[columns]
-        df.columns = ['종목코드', '종목명', '현재가', '내재가치', '안전마진', '자사주비율', '배당수익률', '마지막 업데이트']
-        
-        # 마지막 업데이트 시간을 한국 시간으로 변환
-        df['마지막 업데이트'] = pd.to_datetime(df['마지막 업데이트']).dt.strftime('%Y-%m-%d %H:%M:%S')
-        
-        # 숫자 포맷팅 적용
-        numeric_columns = ['현재가', '내재가치']
-        for col in numeric_columns:
-            if col in df.columns:
-                df[col] = df[col].apply(lambda x: f"{x:,.0f}")
-        
-        # 소수점이 필요한 컬럼 포맷팅
-        decimal_columns = ['안전마진', '자사주비율', '배당수익률']
-        for col in decimal_columns:
-            if col in df.columns:
-                df[col] = df[col].apply(lambda x: f"{x:.2f}")
-        
-        # 엑셀 파일 생성
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, index=False, sheet_name=sheet_name)
-            
-            # 워크시트 가져오기
-            worksheet = writer.sheets[sheet_name]
-            
-            # 컬럼 너비 자동 조정
-            for idx, col in enumerate(df.columns):
-                max_length = max(
-                    df[col].astype(str).apply(len).max(),
-                    len(col)
-                )
-                worksheet.set_column(idx, idx, max_length + 2)
-        
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return _send_export(('watchlist', codes, view.version), 'xlsx', filename,
+                            '안전마진 상위종목', MARGIN_COLUMNS, rows)
     except Exception as e:
         print(f"엑셀 내보내기 중 오류: {str(e)}")
         return jsonify({'error': f'엑셀 내보내기 중 오류가 발생했습니다: {str(e)}'}), 500
@@ -400,74 +1589,147 @@ def get_watchlist_data():
             # print("Watchlist is empty")
             return jsonify([])
             
-        # 캐시에서 읽고 dict로 변환하여 빠른 조회
-        all_stocks, _ = get_results_data()
-        stock_dict = {s['code']: s for s in all_stocks}
-
-        stocks = []
-        for item in watchlist:
-            stock = stock_dict.get(item['code'])
-            if stock:
-                stock_data = {
-                    'code': stock['code'],
-                    'name': stock['name'],
-                    'current_price': stock['current_price'],
-                    'intrinsic_value': stock['intrinsic_value'],
-                    'safety_margin': stock['safety_margin'],
-                    'treasury_ratio': stock.get('treasury_ratio', None),
-                    'dividend_yield': stock.get('dividend_yield', None),
-                    'last_update': stock.get('last_updated', None),
-                    # 카드의 "마지막 업데이트"는 주가를 받아온 시각 기준이다.
-                    # last_update(재무지표 시각)를 쓰면 최대 7일까지 오래된
-                    # 값이 표시된다.
-                    'price_updated': stock.get('price_updated', None),
-                    'price_date': stock.get('price_date', None)
-                }
-                stocks.append(stock_data)
-                
-        # print(f"Returning {len(stocks)} stocks")
-        return jsonify(stocks)
+        # 뷰가 종목코드 색인을 들고 있으므로 조회는 O(1)이다
+        view = get_results_view()
+        codes = tuple(item['code'] for item in watchlist)
+
+        def build():
+            stocks = []
+            for code in codes:
+                stock = view.by_code.get(code)
+                if stock:
+                    stock_data = {
+                        'code': stock['code'],
+                        'name': stock['name'],
+                        'current_price': stock['current_price'],
+                        'intrinsic_value': stock['intrinsic_value'],
+                        'safety_margin': stock['safety_margin'],
+                        'treasury_ratio': stock.get('treasury_ratio', None),
+                        'dividend_yield': stock.get('dividend_yield', None),
+                        'last_update': stock.get('last_updated', None),
+                        # 카드의 "마지막 업데이트"는 주가를 받아온 시각 기준이다.
+                        # last_update(재무지표 시각)를 쓰면 최대 7일까지 오래된
+                        # 값이 표시된다.
+                        'price_updated': stock.get('price_updated', None),
+                        'price_date': stock.get('price_date', None)
+                    }
+                    stocks.append(stock_data)
+            return stocks
+        return cached_json('watchlist', codes, view.version, build)
     except Exception as e:
         print(f"Error in get_watchlist_data: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/events')
+def events():
+    """새 데이터 버전을 알리는 SSE 스트림.
+
+    이벤트(version)의 data는 {version, price_date, changed, removed}다.
+    version은 /changes?since=에 넘길 수 있고, changed·removed는 직전 알림
+    이후 바뀐·빠진 종목 수다 (모르면 null).
+    """
+    if not EVENTS_ENABLED:
+        return Response(status=204)
+    start_event_publisher()
+    body = open_event_stream(_broadcaster, request.headers.get('Last-Event-ID'),
+                             EVENTS_HEARTBEAT, EVENTS_RETRY_MS)
+    if body is None:
+        # 이 워커의 스트림 자리가 다 찼다. 스트림이 API 스레드를 다 차지하지
+        # 않도록 받지 않는다. 알림은 편의 기능이라 늦게 붙어도 된다.
+        resp = Response(status=204)
+        resp.headers['Retry-After'] = str(EVENTS_FULL_RETRY_SECONDS)
+        return resp
+    resp = Response(body, mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    # nginx 등 앞단 프록시가 스트림을 버퍼링하지 않게 한다
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+
+@app.route('/events/latest')
+def events_latest():
+    """/events가 마지막으로 알린 것과 같은 {version, price_date}.
+
+    스트림을 열지 못한(자리가 찼거나 끊긴) 페이지가 주기적으로 부른다.
+    데이터 버전마다 캐시되고 ETag가 붙으므로 대부분 304로 끝난다.
+    """
+    try:
+        market = get_market_view()
+        return cached_json('events-latest', (), market.version, lambda: _version_event(market))
+    except Exception as e:
+        print(f"최신 버전 조회 중 오류: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/changes')
+def changes():
+    """since 버전 이후 바뀐 안전마진 종목과 필드만 반환.
+
+    since는 이전 응답의 X-Data-Version이다. /filter처럼 두 데이터의 버전을
+    이은 값('안전마진.NCAV')이면 앞부분만 본다. codes=000660,005930을 주면
+    그 종목만 담는다. 이 서버가 모르는(너무 오래된) 버전이면 resync가
+    true이고, 클라이언트는 전체를 다시 받아야 한다.
+    """
+    try:
+        since = request.args.get('since', '').split('.')[0]
+        codes = tuple(c for c in request.args.get('codes', '').split(',') if c) or None
+        view = get_results_view()
+
+        def build():
+            delta = _results_changes.since(since, view.version, codes) if since else None
+            if delta is None:
+                return {'version': view.version, 'resync': True}
+            changed, removed = delta
+            return {
+                'version': view.version,
+                'since': since,
+                'resync': False,
+                'changed': changed,
+                'removed': removed,
+            }
+        return cached_json('changes', (since, codes), view.version, build)
+    except Exception as e:
+        print(f"변경분 조회 중 오류: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+def ncav_selection(market, only_positive, dividend_filter):
+    """/ncav 조건에 맞는 NCAV 행 (순위 순)."""
+    # 배당수익률은 MarketView가 종목코드별로 이미 찾아 두었다
+    data = market.ncav_positive if only_positive else market.ncav_ranked
+    dividend_of = market.dividend_of
+
+    if dividend_filter is not None:
+        data = [s for s in data if dividend_of.get(s['code']) is not None and dividend_of[s['code']] >= dividend_filter]
+    return data
+
+
 @app.route('/ncav')
 def ncav_filter():
     """NCAV 스크리닝 결과 반환"""
     try:
-        data = get_ncav_data()
-        if not data:
+        market = get_market_view()
+        if not market.ncav_ranked:
             return jsonify({'stocks': [], 'total': 0})
 
-        # NCAV를 구할 수 없는 종목은 목록에서 제외한다. 보험·은행처럼
-        # 재무상태표에 유동자산 구분이 없는 업종이며, 크롤러가 매 실행
-        # 재조회하지 않도록 마커만 남겨둔 항목이다.
-        data = [s for s in data if not s.get('no_data')]
-
-        # 안전마진 결과에서 배당수익률 합치기
-        margin_data, _ = get_results_data()
-        if margin_data:
-            div_dict = {s['code']: s.get('dividend_yield') for s in margin_data}
-            for stock in data:
-                code = stock.get('code', '')
-                stock['dividend_yield'] = div_dict.get(code) or div_dict.get(code[:-1] + '0')
-
         # 필터 옵션
         only_positive = request.args.get('positive', 'false').lower() == 'true'
         limit = request.args.get('limit', default=50, type=int)
         dividend_filter = request.args.get('dividend', type=float)
-
-        if only_positive:
-            data = [s for s in data if s.get('ncav_positive')]
-
-        if dividend_filter is not None:
-            data = [s for s in data if s.get('dividend_yield') is not None and s['dividend_yield'] >= dividend_filter]
-
-        return jsonify({
-            'stocks': data[:limit],
-            'total': len(data),
-            'ncav_positive_count': len([s for s in get_ncav_data() if s.get('ncav_positive')])
-        })
+        offset, fields = page_params(market.version)
+
+        def build():
+            data = ncav_selection(market, only_positive, dividend_filter)
+            stocks = [market.with_dividend(s) for s in data[offset:offset + max(limit, 0)]]
+            return {
+                'stocks': project(stocks, fields),
+                'total': len(data),
+                'ncav_positive_count': market.ncav_positive_count,
+                'next_cursor': next_cursor(market.version, offset, len(stocks), len(data)),
+            }
+        return cached_json('ncav', (only_positive, limit, dividend_filter, offset, fields), market.version, build)
+    except PageError as e:
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         print(f"NCAV 필터링 중 오류: {str(e)}")
         return jsonify({'error': str(e)}), 500
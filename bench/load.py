@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""서빙 경로 부하 측정.
+
+합성 데이터(bench/synth.py)를 로컬 저장소(STORAGE_LOCAL_DIR)로 삼아 gunicorn을
+띄우고, 여러 스레드가 keep-alive 연결로 /search·/filter·/ncav·/watchlist/data·
+/watchlist/export를 섞어 부른다. 엔드포인트별 처리량, p50·p99 지연 시간,
+서버 프로세스(마스터+워커)의 RSS를 보고한다.
+
+    python bench/synth.py --scale 10
+    python bench/load.py --data bench/data/x10 --concurrency 16 --duration 20
+    python bench/load.py --url http://127.0.0.1:8000 --pid 12345   # 이미 떠 있는 서버
+
+부하를 만드는 쪽도 파이썬 스레드라 GIL을 나눠 쓴다. 절대값보다는 같은
+기계에서 변경 전후를 비교하는 데 쓴다. --json으로 결과를 파일에 남길 수 있다.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import quote, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = ('search', 'filter', 'ncav', 'watchlist_data', 'watchlist_export')
+
+
+# ── 요청 만들기 ────────────────────────────────────
+class Workload:
+    """데이터 파일에서 종목명·코드를 뽑아 그럴듯한 요청을 만든다."""
+
+    def __init__(self, data_dir):
+        with open(os.path.join(data_dir, 'all_safety_margin_results.json'), encoding='utf-8') as f:
+            rows = json.load(f)
+        self.codes = [r['code'] for r in rows]
+        # 검색어는 종목명의 앞 두세 글자. 사용자가 입력하는 도중의 모양이다
+        self.queries = sorted({r['name'][:n] for r in rows[:5000] for n in (1, 2, 3) if r['name'][:n].strip()})
+
+    def request(self, endpoint, rng):
+        """(메서드, 경로, 본문)."""
+        if endpoint == 'search':
+            return 'GET', f'/search?query={quote(rng.choice(self.queries))}', None
+        if endpoint == 'filter':
+            params = [f'limit={rng.choice((30, 50, 100))}']
+            if rng.random() < 0.5:
+                params.append(f'dividend={rng.choice((1, 2, 3, 5))}')
+            return 'GET', '/filter?' + '&'.join(params), None
+        if endpoint == 'ncav':
+            params = [f'limit={rng.choice((50, 100))}']
+            if rng.random() < 0.5:
+                params.append('positive=true')
+            return 'GET', '/ncav?' + '&'.join(params), None
+        # 관심종목은 사용자마다 다르다. 일부는 겹쳐야 캐시 효과도 보인다
+        pool = self.codes[:200] if rng.random() < 0.5 else self.codes
+        codes = rng.sample(pool, min(len(pool), rng.randint(3, 30)))
+        if endpoint == 'watchlist_data':
+            body = {'watchlist': [{'code': c} for c in codes]}
+            return 'POST', '/watchlist/data', body
+        body = {'stocks': [{'code': c} for c in codes], 'limit': len(codes)}
+        return 'POST', '/watchlist/export', body
+
+
+# ── 부하 ──────────────────────────────────────────
+def _client(host, port, workload, endpoints, deadline, seed, out):
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    samples = defaultdict(list)     # 엔드포인트 → [(지연 초, 상태, 바이트)]
+    while time.monotonic() < deadline:
+        endpoint = rng.choice(endpoints)
+        method, path, body = workload.request(endpoint, rng)
+        headers = {'Accept-Encoding': 'gzip'}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            resp = conn.getresponse()
+            size = len(resp.read())
+            status = resp.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            status, size = 0, 0
+        samples[endpoint].append((time.perf_counter() - started, status, size))
+    conn.close()
+    out.append(samples)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[i]
+
+
+def _rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _process_tree(pid):
+    """pid와 그 자식들. gunicorn 마스터를 주면 워커까지 나온다."""
+    pids = [pid]
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                pids.extend(int(c) for c in f.read().split())
+    except OSError:
+        pass
+    return pids
+
+
+class RssSampler:
+    """서버 프로세스들의 RSS 합계를 주기적으로 재서 최대값을 남긴다."""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def current(self):
+        per = {p: _rss_kb(p) for p in _process_tree(self.pid)}
+        return sum(per.values()), per
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_kb = max(self.peak_kb, self.current()[0])
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+# ── 서버 ──────────────────────────────────────────
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=5)
+            conn.request('GET', '/filter?limit=1')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def spawn_server(data_dir, workers, port, extra_env):
+    env = dict(os.environ)
+    env.update({
+        'STORAGE_LOCAL_DIR': os.path.abspath(data_dir),
+        'WEB_CONCURRENCY': str(workers),
+        # 측정 중에 SSE 발행자가 끼어들지 않게 한다
+        'EVENTS_ENABLED': env.get('EVENTS_ENABLED', '0'),
+    })
+    env.update(extra_env)
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app',
+           '-b', f'127.0.0.1:{port}', '--log-level', 'warning']
+    return subprocess.Popen(cmd, cwd=ROOT, env=env)
+
+
+def run(host, port, pid, workload, endpoints, concurrency, duration, warmup, seed):
+    # 캐시가 빈 첫 요청들은 따로 돌린다. 정상 상태의 수치를 보려는 것이다
+    if warmup:
+        _client(host, port, workload, endpoints, time.monotonic() + warmup, seed - 1, [])
+
+    rss = RssSampler(pid).start() if pid else None
+    rss_before = rss.current()[0] if rss else 0
+    outs = []
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=_client, args=(host, port, workload, endpoints, deadline, seed + i, outs))
+               for i in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    merged = defaultdict(list)
+    for samples in outs:
+        for endpoint, rows in samples.items():
+            merged[endpoint].extend(rows)
+
+    report = {'concurrency': concurrency, 'duration': round(elapsed, 2), 'endpoints': {}}
+    for endpoint in endpoints:
+        rows = merged.get(endpoint, [])
+        latencies = sorted(r[0] for r in rows)
+        report['endpoints'][endpoint] = {
+            'requests': len(rows),
+            'errors': sum(1 for r in rows if not 200 <= r[1] < 400),
+            'rps': round(len(rows) / elapsed, 1),
+            'p50_ms': round(_percentile(latencies, 0.50) * 1000, 2),
+            'p99_ms': round(_percentile(latencies, 0.99) * 1000, 2),
+            'mean_bytes': int(sum(r[2] for r in rows) / len(rows)) if rows else 0,
+        }
+    total = sum(len(v) for v in merged.values())
+    report['total_rps'] = round(total / elapsed, 1)
+    if rss:
+        rss.stop()
+        now_kb, per = rss.current()
+        report['rss_mb'] = {'before': round(rss_before / 1024, 1), 'after': round(now_kb / 1024, 1),
+                            'peak': round(max(rss.peak_kb, now_kb) / 1024, 1),
+                            'processes': {str(p): round(kb / 1024, 1) for p, kb in per.items()}}
+    return report
+
+
+def format_report(report):
+    lines = [f"동시 {report['concurrency']}개, {report['duration']}초, 전체 {report['total_rps']} req/s",
+             f"{'엔드포인트':<18} {'요청':>8} {'오류':>6} {'req/s':>9} {'p50(ms)':>9} {'p99(ms)':>9} {'평균 바이트':>11}"]
+    for endpoint, row in report['endpoints'].items():
+        lines.append(f"{endpoint:<18} {row['requests']:>8} {row['errors']:>6} {row['rps']:>9} "
+                     f"{row['p50_ms']:>9} {row['p99_ms']:>9} {row['mean_bytes']:>11}")
+    if 'rss_mb' in report:
+        rss = report['rss_mb']
+        lines.append(f"서버 RSS(MB): 시작 {rss['before']} / 끝 {rss['after']} / 최대 {rss['peak']} "
+                     f"(프로세스 {len(rss['processes'])}개)")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='웹앱 API 부하 측정')
+    parser.add_argument('--data', default=os.path.join(ROOT, 'bench', 'data', 'x1'),
+                        help='합성 데이터 디렉터리 (bench/synth.py의 --out). 기본 bench/data/x1')
+    parser.add_argument('--url', help='이미 떠 있는 서버. 주지 않으면 gunicorn을 띄운다')
+    parser.add_argument('--pid', type=int, help='--url 서버의 마스터 pid. 주면 RSS도 잰다')
+    parser.add_argument('--workers', type=int, default=2, help='띄울 gunicorn 워커 수. 기본 2')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='띄울 서버에 줄 환경변수 (여러 번 가능). 예: --env PRELOAD_SNAPSHOT=0')
+    parser.add_argument('--concurrency', type=int, default=8, help='동시 연결 수. 기본 8')
+    parser.add_argument('--duration', type=float, default=10, help='측정 시간(초). 기본 10')
+    parser.add_argument('--warmup', type=float, default=2, help='측정 전 예열 시간(초). 기본 2')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                        help=f'쉼표로 구분. 기본 전부 ({",".join(ENDPOINTS)})')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='결과를 이 파일에 JSON으로 쓴다')
+    args = parser.parse_args(argv)
+
+    endpoints = tuple(e for e in args.endpoints.split(',') if e)
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f'모르는 엔드포인트: {", ".join(sorted(unknown))}')
+
+    workload = Workload(args.data)
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port, pid = parts.hostname, parts.port or 80, args.pid
+    else:
+        host, port = '127.0.0.1', _free_port()
+        extra = dict(kv.split('=', 1) for kv in args.env)
+        server = spawn_server(args.data, args.workers, port, extra)
+        pid = server.pid
+        if not _wait_ready(host, port, timeout=120):
+            server.kill()
+            print('❌ 서버가 뜨지 않았다', flush=True)
+            return 1
+
+    try:
+        report = run(host, port, pid, workload, endpoints, args.concurrency,
+                     args.duration, args.warmup, args.seed)
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    report['data'] = os.path.abspath(args.data)
+    print(format_report(report), flush=True)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
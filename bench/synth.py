@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""벤치마크용 합성 데이터.
+
+크롤러가 올리는 all_safety_margin_results.json·ncav_results.json과 같은
+모양의 파일을 KRX 종목 수의 1배·10배·100배로 만든다. 값의 분포는 실제
+데이터를 흉내 낸다.
+
+- 우선주: 보통주 열 개 중 하나꼴로 종목코드 끝자리 5, 이름 끝 '우'
+- 연도별 EPS·BPS·PBR을 만들고 내재가치·안전마진은 크롤러처럼
+  valuation.revalue로 구한다. 값을 못 구한 종목은 None(EPS·BPS 모두 결측)과
+  NaN(EPS 일부 결측)을 섞는다. 안전마진도 함께 None·NaN이 된다
+- 배당수익률: None·NaN·0·양수
+- 거래정지: 거래량 0
+- NCAV: 값을 못 구한 종목(no_data)과 시가총액 대비 비율이 큰 종목
+
+데이터는 storage.upload_to_supabase로 쓰므로 매니페스트도 함께 생긴다.
+STORAGE_LOCAL_DIR이 --out을 가리키게 해 두고 업로드하므로 Supabase에는
+아무것도 올라가지 않는다.
+
+    python bench/synth.py --scale 10              # bench/data/x10/
+    python bench/synth.py --scale 100 --seed 7 --out /dev/shm/ivc-x100
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+KRX_STOCKS_FILE = os.path.join(ROOT, 'krx_stocks.json')
+# krx_stocks.json이 없을 때 쓰는 이름 재료
+_FALLBACK_NAMES = ('삼성전자', 'SK하이닉스', '현대차', 'LG화학', '카카오', 'NAVER', '셀트리온',
+                   '기아', 'POSCO홀딩스', '한국전력', '신세계', 'CJ제일제당', 'KB금융', '한화')
+_FALLBACK_SIZE = 2800
+
+
+def _universe():
+    """(종목명, 시가총액) 목록. 실제 KRX 목록이 있으면 그 이름과 크기를 쓴다."""
+    try:
+        with open(KRX_STOCKS_FILE, encoding='utf-8') as f:
+            rows = json.load(f)
+        base = [(r['Name'], r.get('Marcap') or 0) for r in rows
+                if not r['Name'].endswith(('우', '우B', '우C'))]
+        if base:
+            return base
+    except (OSError, ValueError, KeyError):
+        pass
+    return [(f'{_FALLBACK_NAMES[i % len(_FALLBACK_NAMES)]}{i}', 0) for i in range(_FALLBACK_SIZE)]
+
+
+def _stamp(now, rng, max_days):
+    return (now - timedelta(seconds=rng.randint(0, max_days * 86400))).isoformat()
+
+
+def _years(rng, level, drift, missing):
+    """3년전, 2년전, 직전년도 값. missing이면 가장 오래된 해가 없다."""
+    values = [int(round(level * drift ** (i - 2) * rng.uniform(0.85, 1.15))) for i in range(3)]
+    if missing:
+        values[0] = None
+    return values
+
+
+def generate(scale, seed=0):
+    """(안전마진 결과, NCAV 결과). 크롤러와 같은 순서로 정렬돼 있다."""
+    from valuation import EPS_FIELDS, BPS_FIELDS, PBR_FIELDS, revalue
+
+    rng = random.Random(seed)
+    now = datetime.fromisoformat('2026-10-16T18:40:00+09:00')
+    price_date = now.strftime('%Y-%m-%d')
+    base = _universe()
+
+    results, ncav = [], []
+    serial = 0
+    for copy in range(scale):
+        for name, marcap in base:
+            if copy:
+                name = f'{name} {copy}'
+            serial += 1
+            code = f'{serial:05d}0'
+            marcap = marcap or int(10 ** rng.uniform(9.5, 13))
+            price = float(round(10 ** rng.uniform(2.7, 6)))
+
+            listings = [(code, name, price)]
+            if rng.random() < 0.1:
+                # 우선주는 보통주보다 싸게 거래되는 편이다
+                listings.append((code[:-1] + '5', name + '우', float(round(price * rng.uniform(0.5, 0.9)))))
+
+            for c, n, p in listings:
+                luck = rng.random()
+                # 4%는 EPS·BPS 양쪽에 빈 해가 있어 계산 불가(None), 4%는 EPS만
+                # 비어 NaN이 된다
+                eps = _years(rng, p * rng.lognormvariate(-2.3, 0.6) * rng.choice((1, 1, 1, -0.3)),
+                             rng.uniform(0.8, 1.3), luck < 0.08)
+                bps = _years(rng, p * rng.lognormvariate(0, 0.6), rng.uniform(0.95, 1.1), luck < 0.04)
+                pbr = [round(p / b, 2) if b else None for b in bps]
+                ratio = rng.choice((0, 0, 0, round(rng.uniform(0.1, 15), 2)))
+
+                dividend = rng.choice((None, float('nan'), 0.0, round(rng.uniform(0.1, 9), 2),
+                                       round(rng.uniform(0.1, 4), 2)))
+                row = {
+                    'code': c,
+                    'name': n,
+                    'current_price': p,
+                    'intrinsic_value': None,
+                    'safety_margin': None,
+                    'treasury_ratio': ratio,
+                    'treasury_shares': int(ratio * rng.uniform(1e4, 1e6)) if ratio else 0,
+                    'dividend_yield': dividend,
+                    'last_updated': _stamp(now, rng, 7),
+                    'price_updated': now.isoformat(),
+                    'price_date': price_date,
+                    'volume': 0 if rng.random() < 0.01 else int(10 ** rng.uniform(2, 7)),
+                }
+                row.update(zip(EPS_FIELDS, eps))
+                row.update(zip(BPS_FIELDS, bps))
+                row.update(zip(PBR_FIELDS, pbr))
+                results.append(row)
+
+            updated = _stamp(now, rng, 30)
+            if rng.random() < 0.08:
+                # 보험·은행처럼 유동자산 구분이 없어 값을 못 구한 종목
+                ncav.append({'code': code, 'name': name, 'ncav': None, 'marcap': marcap,
+                             'ncav_ratio': None, 'ncav_positive': False, 'no_data': True,
+                             'last_updated': updated})
+                continue
+            current = int(marcap * rng.uniform(0.05, 2.5))
+            debt = int(marcap * rng.uniform(0.02, 2.0))
+            value = current - debt
+            ncav.append({
+                'code': code,
+                'name': name,
+                'ncav': value,
+                'marcap': marcap,
+                'ncav_ratio': round(value / marcap * 100, 2) if marcap > 0 else None,
+                '유동자산': current,
+                '부채총계': debt,
+                '자산총계': int(current * rng.uniform(1.2, 3)),
+                '자본총계': int(marcap * rng.uniform(0.2, 2)),
+                'bsns_year': 2025,
+                'ncav_positive': value > marcap,
+                'last_updated': updated,
+            })
+
+    revalue(results)
+
+    def margin_key(row):
+        m = row['safety_margin']
+        return float('-inf') if m is None or math.isnan(m) else m
+
+    results.sort(key=margin_key, reverse=True)
+    ncav.sort(key=lambda x: x.get('ncav_ratio') or float('-inf'), reverse=True)
+    return results, ncav
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='벤치마크용 합성 결과 데이터')
+    parser.add_argument('--scale', type=int, default=1, help='KRX 종목 수의 배수 (1, 10, 100). 기본 1')
+    parser.add_argument('--seed', type=int, default=0, help='난수 시드. 같으면 같은 파일이 나온다')
+    parser.add_argument('--out', help='저장 디렉터리. 기본 bench/data/x<scale>')
+    args = parser.parse_args(argv)
+
+    out = os.path.abspath(args.out or os.path.join(ROOT, 'bench', 'data', f'x{args.scale}'))
+    # storage는 임포트할 때 환경변수를 읽는다
+    os.environ['STORAGE_LOCAL_DIR'] = out
+    from storage import upload_to_supabase
+
+    results, ncav = generate(args.scale, args.seed)
+    upload_to_supabase('all_safety_margin_results.json', results)
+    upload_to_supabase('ncav_results.json', ncav)
+    print(f"📦 {out}: 안전마진 {len(results)}행, NCAV {len(ncav)}행", flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
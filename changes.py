@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""데이터 버전 사이의 변경분.
+
+장중 PRICE_ONLY 크롤링은 대부분 주가 관련 필드만 바꾼다. 캐시가 새 버전을
+받을 때마다 직전 버전과 종목별로 비교해 바뀐 필드만 남겨 두면, 클라이언트는
+전체 목록 대신 그 차이만 받아 갱신할 수 있다 (/changes).
+
+최근 몇 개 버전만 고리 모양으로 보관한다. 그보다 오래된 버전에서 묻거나
+이 프로세스가 본 적 없는 버전이면 전체를 다시 받으라고 답한다.
+"""
+
+import threading
+from collections import deque
+
+_MISSING = object()
+
+
+def diff_rows(old, new):
+    """종목코드 → 행 사전 두 개의 차이.
+
+    :return: (changed, removed). changed는 {종목코드: {필드: 새 값}}으로 새로
+             생긴 종목은 행 전체, 있던 종목은 바뀐 필드만 담는다. 필드가
+             사라졌으면 None이다. removed는 없어진 종목코드 목록이다.
+    """
+    changed = {}
+    for code, row in new.items():
+        before = old.get(code)
+        if before is None:
+            changed[code] = dict(row)
+            continue
+        fields = {k: v for k, v in row.items() if before.get(k, _MISSING) != v}
+        for k in before:
+            if k not in row:
+                fields[k] = None
+        if fields:
+            changed[code] = fields
+    removed = [code for code in old if code not in new]
+    return changed, removed
+
+
+class ChangeLog:
+    """최근 데이터 버전들의 변경분 고리."""
+
+    def __init__(self, size=8):
+        self._steps = deque(maxlen=size)   # (이전 버전, 버전, changed, removed)
+        self._lock = threading.Lock()
+
+    def record(self, old_view, new_view):
+        """뷰가 old_view에서 new_view로 바뀔 때 부른다. 뷰에는 version과 by_code가 있어야 한다."""
+        if old_view is None or not old_view.version:
+            return
+        changed, removed = diff_rows(old_view.by_code, new_view.by_code)
+        with self._lock:
+            if self._steps and self._steps[-1][1] != old_view.version:
+                # 중간 버전을 놓쳤다. 이어지지 않는 변경분은 합칠 수 없다
+                self._steps.clear()
+            self._steps.append((old_view.version, new_view.version, changed, removed))
+
+    def since(self, version, until, codes=None):
+        """version에서 until까지의 변경분을 합친 (changed, removed).
+
+        모르는 버전이면 None이다. 전체를 다시 받아야 한다.
+        :param codes: 주면 그 종목만 남긴다
+        """
+        if version == until:
+            return {}, []
+        with self._lock:
+            steps = list(self._steps)
+        start = next((i for i, step in enumerate(steps) if step[0] == version), None)
+        if start is None:
+            return None
+
+        changed, removed = {}, set()
+        for _, step_version, step_changed, step_removed in steps[start:]:
+            for code, fields in step_changed.items():
+                removed.discard(code)
+                changed.setdefault(code, {}).update(fields)
+            for code in step_removed:
+                changed.pop(code, None)
+                removed.add(code)
+            if step_version == until:
+                break
+        else:
+            # until에 닿지 못했다 (고리가 아직 until을 기록하지 않았다)
+            return None
+
+        if codes is not None:
+            wanted = set(codes)
+            changed = {code: fields for code, fields in changed.items() if code in wanted}
+            removed &= wanted
+        return changed, sorted(removed)
@@ -14,12 +14,18 @@
   NCAV_BUDGET_SECONDS          NCAV 스크리닝 시간 상한 (기본 1800)
   FUNDAMENTALS_REFRESH_SECONDS 재무지표 재크롤링 주기 (기본 7일)
   CRAWL_WORKERS                네이버 동시 요청 수 (기본 6)
+  TREASURY_WORKERS             wisereport 동시 요청 수 (기본 CRAWL_WORKERS)
+  CRAWL_ADAPTIVE               1이면 위 두 값에서 시작해 호스트별로 조절 (기본 1)
+  CRAWL_MAX_WORKERS            조절할 때 동시 요청 수 상한 (기본 16)
   PRICE_ONLY                   1이면 주가만 갱신 (재무지표·NCAV 건너뜀)
 
 로컬 실행:
   python crawl.py
+  python crawl.py --profile      단계별 시간과 스택 샘플을 profile/<시각>/에 남긴다
 """
 
+import argparse
+import json
 import os
 import sys
 import time
@@ -39,7 +45,12 @@ from safety_margin_calc_naver import (
     load_krx_stocks,
     analyze_all_stocks,
     calculate_ncav_screening,
+    CRAWL_MAX_WORKERS,
 )
+import crawl_http
+import crawl_rate
+import profiling
+from profiling import stage
 
 KST = pytz.timezone('Asia/Seoul')
 
@@ -49,6 +60,54 @@ def _log(msg: str):
 
 
 def main() -> int:
+    args = _parse_args()
+    if not args.profile:
+        return crawl()
+
+    # 단계 시간은 실행끼리 비교하고(profiling.py diff), 스택 샘플은 단계
+    # 안에서 어디가 느린지 본다. 샘플러는 별도 스레드라 크롤링과 함께 돈다.
+    out_dir = args.profile_dir or os.path.join('profile', datetime.now(KST).strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(out_dir, exist_ok=True)
+    profiling.enable_stages()
+    sampler = profiling.Sampler(args.profile_interval).start()
+    started = time.monotonic()
+    try:
+        return crawl()
+    finally:
+        wall = time.monotonic() - started
+        sampler.stop()
+        sampler.write_collapsed(os.path.join(out_dir, 'stacks.txt'))
+        report = profiling.stage_report()
+        with open(os.path.join(out_dir, 'stages.json'), 'w', encoding='utf-8') as f:
+            json.dump({'wall': round(wall, 3), 'price_only': os.getenv('PRICE_ONLY', ''),
+                       'samples': sampler.samples, 'stages': report}, f, ensure_ascii=False, indent=1)
+        _log(f"📈 프로파일 저장: {out_dir} (stages.json, stacks.txt)\n" + profiling.format_stages(report, wall))
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='네이버/DART 배치 크롤러')
+    parser.add_argument('--profile', action='store_true',
+                        help='단계별 시간(stages.json)과 collapsed 스택 샘플(stacks.txt)을 남긴다')
+    parser.add_argument('--profile-dir', help='프로파일을 쓸 디렉터리. 기본 profile/<시각>')
+    parser.add_argument('--profile-interval', type=float, default=0.01,
+                        help='스택 샘플 간격(초). 기본 0.01')
+    return parser.parse_args()
+
+
+def crawl() -> int:
+    try:
+        return _crawl()
+    finally:
+        # 호스트별 연결 재사용률. 낮으면 keep-alive가 끊기고 있다는 뜻이다
+        _log(crawl_http.report())
+        # 이번에 배운 동시 요청 수를 다음 실행에 넘긴다
+        rate = crawl_rate.report()
+        if rate:
+            _log(rate)
+            crawl_rate.persist()
+
+
+def _crawl() -> int:
     started = time.monotonic()
 
     missing = [k for k in ('SUPABASE_URL', 'SUPABASE_KEY') if not os.getenv(k)]
@@ -62,6 +121,7 @@ def main() -> int:
     # 전환이 됐는지 확인할 방법이 없다.
     from storage import key_kind
     _log(f"Supabase 키: {key_kind()}")
+    crawl_rate.restore(max_ceiling=CRAWL_MAX_WORKERS)
 
     crawl_budget = int(os.getenv('CRAWL_BUDGET_SECONDS', '3600'))
     ncav_budget = int(os.getenv('NCAV_BUDGET_SECONDS', '1800'))
@@ -74,14 +134,16 @@ def main() -> int:
     # CI는 체크아웃 직후라 krx_stocks.json의 mtime이 항상 '방금'이다.
     # force를 켜지 않으면 종목 목록이 영원히 갱신되지 않는다.
     _log("KRX 종목 목록 갱신...")
-    load_krx_stocks(force=True)
+    with stage('load_krx_stocks'):
+        load_krx_stocks(force=True)
 
     if price_only:
         _log("주가 전용 모드 (재무지표·NCAV 건너뜀)")
     else:
         _log(f"안전마진 분석 시작 (시간 예산 {crawl_budget}초)")
     try:
-        analyze_all_stocks(time_budget_seconds=crawl_budget, price_only=price_only)
+        with stage('analyze_all_stocks'):
+            analyze_all_stocks(time_budget_seconds=crawl_budget, price_only=price_only)
     except Exception as e:
         _log(f"❌ 안전마진 분석 실패: {e}")
         return 1
@@ -93,7 +155,8 @@ def main() -> int:
     if os.getenv('DART_API_KEY'):
         _log(f"NCAV 스크리닝 시작 (시간 예산 {ncav_budget}초)")
         try:
-            calculate_ncav_screening(time_budget_seconds=ncav_budget)
+            with stage('calculate_ncav_screening'):
+                calculate_ncav_screening(time_budget_seconds=ncav_budget)
         except Exception as e:
             # NCAV는 부가 기능이다. 여기서 실패해도 안전마진 결과는 이미
             # 업로드됐으므로 실행 전체를 실패로 만들지 않는다.
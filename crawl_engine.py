@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""크롤링 파이프라인. 호스트별 동시 요청 상한을 두고 종목을 끊김 없이 흘려보낸다.
+
+예전에는 50종목 묶음마다 ThreadPoolExecutor를 새로 만들고 pool.map이 끝나기를
+기다렸다. 묶음에서 가장 느린 요청 하나(타임아웃이면 15초)가 끝날 때까지 나머지
+워커가 놀았고, 시간 예산도 묶음 사이에서만 확인했다.
+
+여기서는 asyncio 루프 하나가 종목마다 작업을 띄운다. 작업은 호스트(naver,
+wisereport, dart)마다 따로 둔 세마포어를 얻은 뒤 블로킹 요청(requests·lxml)을
+스레드 풀에서 실행한다. 한 종목이 끝나면 바로 다음 종목이 그 자리를 채우므로
+묶음 경계에서 기다리는 일이 없다. 시간 예산은 요청마다 확인한다. 예산이
+다하면 새 요청을 시작하지 않고, 이미 보낸 요청만 마저 받는다.
+
+끝난 결과는 on_result로 바로 넘어간다. on_result는 항상 루프 스레드에서
+하나씩 불리므로 병합하는 쪽은 락이 필요 없다.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import add_stage
+
+
+class BudgetExhausted(Exception):
+    """시간 예산이 다해 요청을 시작하지 않았다."""
+
+
+class Engine:
+    """호스트별 동시 요청 상한을 지키며 항목들을 처리한다.
+
+    :param limits: {호스트: 동시 요청 수 또는 crawl_rate.AdaptiveLimit}
+    :param deadline: time.monotonic() 기준 마감 시각. None이면 무제한
+    """
+
+    def __init__(self, limits, deadline=None):
+        self.limits = dict(limits)
+        self.deadline = deadline
+        self.started = 0
+        self.completed = 0
+        self.unstarted = 0
+        self._sems = None
+        self._pool = None
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    async def call(self, host, fn, *args):
+        """host의 자리가 나면 fn(*args)을 스레드 풀에서 실행한다.
+
+        예산이 다했으면 요청을 보내지 않고 BudgetExhausted를 던진다.
+        """
+        if self.expired():
+            raise BudgetExhausted()
+        waited = time.perf_counter()
+        async with self._sems[host]:
+            add_stage(f'engine.wait.{host}', time.perf_counter() - waited)
+            if self.expired():
+                raise BudgetExhausted()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, fn, *args)
+
+    def run(self, items, work, on_result):
+        """items를 모두 처리하거나 예산이 다할 때까지 돈다.
+
+        :param work: async work(engine, item) → 결과. 안에서 engine.call로 요청한다
+        :param on_result: on_result(item, 결과). 끝나는 순서대로 불린다
+        :return: 예산 때문에 시작하지 못한 항목 수
+        """
+        return asyncio.run(self._run(items, work, on_result))
+
+    async def _one(self, work, item):
+        try:
+            return item, await work(self, item), False
+        except BudgetExhausted:
+            return item, None, True
+
+    async def _run(self, items, work, on_result):
+        self._sems = {host: asyncio.Semaphore(n) if isinstance(n, int) else n
+                      for host, n in self.limits.items()}
+        # 스레드는 세마포어를 쥔 요청만 쓴다. 상한의 합이면 모자라지 않는다
+        workers = sum(n if isinstance(n, int) else n.capacity for n in self.limits.values())
+        # 대기열에 올려 둘 작업 수. 세마포어 앞에 줄이 조금 서 있어야 자리가
+        # 나는 즉시 채워진다. 전 종목을 한꺼번에 띄우면 예산이 다했을 때
+        # 취소할 작업만 수천 개가 된다.
+        window = workers * 2
+        it = iter(items)
+        exhausted = False
+        pending = set()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crawl') as pool:
+            self._pool = pool
+            while True:
+                while not exhausted and len(pending) < window:
+                    item = next(it, _END)
+                    if item is _END:
+                        exhausted = True
+                        break
+                    if self.expired():
+                        self.unstarted += 1
+                        continue
+                    self.started += 1
+                    pending.add(asyncio.ensure_future(self._one(work, item)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    item, result, skipped = task.result()
+                    if skipped:
+                        self.started -= 1
+                        self.unstarted += 1
+                        continue
+                    self.completed += 1
+                    on_result(item, result)
+        self._pool = None
+        return self.unstarted
+
+
+_END = object()
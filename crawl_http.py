@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""크롤러의 HTTP 연결 풀. 호스트마다 연결을 유지해 다시 쓴다.
+
+requests.get을 그대로 부르면 요청마다 TCP 연결과 TLS 핸드셰이크를 새로 한다.
+해외 러너(GitHub Actions)에서 한국 서버까지는 왕복이 길어, 종목당 지연의
+상당 부분이 본문이 아니라 연결 수립이었다.
+
+호스트마다 HTTPAdapter(urllib3 연결 풀) 하나를 두고, 크기는 그 호스트의
+동시 요청 수에 맞춘다. 풀은 스레드 간에 안전하지만 requests.Session의 쿠키
+처리는 그렇지 않으므로, 세션은 스레드마다 만들고 같은 어댑터를 붙인다.
+연결은 스레드가 아니라 호스트 단위로 공유된다.
+
+실행이 끝나면 report()로 호스트별 요청 수와 새로 연 연결 수(나머지는 재사용)를
+로그에 남긴다.
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HostClient:
+    """한 호스트(또는 같은 용도의 호스트 묶음)용 연결 풀.
+
+    :param name: 로그에 쓰는 이름
+    :param pool_size: 유지할 연결 수. 그 호스트의 동시 요청 수에 맞춘다
+    :param headers: 모든 요청에 붙일 헤더
+    :param controller: 주면 요청마다 (걸린 시간, 결과)를 controller.record로 알린다.
+                       crawl_rate.AdaptiveLimit가 이것으로 동시 요청 수를 조절한다
+    """
+
+    def __init__(self, name, pool_size, headers=None, controller=None):
+        self.name = name
+        self.controller = controller
+        self.pool_size = pool_size
+        self.headers = {
+            # requests 기본값과 같지만 명시해 둔다. HTML·JSON 응답이 1/5~1/10로 준다
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+            **(headers or {}),
+        }
+        # pool_connections는 호스트별 풀의 개수다. 리다이렉트로 다른 호스트에
+        # 가는 일이 있어 몇 개 여유를 둔다. pool_block=False라 풀이 꽉 차도
+        # 기다리지 않고 연결을 하나 더 연다(그 연결은 돌려받지 않고 닫는다).
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+            self._local.session = session
+        return session
+
+    def get(self, url, **kwargs):
+        """requests.get과 같다. 연결은 풀에서 꺼내 쓰고 돌려놓는다."""
+        started = time.monotonic()
+        try:
+            resp = self._session().get(url, **kwargs)
+        except requests.RequestException as e:
+            with self._lock:
+                self.requests += 1
+                self.errors += 1
+            self._record(started, 'timeout' if isinstance(e, requests.Timeout) else 'error')
+            raise
+        with self._lock:
+            self.requests += 1
+        self._record(started, _outcome(resp.status_code))
+        return resp
+
+    def _record(self, started, outcome):
+        if self.controller is not None:
+            self.controller.record(time.monotonic() - started, outcome)
+
+    def connections_opened(self):
+        """지금까지 새로 연 연결 수. urllib3 풀이 세고 있다."""
+        pools = self._adapter.poolmanager.pools
+        opened = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+        return opened
+
+    def stats(self):
+        opened = self.connections_opened()
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'connections': opened,
+            'reused': max(0, self.requests - self.errors - opened),
+        }
+
+    def close(self):
+        self._adapter.close()
+
+
+def _outcome(status):
+    # 429는 명시적인 속도 제한, 403은 이 사이트들이 차단할 때 내는 응답이다
+    if status in (403, 429):
+        return 'throttled'
+    if status >= 500:
+        return 'error'
+    return 'ok'
+
+
+_clients = []
+
+
+def client(name, pool_size, headers=None, controller=None):
+    """HostClient를 만들고 report()에 포함되도록 등록한다."""
+    c = HostClient(name, pool_size, headers, controller)
+    _clients.append(c)
+    return c
+
+
+def report():
+    """호스트별 요청·연결 수 한 줄. 요청이 없었던 호스트는 뺀다."""
+    parts = []
+    for c in _clients:
+        s = c.stats()
+        if not s['requests']:
+            continue
+        rate = s['reused'] / s['requests'] * 100
+        parts.append(f"{c.name} 요청 {s['requests']}회 / 새 연결 {s['connections']}개 "
+                     f"/ 재사용 {rate:.0f}% / 실패 {s['errors']}회")
+    return '🔌 연결 ' + ('; '.join(parts) if parts else '요청 없음')
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""호스트별 동시 요청 수를 스스로 조절한다 (AIMD).
+
+고정된 CRAWL_WORKERS는 상류가 한가할 때는 느리고, 붐빌 때는 차단을 부른다.
+여기서는 요청 결과를 보고 호스트마다 동시 요청 수를 조절한다.
+
+- 성공하면 조금씩 늘린다. 한 바퀴(지금 상한만큼의 요청)가 무사히 끝날
+  때마다 1씩이다.
+- 429·403(차단 신호), 타임아웃, 연결 오류, 5xx, 평소보다 크게 느려진 응답이면
+  곱해서 줄인다. 차단 신호는 절반, 나머지는 0.7배다. 이미 보낸 요청들의
+  실패가 한꺼번에 돌아와 0까지 곤두박질치지 않도록 한 번 줄인 뒤 잠깐은
+  다시 줄이지 않는다.
+- 차단 신호를 받은 수준은 천장(ceiling)으로 기억해 다음 실행부터 그 아래에서
+  돈다. 천장에 닿은 채 한 실행을 무사히 마치면 천장을 1 올려 다시 떠본다.
+
+배운 값은 실행이 끝날 때 로컬 파일과 Supabase(매니페스트 없이)에 남기고,
+다음 실행이 시작할 때 읽는다. CI는 매번 새로 체크아웃하므로 로컬 파일만으로는
+이어지지 않는다.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+RATE_STATE_FILE = 'crawl_rate_state.json'
+
+# 응답이 평소보다 이만큼 느려지면 붐비는 것으로 본다
+SLOW_FACTOR = 3.0
+# '평소'가 지금 이동평균 쪽으로 한 번에 다가가는 비율. 내려갈 때는 바로 따라가고
+# 올라갈 때만 이만큼씩이다. 수백 요청에 걸쳐 바뀐 응답 속도는 새 평소가 된다
+BASELINE_DRIFT = 0.01
+# 곱해서 줄이는 비율. 차단 신호 / 그 밖의 혼잡 신호
+THROTTLE_BACKOFF = 0.5
+CONGESTION_BACKOFF = 0.7
+
+_limiters = []
+
+
+class AdaptiveLimit:
+    """asyncio 루프에서 쓰는 세마포어. 상한이 요청 결과에 따라 바뀐다.
+
+    acquire·release는 루프 스레드에서, record는 요청을 실행한 워커 스레드에서
+    불린다.
+
+    :param initial: 처음 상한
+    :param floor: 아무리 줄여도 이 아래로는 내려가지 않는다
+    :param ceiling: 아무리 늘려도 이 위로는 올라가지 않는다
+    """
+
+    def __init__(self, name, initial, floor=1, ceiling=16):
+        self.name = name
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        self.limit = float(min(max(initial, floor), self.ceiling))
+        self.start_limit = self.limit
+        self.peak = self.limit
+        self.decreases = 0
+        self.throttles = 0
+        self._latency = None        # 응답 시간 이동평균
+        self._baseline = None       # 평소 응답 시간. 천천히 따라가는 이동평균
+        self._hold_until = 0.0
+        self._inflight = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    # ── 세마포어 ──
+    @property
+    def capacity(self):
+        """동시에 돌 수 있는 최대 요청 수. 스레드 풀 크기를 정할 때 쓴다."""
+        return int(self.ceiling)
+
+    def _slots(self):
+        return max(self.floor, int(self.limit))
+
+    async def acquire(self):
+        if self._inflight < self._slots() and not self._waiters:
+            self._inflight += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut       # release가 자리를 넘겨줄 때 _inflight를 올려 둔다
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self._inflight -= 1
+        while self._waiters and self._inflight < self._slots():
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            self._inflight += 1
+            fut.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+        return False
+
+    # ── 조절 ──
+    def record(self, seconds, outcome):
+        """요청 하나의 결과.
+
+        :param outcome: 'ok', 'throttled'(429·403), 'timeout', 'error'(연결 오류·5xx)
+        """
+        now = time.monotonic()
+        with self._lock:
+            if outcome == 'ok':
+                self._latency = seconds if self._latency is None else self._latency * 0.9 + seconds * 0.1
+                if self._baseline is None or self._latency < self._baseline:
+                    self._baseline = self._latency
+                else:
+                    # 가장 빨랐던 값에 묶어 두면 그 뒤의 평범한 응답까지 느리다고 본다
+                    self._baseline += (self._latency - self._baseline) * BASELINE_DRIFT
+                if self._latency > self._baseline * SLOW_FACTOR:
+                    outcome = 'slow'
+            if outcome == 'ok':
+                self.limit = min(self.ceiling, self.limit + 1 / self.limit)
+                self.peak = max(self.peak, self.limit)
+                return
+            if outcome == 'throttled':
+                self.throttles += 1
+                # 차단 신호는 쿨다운과 상관없이 천장을 내린다
+                self.ceiling = max(self.floor, min(self.ceiling, int(self.limit * 0.8)))
+                # 쿨다운 중이라 아래에서 줄이지 않더라도 상한이 천장 위에 남으면 안 된다
+                self.limit = min(self.limit, self.ceiling)
+            if now < self._hold_until:
+                return
+            before = self.limit
+            factor = THROTTLE_BACKOFF if outcome == 'throttled' else CONGESTION_BACKOFF
+            self.limit = max(self.floor, min(self.ceiling, self.limit * factor))
+            self.decreases += 1
+            # 줄이기 전에 보낸 요청들이 돌아올 때까지는 다시 줄이지 않는다
+            self._hold_until = now + max(1.0, 2 * (self._latency or seconds))
+        print(f"🐢 {self.name} 동시 요청 {before:.1f} → {self.limit:.1f} ({outcome}, {seconds:.1f}초)", flush=True)
+
+    def summary(self):
+        return (f"{self.name} 동시 {self.start_limit:.0f}→{self.limit:.1f} "
+                f"(최고 {self.peak:.1f}, 천장 {self.ceiling}, 감속 {self.decreases}회, 차단 신호 {self.throttles}회)")
+
+
+def limiter(name, initial, floor=1, ceiling=16):
+    """AdaptiveLimit을 만들고 restore()·persist()가 다루도록 등록한다."""
+    lim = AdaptiveLimit(name, initial, floor, ceiling)
+    _limiters.append(lim)
+    return lim
+
+
+def restore(max_ceiling=None):
+    """지난 실행이 배운 값으로 시작한다. 로컬 파일 → Supabase 순으로 찾는다."""
+    state = None
+    if os.path.exists(RATE_STATE_FILE):
+        try:
+            with open(RATE_STATE_FILE, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+    if state is None:
+        from storage import download_from_supabase
+        state = download_from_supabase(RATE_STATE_FILE)
+    if not isinstance(state, dict):
+        return
+    for lim in _limiters:
+        saved = state.get(lim.name)
+        if not isinstance(saved, dict):
+            continue
+        ceiling = int(saved.get('ceiling') or lim.ceiling)
+        if max_ceiling is not None:
+            ceiling = min(ceiling, max_ceiling)
+        lim.ceiling = max(lim.floor, ceiling)
+        # 지난번 끝난 값에서 조금 물러나 시작한다. 상류 상태는 실행마다 다르다
+        start = float(saved.get('limit') or lim.limit) * 0.8
+        lim.limit = lim.start_limit = lim.peak = max(lim.floor, min(lim.ceiling, start))
+        print(f"📈 {lim.name}: 지난 실행 기준 동시 {lim.limit:.1f}로 시작 (천장 {lim.ceiling})", flush=True)
+
+
+def persist():
+    """배운 값을 남긴다. 한 번도 조절하지 않은(요청이 없던) 호스트는 지난 값을 유지한다."""
+    state = {}
+    if os.path.exists(RATE_STATE_FILE):
+        try:
+            with open(RATE_STATE_FILE, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+    stamp = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    touched = False
+    for lim in _limiters:
+        if lim._latency is None and not lim.decreases:
+            continue
+        ceiling = lim.ceiling
+        if not lim.throttles and lim.peak >= ceiling:
+            # 천장에서 무사히 돌았다. 다음 실행은 한 칸 위까지 떠본다
+            ceiling += 1
+        state[lim.name] = {'limit': round(lim.limit, 2), 'ceiling': ceiling, 'updated': stamp}
+        touched = True
+    if not touched:
+        return
+    try:
+        with open(RATE_STATE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
+    except OSError as e:
+        print(f"⚠️ 동시 요청 상태 저장 실패: {e}", flush=True)
+    from storage import upload_to_supabase
+    upload_to_supabase(RATE_STATE_FILE, state, manifest=False)
+
+
+def report():
+    """조절한 호스트별 요약 한 줄. 요청이 없었으면 빈 문자열."""
+    parts = [lim.summary() for lim in _limiters if lim._latency is not None or lim.decreases]
+    return '🚦 ' + '; '.join(parts) if parts else ''
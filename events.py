@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""데이터 버전 변경 알림 (Server-Sent Events, /events).
+
+발행자는 하나다. 앱의 백그라운드 스레드 하나가 새 버전을 발견하면
+Broadcaster에 최신 이벤트를 올리고, 연결마다 도는 스트림은 조건 변수에서
+잠들어 있다가 깨어나 그것을 보낸다. 연결이 몇 개든 데이터를 확인하는
+일은 한 번이고, 쉬고 있는 연결은 하트비트 말고는 아무것도 하지 않는다.
+
+버전은 앞의 것을 덮어쓰므로 이벤트 이력은 두지 않는다. 늦게 깨어난
+스트림은 가장 최근 이벤트 하나만 보내면 된다.
+
+스레드 워커(gthread)에서는 열린 스트림 하나가 워커 스레드 하나를 계속
+붙잡는다. 스트림 수에 상한을 두지 않으면 쉬는 탭 수십 개가 스레드 풀을
+다 차지해 /filter 같은 API 요청이 그 뒤에 줄을 선다. 그래서 워커마다 열 수
+있는 스트림 수를 max_streams로 묶고, 넘치면 open_stream이 None을 돌려준다.
+"""
+
+import json
+import threading
+
+
+class Broadcaster:
+    """최신 이벤트 하나를 여러 스트림에 알린다."""
+
+    def __init__(self, max_streams=None):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._event = None
+        self.closed = False
+        self.max_streams = max_streams
+        self.streams = 0
+
+    def acquire(self):
+        """스트림 자리 하나를 얻는다. 상한에 찼으면 False."""
+        with self._cond:
+            if self.max_streams is not None and self.streams >= self.max_streams:
+                return False
+            self.streams += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.streams -= 1
+
+    def publish(self, event):
+        with self._cond:
+            self._seq += 1
+            self._event = event
+            self._cond.notify_all()
+
+    def latest(self):
+        """(번호, 이벤트). 아직 없으면 이벤트는 None."""
+        with self._cond:
+            return self._seq, self._event
+
+    def wait(self, seq, timeout):
+        """seq 다음 이벤트를 timeout초까지 기다린다. 없으면 None."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != seq or self.closed, timeout)
+            if self._seq == seq:
+                return None
+            return self._seq, self._event
+
+    def close(self):
+        """모든 스트림을 끝낸다. 워커가 내려갈 때 부른다."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def reset_after_fork(self):
+        self._cond = threading.Condition()
+        self.streams = 0
+
+
+def format_event(event, name='version'):
+    """SSE 메시지 하나. id는 클라이언트가 재접속할 때 Last-Event-ID로 돌려준다."""
+    data = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+    return f'id: {event["version"]}\nevent: {name}\ndata: {data}\n\n'
+
+
+def stream(broadcaster, last_id, heartbeat, retry_ms):
+    """연결 하나의 SSE 본문.
+
+    :param last_id: 클라이언트가 마지막으로 받은 버전. 지금 버전과 같으면
+                    접속 직후의 알림을 생략한다
+    """
+    yield f'retry: {retry_ms}\n\n'
+    seq, event = broadcaster.latest()
+    if event is not None and event['version'] != last_id:
+        yield format_event(event)
+    while not broadcaster.closed:
+        got = broadcaster.wait(seq, heartbeat)
+        if broadcaster.closed:
+            return
+        if got is None:
+            # 프록시·로드밸런서가 유휴 연결을 끊지 않도록 주석 한 줄을 보낸다
+            yield ': ping\n\n'
+            continue
+        seq, event = got
+        yield format_event(event)
+
+
+class _Stream:
+    """스트림 본문. 응답이 닫히면(클라이언트가 끊으면) 자리를 돌려준다.
+
+    제너레이터의 finally로는 안 된다. 한 번도 돌지 않은 제너레이터는 닫혀도
+    finally를 실행하지 않는다.
+    """
+
+    def __init__(self, broadcaster, body):
+        self._broadcaster = broadcaster
+        self._body = body
+        self._released = False
+
+    def __iter__(self):
+        return self._body
+
+    def close(self):
+        try:
+            self._body.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._broadcaster.release()
+
+
+def open_stream(broadcaster, last_id, heartbeat, retry_ms):
+    """stream()을 자리를 얻은 뒤 연다. 스트림 상한에 찼으면 None."""
+    if not broadcaster.acquire():
+        return None
+    return _Stream(broadcaster, stream(broadcaster, last_id, heartbeat, retry_ms))
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""엑셀(xlsx)·CSV 내보내기.
+
+행을 한 줄씩 파일에 쓴다. xlsx는 xlsxwriter의 constant_memory 모드라 쓴 행을
+바로 임시 파일로 내보내고, CSV는 처음부터 한 줄씩이다. 전 종목을 내보내도
+메모리 사용량은 행 수와 관계없다. pandas는 쓰지 않는다. 웹앱이 pandas를
+임포트하는 곳이 이곳뿐이었는데, 서버리스 콜드 스타트에 1초 안팎이 붙었다.
+
+만든 파일은 (조회 조건, 데이터 버전)별로 디스크에 남겨 두고, 같은 요청이
+오면 다시 만들지 않고 그 파일을 보낸다.
+"""
+
+import csv
+import hashlib
+import os
+import tempfile
+from datetime import datetime
+
+# (키, 머리글, 형식). 형식: text 그대로 / won 천 단위 구분 정수 / pct 소수 둘째 자리 / time 날짜·시각
+MARGIN_COLUMNS = (
+    ('code', '종목코드', 'text'),
+    ('name', '종목명', 'text'),
+    ('current_price', '현재가', 'won'),
+    ('intrinsic_value', '내재가치', 'won'),
+    ('safety_margin', '안전마진', 'pct'),
+    ('treasury_ratio', '자사주비율', 'pct'),
+    ('dividend_yield', '배당수익률', 'pct'),
+    ('last_updated', '마지막 업데이트', 'time'),
+)
+
+NCAV_COLUMNS = (
+    ('code', '종목코드', 'text'),
+    ('name', '종목명', 'text'),
+    ('ncav_ratio', 'NCAV/시가총액', 'pct'),
+    ('ncav', 'NCAV', 'won'),
+    ('marcap', '시가총액', 'won'),
+    ('유동자산', '유동자산', 'won'),
+    ('부채총계', '부채총계', 'won'),
+    ('dividend_yield', '배당수익률', 'pct'),
+    ('bsns_year', '사업연도', 'text'),
+)
+
+MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# 엑셀에서 보이는 형식. 값은 숫자로 넣어 정렬·계산이 되게 한다
+_NUM_FORMATS = {'won': '#,##0', 'pct': '0.00'}
+
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+        return None
+    return value
+
+
+def _time(value):
+    # 크롤러는 ISO 형식으로 저장한다. 알아볼 수 없으면 그대로 둔다
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _cells(row, columns):
+    for key, _, kind in columns:
+        value = row.get(key)
+        if kind in _NUM_FORMATS:
+            yield _number(value), kind
+        elif kind == 'time':
+            yield _time(value), kind
+        else:
+            yield (None if value is None else str(value)), kind
+
+
+def _display_width(value, kind):
+    if value is None:
+        return 0
+    if kind == 'won':
+        return len(f'{value:,.0f}')
+    if kind == 'pct':
+        return len(f'{value:.2f}')
+    # 한글은 영문 두 글자 폭을 차지한다
+    return sum(2 if ord(ch) > 0x2E80 else 1 for ch in value)
+
+
+def write_xlsx(path, sheet_name, columns, rows):
+    """rows를 xlsx로 쓴다. 열 너비는 쓰는 동안 잰 최대 폭에 맞춘다."""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    try:
+        sheet = workbook.add_worksheet(sheet_name)
+        formats = {kind: workbook.add_format({'num_format': fmt}) for kind, fmt in _NUM_FORMATS.items()}
+        widths = [_display_width(title, 'text') for _, title, _ in columns]
+
+        # constant_memory 모드에서는 행을 위에서부터 순서대로 써야 한다
+        for c, (_, title, _) in enumerate(columns):
+            sheet.write_string(0, c, title)
+        for r, row in enumerate(rows, start=1):
+            for c, (value, kind) in enumerate(_cells(row, columns)):
+                if value is None:
+                    continue
+                if kind in formats:
+                    sheet.write_number(r, c, value, formats[kind])
+                else:
+                    sheet.write_string(r, c, value)
+                widths[c] = max(widths[c], _display_width(value, kind))
+
+        for c, width in enumerate(widths):
+            sheet.set_column(c, c, width + 2)
+    finally:
+        workbook.close()
+
+
+def write_csv(path, columns, rows):
+    """rows를 CSV로 쓴다. 엑셀이 한글을 알아보도록 BOM을 붙인다."""
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([title for _, title, _ in columns])
+        for row in rows:
+            writer.writerow(['' if value is None else value for value, _ in _cells(row, columns)])
+
+
+class ExportCache:
+    """만든 파일을 (조회 조건, 데이터 버전)별로 보관하는 디렉터리.
+
+    여러 워커가 같은 파일을 동시에 만들어도 임시 파일에 쓴 뒤 이름을
+    바꾸므로 반쯤 쓴 파일을 보내는 일은 없다.
+    """
+
+    def __init__(self, directory, max_files=64):
+        self.directory = directory
+        self.max_files = max_files
+
+    def path(self, key, fmt):
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:24]
+        return os.path.join(self.directory, f'{digest}.{fmt}')
+
+    def open(self, key, fmt, write):
+        """캐시된 파일을 바이너리 읽기로 연다. 없으면 write(임시 경로)로 만든다.
+
+        경로가 아니라 열린 파일을 돌려준다. 다른 워커의 _prune이 보내기 직전에
+        파일을 지워도 이미 연 파일은 끝까지 읽을 수 있다.
+        """
+        path = self.path(key, fmt)
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            pass
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            write(tmp)
+            f = open(tmp, 'rb')
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._prune()
+        return f
+
+    def _prune(self):
+        # 데이터 버전이 바뀌면 옛 파일은 다시 쓰이지 않는다. 오래된 것부터 지운다
+        # 다른 워커도 같은 디렉터리를 정리하므로 목록을 만든 사이에 지워진 파일은 건너뛴다
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        if len(files) <= self.max_files:
+            return
+        files.sort()
+        for _, path in files[:len(files) - self.max_files]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
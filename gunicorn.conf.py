@@ -0,0 +1,55 @@
+"""gunicorn 설정. Procfile이 이 파일로 웹앱을 띄운다.
+
+preload_app을 켜면 마스터가 워커를 fork하기 전에 결과 데이터를 받아
+파생 뷰까지 만들어 둔다(app.preload_snapshot). 워커는 그것을 copy-on-write로
+공유하므로 워커 수만큼 내려받고 파싱하지 않고, 첫 요청도 Supabase를
+기다리지 않는다. 새 데이터는 마스터가 받아 워커를 차례로 교체하며 넘긴다.
+
+PRELOAD_SNAPSHOT=0 이면 예전처럼 워커마다 따로 받는다.
+워커 수는 gunicorn 기본 규칙대로 WEB_CONCURRENCY 환경변수를 따른다.
+
+/events(SSE)는 연결 하나가 스레드 하나를 계속 붙잡는다. sync 워커로는
+접속자 수만큼 워커가 묶이므로 스레드 워커(gthread)를 쓴다. 스트림이 스레드
+풀을 다 차지하면 API 요청이 그 뒤에 줄을 서므로, 워커마다 스트림은
+EVENTS_MAX_STREAMS(기본 16)개까지만 받고 나머지는 204로 돌려보낸다. 그
+페이지들은 /events/latest를 EVENTS_FALLBACK_POLL초마다 불러 알림을 대신한다.
+threads를 줄이면 그 값도 함께 줄여 API용 스레드를 남겨 둔다. 쉬는 연결
+수천 개를 스레드 없이 붙잡는 것은 이 설정으로는 못 한다. 그러려면
+GUNICORN_WORKER_CLASS=gevent(gevent 설치 필요)로 바꾸고 상한을 올린다.
+"""
+
+import os
+import signal
+
+preload_app = os.getenv('PRELOAD_SNAPSHOT', '1').strip() in ('1', 'true', 'True')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '64'))
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    # preload_app이면 app 모듈은 이미 마스터에 임포트되어 있다
+    import app as web
+    web.preload_snapshot()
+    web.start_snapshot_refresher()
+
+
+def post_worker_init(worker):
+    # 워커가 SIGTERM(교체·종료)을 받으면 열린 SSE 스트림부터 닫는다. 그러지
+    # 않으면 스트림이 graceful_timeout 내내 워커를 붙잡고 있다가 강제로
+    # 끊긴다. 닫힌 브라우저는 retry 뒤 새 워커에 다시 붙는다.
+    import app as web
+    handle_exit = worker.handle_exit
+
+    def on_term(sig, frame):
+        web.close_event_streams()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, on_term)
+
+
+def worker_exit(server, worker):
+    # METRICS_DIR에 남은 이 워커의 지표 파일을 지운다
+    import app as web
+    web.remove_worker_metrics()
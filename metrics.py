@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Prometheus 텍스트 형식 지표 (/metrics).
+
+카운터·게이지·히스토그램만 있는 작은 구현이다. 값을 올리는 쪽(요청 처리
+경로)은 락 한 번과 사전 갱신, 히스토그램이면 이진 탐색 한 번이 전부다.
+
+gunicorn 워커는 프로세스마다 따로 세므로, 스크레이프가 어느 워커에 닿느냐에
+따라 한 워커의 값만 보인다. 모든 시계열에 worker 라벨(pid)을 붙이고,
+METRICS_DIR을 주면 워커마다 주기적으로 자기 값을 그 디렉터리에 써 둔다.
+/metrics를 받은 워커는 자기 값을 새로 쓴 뒤 디렉터리의 모든 워커 값을
+함께 내보낸다. 워커가 재시작되면 그 worker 라벨의 카운터가 새로 시작하고,
+Prometheus의 rate()는 이를 리셋으로 처리한다.
+
+표준 라이브러리만 쓴다.
+"""
+
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+
+_lock = threading.Lock()
+_registry = []
+_collectors = []
+
+# 요청 지연 시간(초) 기본 구간
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# 응답 크기(바이트) 구간
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def _dump(self):
+        return {'kind': self.kind, 'help': self.help, 'labelnames': list(self.labelnames),
+                'values': [[list(k), v] for k, v in self._values.items()]}
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, labels=(), value=0):
+        with _lock:
+            self._values[labels] = value
+
+    def clear(self):
+        with _lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        # 값은 [구간별 개수..., +Inf 개수, 합계]. 누적은 내보낼 때 한다
+        i = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    def _dump(self):
+        dump = super()._dump()
+        dump['buckets'] = list(self.buckets)
+        return dump
+
+
+def on_collect(fn):
+    """내보내기 직전에 부를 함수를 등록한다. 나이처럼 그때 계산할 게이지용."""
+    _collectors.append(fn)
+    return fn
+
+
+def snapshot():
+    """이 프로세스의 모든 지표. JSON으로 쓸 수 있는 형태다."""
+    for fn in _collectors:
+        try:
+            fn()
+        except Exception as e:
+            print(f"⚠️ 지표 수집 실패: {e}", flush=True)
+    with _lock:
+        return {m.name: m._dump() for m in _registry}
+
+
+def reset_after_fork():
+    """fork한 자식은 부모가 센 값을 물려받지 않고 0부터 센다."""
+    global _lock
+    _lock = threading.Lock()
+    for m in _registry:
+        m._values = {}
+
+
+# ── 여러 워커 ──────────────────────────────────────
+def _worker_path(directory, worker):
+    return os.path.join(directory, f'{worker}.json')
+
+
+def write_worker_snapshot(directory, worker, snap=None):
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(snap if snap is not None else snapshot(), f, ensure_ascii=False)
+    os.replace(tmp, _worker_path(directory, worker))
+
+
+def read_worker_snapshots(directory, max_age):
+    """{워커: 스냅샷}. max_age초 넘게 갱신되지 않은 파일(죽은 워커)은 지운다."""
+    snaps = {}
+    now = time.time()
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.unlink(path)
+                continue
+            with open(path, encoding='utf-8') as f:
+                snaps[name[:-5]] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return snaps
+
+
+def remove_worker_snapshot(directory, worker):
+    try:
+        os.unlink(_worker_path(directory, worker))
+    except OSError:
+        pass
+
+
+# ── 텍스트 형식 ────────────────────────────────────
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(snapshots):
+    """{워커: 스냅샷}을 Prometheus 텍스트 형식으로."""
+    names = []
+    for snap in snapshots.values():
+        for name in snap:
+            if name not in names:
+                names.append(name)
+
+    lines = []
+    for name in names:
+        head = next(snap[name] for snap in snapshots.values() if name in snap)
+        lines.append(f'# HELP {name} {head["help"]}')
+        lines.append(f'# TYPE {name} {head["kind"]}')
+        for worker, snap in snapshots.items():
+            metric = snap.get(name)
+            if metric is None:
+                continue
+            labelnames = metric['labelnames']
+            extra = (('worker', worker),)
+            for values, value in metric['values']:
+                if metric['kind'] != 'histogram':
+                    lines.append(f'{name}{_labels(labelnames, values, extra)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric['buckets'] + [float('inf')], value[:-1]):
+                    cumulative += count
+                    le = (('le', _number(float(bound))),)
+                    lines.append(f'{name}_bucket{_labels(labelnames, values, extra + le)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labelnames, values, extra)} {_number(value[-1])}')
+                lines.append(f'{name}_count{_labels(labelnames, values, extra)} {cumulative}')
+    return '\n'.join(lines) + '\n'
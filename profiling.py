@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""필요할 때만 켜는 프로파일링. 웹앱과 크롤러가 함께 쓴다.
+
+세 가지를 제공한다.
+
+- 단계 시간(stage): `with stage('analyze_stock.fetch'):`로 감싼 구간의 횟수·합계·최대.
+  켜지 않았으면 아무것도 재지 않는 공용 객체를 돌려주므로 그대로 둬도 된다.
+  스레드 풀 안의 구간은 스레드마다 더하므로 합계가 벽시계 시간보다 클 수 있다.
+- 스택 샘플러(Sampler): 주기적으로 모든 스레드의 스택을 떠서 collapsed 형식
+  (`스레드;파일:함수;... 횟수`)으로 쓴다. flamegraph.pl·speedscope에 그대로
+  넣을 수 있다. 벽시계 기준이라 네트워크를 기다리는 시간도 보인다.
+- 요청 프로파일(start_request/finish_request): 요청 하나를 cProfile로 재서
+  pstats 파일로 쓴다. `python -m pstats 파일`로 열어 본다.
+
+두 실행을 비교하려면:
+  python profiling.py diff 이전/stages.json 이후/stages.json
+
+표준 라이브러리만 쓴다.
+"""
+
+import cProfile
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+_lock = threading.Lock()
+_stages = None          # 켜면 {이름: [횟수, 합계, 최대]}
+
+
+class _Stage:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        add_stage(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def enable_stages():
+    """단계 시간 기록을 켠다. 이전 기록은 지운다."""
+    global _stages
+    with _lock:
+        _stages = {}
+
+
+def stage(name):
+    """이름 붙은 구간. 기록을 켜지 않았으면 아무것도 하지 않는다."""
+    if _stages is None:
+        return _NO_STAGE
+    return _Stage(name)
+
+
+def add_stage(name, seconds):
+    if _stages is None:
+        return
+    with _lock:
+        row = _stages.get(name)
+        if row is None:
+            _stages[name] = [1, seconds, seconds]
+        else:
+            row[0] += 1
+            row[1] += seconds
+            if seconds > row[2]:
+                row[2] = seconds
+
+
+def stage_report():
+    """{이름: {'count', 'total', 'max'}}. 이름 순이라 실행끼리 줄이 맞는다."""
+    with _lock:
+        rows = dict(_stages or {})
+    return {name: {'count': c, 'total': round(t, 6), 'max': round(m, 6)}
+            for name, (c, t, m) in sorted(rows.items())}
+
+
+def format_stages(report, wall=None):
+    lines = [f"{'단계':<36} {'횟수':>8} {'합계(초)':>10} {'평균(ms)':>10} {'최대(ms)':>10}"]
+    for name, row in report.items():
+        mean = row['total'] / row['count'] * 1000 if row['count'] else 0
+        lines.append(f"{name:<36} {row['count']:>8} {row['total']:>10.2f} {mean:>10.1f} {row['max'] * 1000:>10.1f}")
+    if wall is not None:
+        lines.append(f"전체 경과 {wall:.1f}초 (스레드 풀 안의 단계는 스레드마다 더한 값)")
+    return '\n'.join(lines)
+
+
+# ── 스택 샘플러 ─────────────────────────────────────
+def _thread_group(name):
+    # ThreadPoolExecutor-0_3 같은 이름의 번호를 떼어 같은 풀의 스레드를 한 줄기로 모은다
+    return re.sub(r'[-_]?\d+', '', name) or name
+
+
+class Sampler:
+    """interval초마다 모든 스레드의 스택을 센다."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                stack.append(_thread_group(names.get(ident, 'thread')))
+                self.counts[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+# ── 요청 프로파일 ────────────────────────────────────
+def start_request():
+    """이 스레드에서 cProfile을 켠다. 다른 프로파일러가 이미 돌고 있으면 None."""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+
+# 같은 초에 같은 라우트를 여러 번 재도 파일이 겹치지 않게 붙이는 번호
+_request_seq = itertools.count(1)
+
+
+def finish_request(profiler, directory, label, keep=200):
+    """cProfile을 끄고 pstats 파일로 쓴다. 오래된 파일은 keep개만 남긴다.
+
+    :return: 쓴 파일 이름
+    """
+    profiler.disable()
+    os.makedirs(directory, exist_ok=True)
+    safe = re.sub(r'[^0-9A-Za-z]+', '_', label).strip('_') or 'root'
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{next(_request_seq)}-{safe}.prof'
+    profiler.dump_stats(os.path.join(directory, name))
+    _prune(directory, keep)
+    return name
+
+
+def _prune(directory, keep):
+    files = [os.path.join(directory, n) for n in os.listdir(directory) if n.endswith('.prof')]
+    if len(files) <= keep:
+        return
+    files.sort(key=os.path.getmtime)
+    for path in files[:len(files) - keep]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+# ── 실행 비교 ──────────────────────────────────────
+def diff_stages(before, after):
+    """두 stage_report의 단계별 합계 차이 줄들."""
+    lines = [f"{'단계':<36} {'이전(초)':>10} {'이후(초)':>10} {'변화':>8}"]
+    for name in sorted(set(before) | set(after)):
+        a = before.get(name, {}).get('total', 0)
+        b = after.get(name, {}).get('total', 0)
+        change = f'{(b - a) / a * 100:+.0f}%' if a else '신규'
+        lines.append(f"{name:<36} {a:>10.2f} {b:>10.2f} {change:>8}")
+    return lines
+
+
+def _main(argv):
+    if len(argv) == 3 and argv[0] == 'diff':
+        with open(argv[1], encoding='utf-8') as f:
+            before = json.load(f)['stages']
+        with open(argv[2], encoding='utf-8') as f:
+            after = json.load(f)['stages']
+        print('\n'.join(diff_stages(before, after)))
+        return 0
+    print('사용법: python profiling.py diff 이전/stages.json 이후/stages.json')
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(_main(sys.argv[1:]))
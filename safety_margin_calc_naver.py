@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import requests
-from lxml import html
+from lxml import html, etree
+import numpy as np
 import pandas as pd
 import FinanceDataReader as fdr
 from datetime import datetime, timedelta
@@ -13,13 +13,18 @@ import math
 
 import time
 import threading
-from concurrent.futures import ThreadPoolExecutor
 import pytz
 from dotenv import load_dotenv
 
 # Supabase 입출력은 storage 모듈로 분리되어 있다. 웹앱이 이 크롤러 모듈을
 # 임포트하지 않고도 결과를 내려받을 수 있게 하기 위함이다.
 from storage import upload_to_supabase, download_from_supabase
+# crawl.py --profile일 때만 시간을 잰다. 아니면 stage()는 아무것도 하지 않는다
+from profiling import stage
+from crawl_engine import Engine, BudgetExhausted
+import crawl_http
+import crawl_rate
+from valuation import EPS_FIELDS, BPS_FIELDS, PBR_FIELDS, revalue, safety_margin as margin_of
 
 # 환경 변수 로드
 load_dotenv()
@@ -45,7 +50,13 @@ FUNDAMENTALS_REFRESH_SECONDS = int(os.getenv('FUNDAMENTALS_REFRESH_SECONDS', str
 
 # 네이버 크롤링 동시 요청 수. 너무 올리면 차단당한다.
 CRAWL_WORKERS = int(os.getenv('CRAWL_WORKERS', '6'))
-# 한 묶음을 처리한 뒤 시간 예산을 확인하고 중간 저장한다.
+# wisereport(자사주) 동시 요청 수. 네이버와 따로 센다.
+TREASURY_WORKERS = int(os.getenv('TREASURY_WORKERS', str(CRAWL_WORKERS)))
+# 1이면 위 두 값은 시작값일 뿐이고, 응답 시간·차단 신호를 보고 호스트마다
+# 동시 요청 수를 조절한다(crawl_rate.py). CRAWL_MAX_WORKERS를 넘지는 않는다.
+CRAWL_ADAPTIVE = os.getenv('CRAWL_ADAPTIVE', '1').strip() in ('1', 'true', 'True')
+CRAWL_MAX_WORKERS = int(os.getenv('CRAWL_MAX_WORKERS', '16'))
+# 이만큼 끝날 때마다 중간 저장한다. 시간 예산은 요청마다 확인한다.
 CRAWL_CHUNK = int(os.getenv('CRAWL_CHUNK', '50'))
 
 # (연결, 응답) 타임아웃. 연결이 5초 안에 안 되면 30초를 기다려도 안 된다.
@@ -81,6 +92,25 @@ NCAV_RETRY_SECONDS = int(os.getenv('NCAV_RETRY_SECONDS', str(7 * 86400)))
 NCAV_WORKERS = int(os.getenv('NCAV_WORKERS', '6'))
 NCAV_CHUNK = int(os.getenv('NCAV_CHUNK', '50'))
 
+# 호스트별 동시 요청 상한. 조절하지 않으면 고정값이다.
+# DART는 속도보다 일일 호출 한도가 문제라 조절하지 않는다.
+if CRAWL_ADAPTIVE:
+    NAVER_LIMIT = crawl_rate.limiter('naver', CRAWL_WORKERS, ceiling=CRAWL_MAX_WORKERS)
+    WISEREPORT_LIMIT = crawl_rate.limiter('wisereport', TREASURY_WORKERS, ceiling=CRAWL_MAX_WORKERS)
+else:
+    NAVER_LIMIT, WISEREPORT_LIMIT = CRAWL_WORKERS, TREASURY_WORKERS
+
+# 호스트별 연결 풀. 요청마다 TCP·TLS 연결을 새로 맺지 않고 다시 쓴다.
+# 풀 크기는 각 호스트의 동시 요청 수(조절하면 그 최대값)와 같다.
+NAVER = crawl_http.client('naver', CRAWL_MAX_WORKERS if CRAWL_ADAPTIVE else CRAWL_WORKERS,
+                          {'User-Agent': 'Mozilla/5.0'},
+                          controller=NAVER_LIMIT if CRAWL_ADAPTIVE else None)
+WISEREPORT = crawl_http.client('wisereport', CRAWL_MAX_WORKERS if CRAWL_ADAPTIVE else TREASURY_WORKERS, {
+    'Referer': 'https://finance.naver.com',
+    'User-Agent': 'Mozilla/5.0',
+}, controller=WISEREPORT_LIMIT if CRAWL_ADAPTIVE else None)
+DART = crawl_http.client('dart', NCAV_WORKERS)
+
 def load_krx_stocks(force: bool = False):
     """KRX 종목 목록을 파일에서 로드하거나 업데이트
 
@@ -111,7 +141,8 @@ def load_krx_stocks(force: bool = False):
 
     # 파일이 없거나 하루가 지났다면 새로 다운로드 시도
     try:
-        new_stocks = fdr.StockListing('KRX')
+        with stage('load_krx_stocks.download'):
+            new_stocks = fdr.StockListing('KRX')
         if new_stocks is not None and len(new_stocks) > 0:
             # 필요한 컬럼만 유지
             # Close(종가)와 Volume(거래량)까지 보존한다. 이 한 번의 응답에
@@ -120,8 +151,8 @@ def load_krx_stocks(force: bool = False):
             keep = [c for c in ('Code', 'Name', 'Marcap', 'Close', 'Volume')
                     if c in new_stocks.columns]
             KRX_STOCKS = new_stocks[keep].copy()
-            with open(KRX_STOCKS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(KRX_STOCKS.to_dict('records'), f, ensure_ascii=False)
+            with stage('load_krx_stocks.json_dump'), open(KRX_STOCKS_FILE, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(KRX_STOCKS.to_dict('records'), ensure_ascii=False))
             print(f"KRX 종목 목록 다운로드 완료: {len(KRX_STOCKS)}개 종목")
         else:
             if KRX_STOCKS is not None:
@@ -158,23 +189,21 @@ def get_treasury_stock_info(ticker: str) -> dict:
 
     try:
         url = f"https://navercomp.wisereport.co.kr/v2/company/c1010001.aspx?cmp_cd={ticker}"
-        headers = {
-            'Referer': 'https://finance.naver.com',
-            'User-Agent': 'Mozilla/5.0'
-        }
-        resp = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
-        resp.raise_for_status()
-        
-        doc = html.fromstring(resp.text)
-        
-        # 자사주 행 찾기
-        treasury_rows = doc.xpath("//tr[contains(., '자사주')]")
-        if not treasury_rows:
-            return {'shares': 0, 'ratio': 0}
-            
-        # 자사주 행에서 주식수와 지분율 추출
-        shares_node = treasury_rows[0].xpath(".//td[2]")  # 주식수는 두 번째 열
-        ratio_node = treasury_rows[0].xpath(".//td[3]")   # 지분율은 세 번째 열
+        with stage('analyze_stock.treasury_fetch'):
+            resp = WISEREPORT.get(url, timeout=REQUEST_TIMEOUT)
+            resp.raise_for_status()
+
+        with stage('analyze_stock.treasury_parse'):
+            doc = html.fromstring(resp.text)
+
+            # 자사주 행 찾기
+            treasury_rows = doc.xpath("//tr[contains(., '자사주')]")
+            if not treasury_rows:
+                return {'shares': 0, 'ratio': 0}
+
+            # 자사주 행에서 주식수와 지분율 추출
+            shares_node = treasury_rows[0].xpath(".//td[2]")  # 주식수는 두 번째 열
+            ratio_node = treasury_rows[0].xpath(".//td[3]")   # 지분율은 세 번째 열
         
         shares = 0
         ratio = 0
@@ -209,29 +238,32 @@ def get_treasury_stock_info(ticker: str) -> dict:
         return {'shares': 0, 'ratio': 0}
 
 
-def calculate_intrinsic_value(df: pd.DataFrame, treasury_stock_info: dict = None) -> float:
+def calculate_intrinsic_value(eps: tuple, bps: tuple, treasury_stock_info: dict = None) -> float:
     """
     내재가치를 계산합니다.
     BPS와 EPS의 가중평균의 평균을 사용합니다.
     EPS 가중평균 = (최근년도EPS*3 + 전년도EPS*2 + 전전년도EPS*1) / 6
     
     자사주가 있는 경우, 내재가치는 100/(100-자사주비율)을 곱하여 조정됩니다.
-    자사주가 없는 경우(ratio=0)는 조정하지 않습니다.
+    자사주가 없는 경우(ratio=0)는 조정하지 않습니다. 비율이 100% 이상이면
+    잘못 긁힌 값이므로 NaN입니다 (valuation.intrinsic_values와 같은 규칙).
+
+    :param eps: (3년전, 2년전, 직전년도) EPS. 없는 값은 None
+    :param bps: 같은 순서의 BPS
     """
-    if df.empty:
+    if not eps or len(eps) != 3:
         return None
-        
-    if df['EPS'].isna().any() and df['BPS'].isna().any() :
-        return None
-    # EPS 가중평균 계산
-    eps_values = df['EPS'].values
-    if len(eps_values) != 3:
+
+    # EPS와 BPS 양쪽에 빈 값이 있을 때만 포기한다. 한쪽만 비면 결과가 NaN이 되고,
+    # 저장된 결과와 웹앱은 그 NaN을 '계산 불가'로 다룬다
+    if None in eps and None in bps:
         return None
-        
+    eps_values = [math.nan if v is None else v for v in eps]
+
     weighted_eps = (eps_values[2] * 3 + eps_values[1] * 2 + eps_values[0] * 1) / 6
     
     # BPS는 최근년도 값 사용
-    latest_bps = df['BPS'].values[-1]
+    latest_bps = math.nan if bps[-1] is None else bps[-1]
     
     # 내재가치 = (EPS 가중평균 + BPS) / 2
     intrinsic_value = (weighted_eps*10 + latest_bps) / 2
@@ -239,6 +271,8 @@ def calculate_intrinsic_value(df: pd.DataFrame, treasury_stock_info: dict = None
     # 자사주 비율이 있는 경우에만 내재가치 조정
     if treasury_stock_info and treasury_stock_info.get('ratio', 0) > 0:
         treasury_ratio = treasury_stock_info['ratio']
+        if treasury_ratio >= 100:
+            return math.nan
         # 내재가치 = 기존내재가치 * (100 / (100 - 자사주비율))
         intrinsic_value = intrinsic_value * (100 / (100 - treasury_ratio))
     
@@ -275,103 +309,155 @@ def search_stock_codes(company_name: str) -> list:
 
 
 
-def analyze_stock(ticker: str) -> dict:
-    """
-    종목코드를 입력받아 내재가치와 안전마진을 계산하여 반환합니다.
-    main.naver 1회 + wisereport 1회 = 총 2회 요청으로 모든 데이터를 수집합니다.
-    """
+# main.naver에서 필요한 노드의 위치. 한 번만 컴파일해 두고 종목마다 다시 쓴다.
+# id()는 파서가 만들어 둔 id 색인을 찾으므로 문서를 훑지 않는다('//*[@id=...]'는
+# 요소 수천 개를 매번 다 본다). 나머지는 찾은 노드 아래만 본다.
+_PAGE_ANCHORS = etree.XPath('id("middle chart_area _dvr content")')
+_STOCK_NAME = etree.XPath('div[1]/div[1]/h2/a')                                   # #middle 아래
+_PRICE = etree.XPath('.//p[contains(@class,"no_today")]/em/span[contains(@class,"blind")]')  # #chart_area 아래
+_FINANCE_TABLE = etree.XPath('div[5]/div[1]/table/tbody')                         # #content 아래
+
+# 기업실적분석 표에서 읽을 행(1부터)과 열. 열은 3년전, 2년전, 직전년도 순이다
+FINANCIAL_PERIODS = ("3년전", "2년전", "직전년도")
+_FINANCIAL_ROWS = (('EPS', 10), ('BPS', 12), ('PBR', 13))
+
+
+def _cell_number(cell):
+    txt = cell.text_content().strip().replace(",", "").replace("−", "-")
     try:
-        headers = {"User-Agent": "Mozilla/5.0"}
+        return float(txt) if '.' in txt else int(txt)
+    except ValueError:
+        return None
+
+
+def _parse_financials(content) -> dict:
+    """{'EPS': (3년전, 2년전, 직전년도), 'BPS': ..., 'PBR': ...}. 없는 칸은 None."""
+    empty = (None,) * len(FINANCIAL_PERIODS)
+    tbody = _FINANCE_TABLE(content) if content is not None else None
+    if not tbody:
+        return {name: empty for name, _ in _FINANCIAL_ROWS}
+    rows = [child for child in tbody[0] if child.tag == 'tr']
+    financials = {}
+    for name, index in _FINANCIAL_ROWS:
+        if index > len(rows):
+            financials[name] = empty
+            continue
+        cells = [child for child in rows[index - 1] if child.tag == 'td'][:len(FINANCIAL_PERIODS)]
+        values = tuple(_cell_number(cell) for cell in cells)
+        financials[name] = values + empty[len(values):]
+    return financials
+
+
+def fetch_stock_page(ticker: str) -> dict:
+    """main.naver 한 번으로 종목명·현재가·배당수익률·재무지표(PBR·EPS·BPS)를 얻는다.
 
-        # 1) main.naver 한 번만 요청 (lxml)
-        url = f"https://finance.naver.com/item/main.naver?code={ticker}"
-        resp = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    재무지표는 {'EPS': (3년전, 2년전, 직전년도), 'BPS': ..., 'PBR': ...} 꼴이다.
+    요청이나 파싱이 실패하면 예외를 그대로 올린다.
+    """
+    url = f"https://finance.naver.com/item/main.naver?code={ticker}"
+    with stage('analyze_stock.fetch'):
+        resp = NAVER.get(url, timeout=REQUEST_TIMEOUT)
         resp.raise_for_status()
+
+    with stage('analyze_stock.parse'):
         doc = html.fromstring(resp.text)
+        anchors = {}
+        for node in _PAGE_ANCHORS(doc):
+            anchors.setdefault(node.get('id'), node)
 
         # 종목명
-        stock_name_node = doc.xpath('//*[@id="middle"]/div[1]/div[1]/h2/a')
-        stock_name = stock_name_node[0].text_content().strip() if stock_name_node else "Unknown"
+        stock_name = "Unknown"
+        middle = anchors.get('middle')
+        if middle is not None:
+            stock_name_node = _STOCK_NAME(middle)
+            if stock_name_node:
+                stock_name = stock_name_node[0].text_content().strip()
 
         # 현재가
         current_price = None
-        price_node = doc.xpath('//*[@id="chart_area"]//p[contains(@class,"no_today")]/em/span[contains(@class,"blind")]')
+        chart_area = anchors.get('chart_area')
+        price_node = _PRICE(chart_area) if chart_area is not None else None
         if price_node:
             current_price = float(price_node[0].text_content().strip().replace(',', ''))
 
         # 배당수익률
         dividend_yield = None
-        try:
-            dvr_node = doc.xpath('//*[@id="_dvr"]')
-            if dvr_node:
-                dvr_text = dvr_node[0].text_content().strip()
-                if dvr_text and dvr_text != 'N/A':
+        dvr_node = anchors.get('_dvr')
+        if dvr_node is not None:
+            dvr_text = dvr_node.text_content().strip()
+            if dvr_text and dvr_text != 'N/A':
+                try:
                     dividend_yield = float(dvr_text.replace('%', ''))
-        except:
-            pass
+                except ValueError:
+                    pass
 
         # 재무지표 (PBR, EPS, BPS) — 같은 doc에서 추출
-        def extract(xpath: str):
-            node = doc.xpath(xpath)
-            if not node:
-                return None
-            txt = node[0].text_content().strip().replace(",", "").replace("−", "-")
-            try:
-                return float(txt) if '.' in txt else int(txt)
-            except ValueError:
-                return None
-
-        periods = ["3년전", "2년전", "직전년도"]
-        data = {
-            "PBR": [
-                extract('//*[@id="content"]/div[5]/div[1]/table/tbody/tr[13]/td[1]'),
-                extract('//*[@id="content"]/div[5]/div[1]/table/tbody/tr[13]/td[2]'),
-                extract('//*[@id="content"]/div[5]/div[1]/table/tbody/tr[13]/td[3]'),
-            ],
-            "EPS": [
-                extract('//*[@id="content"]/div[5]/div[1]/table/tbody/tr[10]/td[1]'),
-                extract('//*[@id="content"]/div[5]/div[1]/table/tbody/tr[10]/td[2]'),
-                extract('//*[@id="content"]/div[5]/div[1]/table/tbody/tr[10]/td[3]'),
-            ],
-            "BPS": [
-                extract('//*[@id="content"]/div[5]/div[1]/table/tbody/tr[12]/td[1]'),
-                extract('//*[@id="content"]/div[5]/div[1]/table/tbody/tr[12]/td[2]'),
-                extract('//*[@id="content"]/div[5]/div[1]/table/tbody/tr[12]/td[3]'),
-            ]
-        }
-        df = pd.DataFrame(data, index=periods)
+        financials = _parse_financials(anchors.get('content'))
 
-        # 2) 자사주 정보 (wisereport — 별도 요청)
-        treasury_stock = get_treasury_stock_info(ticker)
+    return {
+        'stock_name': stock_name,
+        'current_price': current_price,
+        'dividend_yield': dividend_yield,
+        'financials': financials,
+    }
+
+
+def build_stock_result(page: dict, treasury_stock: dict) -> dict:
+    """fetch_stock_page와 get_treasury_stock_info의 결과로 내재가치·안전마진을 계산한다."""
+    with stage('analyze_stock.compute'):
+        financials = page['financials']
+        current_price = page['current_price']
 
         # 내재가치 계산
-        intrinsic_value = calculate_intrinsic_value(df, treasury_stock)
+        intrinsic_value = calculate_intrinsic_value(financials['EPS'], financials['BPS'], treasury_stock)
 
-        # 안전마진 계산
-        safety_margin = None
-        if current_price and intrinsic_value:
-            safety_margin = ((intrinsic_value - current_price) / current_price) * 100
+        # 안전마진 계산. 매 실행 끝의 revalue와 같은 규칙이다 (내재가치 0이면 -100)
+        safety_margin = margin_of(intrinsic_value, current_price)
 
         # 재무지표 데이터 포맷팅
-        historical_data = {}
-        for _, row in df.iterrows():
-            historical_data[row.name] = {
-                'PBR': float(row['PBR']) if not pd.isna(row['PBR']) else None,
-                'EPS': float(row['EPS']) if not pd.isna(row['EPS']) else None,
-                'BPS': float(row['BPS']) if not pd.isna(row['BPS']) else None
+        historical_data = {
+            period: {
+                name: None if financials[name][i] is None else float(financials[name][i])
+                for name in ('PBR', 'EPS', 'BPS')
             }
-
-        return {
-            'stock_name': stock_name,
-            'current_price': current_price,
-            'intrinsic_value': intrinsic_value,
-            'safety_margin': safety_margin,
-            'treasury_shares': treasury_stock.get('shares', 0),
-            'treasury_ratio': treasury_stock.get('ratio', 0),
-            'dividend_yield': dividend_yield,
-            'historical_data': historical_data
+            for i, period in enumerate(FINANCIAL_PERIODS)
         }
 
+    return {
+        'stock_name': page['stock_name'],
+        'current_price': current_price,
+        'intrinsic_value': intrinsic_value,
+        'safety_margin': safety_margin,
+        'treasury_shares': treasury_stock.get('shares', 0),
+        'treasury_ratio': treasury_stock.get('ratio', 0),
+        'dividend_yield': page['dividend_yield'],
+        'historical_data': historical_data
+    }
+
+
+def analyze_stock(ticker: str) -> dict:
+    """
+    종목코드를 입력받아 내재가치와 안전마진을 계산하여 반환합니다.
+    main.naver 1회 + wisereport 1회 = 총 2회 요청으로 모든 데이터를 수집합니다.
+    """
+    try:
+        page = fetch_stock_page(ticker)
+        # 자사주 정보 (wisereport — 별도 요청)
+        treasury_stock = get_treasury_stock_info(ticker)
+        return build_stock_result(page, treasury_stock)
+    except Exception as e:
+        print(f"종목 {ticker} 분석 중 오류 발생: {e}")
+        return {'error': str(e)}
+
+
+async def analyze_stock_async(engine, ticker: str) -> dict:
+    """analyze_stock과 같은 결과. 두 요청이 각 호스트의 동시 요청 상한을 따로 따른다."""
+    try:
+        page = await engine.call('naver', fetch_stock_page, ticker)
+        treasury_stock = await engine.call('wisereport', get_treasury_stock_info, ticker)
+        return build_stock_result(page, treasury_stock)
+    except BudgetExhausted:
+        raise
     except Exception as e:
         print(f"종목 {ticker} 분석 중 오류 발생: {e}")
         return {'error': str(e)}
@@ -425,7 +511,7 @@ def load_results_data() -> list:
         # 로컬에도 저장
         try:
             with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False)
+                f.write(json.dumps(data, ensure_ascii=False))
             print(f"📁 Supabase에서 다운로드 후 로컬 저장 완료")
         except Exception as e:
             print(f"⚠️ 로컬 저장 실패: {e}")
@@ -441,14 +527,16 @@ def save_results_data(results: list, upload: bool = True):
     """
     # 로컬 저장
     try:
-        with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False)
+        # json.dump는 C 인코더를 쓰지 않고 조각마다 write한다. dumps로 한 번에 쓰면 몇 배 빠르다
+        with stage('json_dump'), open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(results, ensure_ascii=False))
     except Exception as e:
         print(f"⚠️ 로컬 저장 실패: {e}")
 
     # Supabase Storage 업로드
     if upload:
-        upload_to_supabase(RESULTS_FILE, results)
+        with stage('upload'):
+            upload_to_supabase(RESULTS_FILE, results)
 
 def get_latest_trading_date() -> str:
     """KRX 종가 데이터가 실제로 어느 거래일 것인지 반환한다 ('YYYY-MM-DD').
@@ -534,11 +622,11 @@ def refresh_prices(results_dict: dict, current_time) -> int:
         return 0
 
     has_volume = 'Volume' in KRX_STOCKS.columns
-    updated = 0
     stamp = current_time.isoformat()
 
     # 종가가 실제로 어느 거래일 것인지. 휴장일에 돌면 직전 거래일이 나온다.
-    trading_date = get_latest_trading_date()
+    with stage('refresh_prices.trading_date'):
+        trading_date = get_latest_trading_date()
 
     # 상류(fdr)의 KRX 목록은 장중에도 30~60분마다 갱신되므로 정규장 중에
     # 실행하면 Close 자리에 확정 종가가 아니라 그 시점의 체결가가 들어온다.
@@ -551,38 +639,51 @@ def refresh_prices(results_dict: dict, current_time) -> int:
     kind = '장중 시세' if intraday else '종가'
     print(f"📅 {kind} 기준일: {trading_date or '확인 실패'}", flush=True)
 
-    for row in KRX_STOCKS.itertuples(index=False):
-        stock = results_dict.get(row.Code)
-        if stock is None:
-            continue
+    # KRX 목록과 기존 결과를 종목코드로 맞춘다. 종목마다 dict를 고치는 일은
+    # 남지만 숫자 변환·검사·안전마진 계산은 컬럼 단위로 한 번에 한다.
+    krx = KRX_STOCKS.drop_duplicates('Code', keep='last')
+    krx = krx[krx['Code'].isin(list(results_dict))]
+    prices = pd.to_numeric(krx['Close'], errors='coerce').to_numpy(dtype=np.float64)
+    valid = prices > 0                          # 숫자가 아니거나(NaN) 0 이하면 건너뛴다
+    codes = krx['Code'].to_numpy()[valid].tolist()
+    prices = prices[valid]
+    if has_volume:
+        volumes = pd.to_numeric(krx['Volume'], errors='coerce').to_numpy(dtype=np.float64)[valid].tolist()
+    else:
+        volumes = [None] * len(codes)
 
-        try:
-            price = float(row.Close)
-        except (TypeError, ValueError):
-            continue
-        if price <= 0:
-            continue
+    # 내재가치는 저장된 값. None·NaN이면 안전마진도 NaN이 되고, 그 종목은 안전마진을 건드리지 않는다
+    intrinsic = np.array([results_dict[code].get('intrinsic_value') for code in codes], dtype=np.float64)
+    margins = (intrinsic - prices) / prices * 100
 
+    for code, price, volume, margin in zip(codes, prices.tolist(), volumes, margins.tolist()):
+        stock = results_dict[code]
         stock['current_price'] = price
         stock['price_updated'] = stamp      # 가져온 시각
         if trading_date:
             stock['price_date'] = trading_date   # 그 주가가 속한 거래일
         if has_volume:
-            try:
-                stock['volume'] = int(row.Volume)
-            except (TypeError, ValueError):
-                stock['volume'] = None
-
-        iv = stock.get('intrinsic_value')
-        if iv is not None and not (isinstance(iv, float) and math.isnan(iv)):
-            stock['safety_margin'] = ((iv - price) / price) * 100
-
-        updated += 1
+            stock['volume'] = None if math.isnan(volume) else int(volume)
+        if not math.isnan(margin):
+            stock['safety_margin'] = margin
+    updated = len(codes)
 
     print(f"💰 주가 갱신: {updated}개 종목 (네트워크 요청 0회)", flush=True)
     return updated
 
 
+# 재무지표를 긁은 적 없는(또는 시각을 읽을 수 없는) 종목의 갱신 시각
+_NEVER_UPDATED = datetime(2000, 1, 1, tzinfo=pytz.timezone("Asia/Seoul")).timestamp()
+
+
+def _fundamentals_updated_at(stock) -> float:
+    """재무지표를 마지막으로 긁은 시각(유닉스 초)."""
+    try:
+        return datetime.fromisoformat(stock['last_updated']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return _NEVER_UPDATED  # 파싱 불가하면 다시 크롤링
+
+
 def analyze_all_stocks(limit: int = 30, time_budget_seconds: int = None,
                        price_only: bool = False) -> list:
     """
@@ -609,38 +710,37 @@ def analyze_all_stocks(limit: int = 30, time_budget_seconds: int = None,
     print(f"\n📊 전체 {total_stocks}개 종목 분석 시작...", flush=True)
 
     # 기존 결과 로드 (로컬 또는 Supabase)
-    existing_results = load_results_data()
+    with stage('load_results'):
+        existing_results = load_results_data()
 
     # dict로 변환하여 빠른 조회 및 업데이트
     results_dict = {item['code']: item for item in existing_results}
 
-    stock_list = [(row['Code'], row['Name']) for _, row in KRX_STOCKS.iterrows()]
-    
-    # 오래된 종목부터 업데이트하기 위해 last_updated 기준으로 정렬
-    stock_update_times = []
-    for code, name in stock_list:
-        existing_stock = results_dict.get(code)
-        if existing_stock and 'last_updated' in existing_stock:
-            last_updated = datetime.fromisoformat(existing_stock['last_updated'])
-        else:
-            # 업데이트된 적 없는 종목은 매우 오래된 시간으로 설정
-            last_updated = datetime(2000, 1, 1, tzinfo=pytz.timezone("Asia/Seoul"))
-        stock_update_times.append((code, name, last_updated))
-    
-    # 오래된 순서로 정렬
-    stock_update_times.sort(key=lambda x: x[2])
-    stock_list = [(code, name) for code, name, _ in stock_update_times]
-
     kst = pytz.timezone("Asia/Seoul")
     current_time = datetime.now(kst)
 
+    with stage('order_stocks'):
+        # 기존 결과의 재무지표 갱신 시각(초)을 KRX 목록에 붙이고, 오래된 종목부터
+        # 업데이트하기 위해 그 기준으로 정렬한다. 시각 문자열은 종목마다 한 번만 읽는다
+        updated_view = pd.DataFrame({
+            'Code': list(results_dict),
+            'updated_at': [_fundamentals_updated_at(s) for s in results_dict.values()],
+        })
+        krx = KRX_STOCKS[['Code', 'Name']].merge(updated_view, on='Code', how='left', sort=False)
+        # 업데이트된 적 없는 종목은 매우 오래된 시간으로 설정
+        krx['updated_at'] = krx['updated_at'].fillna(_NEVER_UPDATED)
+        krx = krx.sort_values('updated_at', kind='stable')
+        stock_list = list(zip(krx['Code'].tolist(), krx['Name'].tolist()))
+        updated_at = krx['updated_at'].to_numpy()
+
     # ── 0단계: 상장폐지 종목 정리 ─────────────────────────
     pruned = prune_delisted(results_dict, set(KRX_STOCKS['Code']))
 
     # ── 1단계: 주가 갱신 (네트워크 요청 0회) ──────────────
     # 이미 받아둔 KRX 목록에 전 종목 종가가 들어 있다. 매일 바뀌는 건
     # 주가뿐이므로 전 종목을 여기서 한 번에 최신화한다.
-    price_updated = refresh_prices(results_dict, current_time)
+    with stage('refresh_prices'):
+        price_updated = refresh_prices(results_dict, current_time)
 
     # ── 2단계: 재무지표 크롤링 (느림, 나눠서 진행) ────────
     # EPS·BPS는 분기마다 바뀌므로 FUNDAMENTALS_REFRESH_SECONDS 주기로만
@@ -651,50 +751,26 @@ def analyze_all_stocks(limit: int = 30, time_budget_seconds: int = None,
         skipped_count = len(stock_list)
         print(f"⏩ 주가 전용 모드 → 재무지표 크롤링 건너뜀 ({skipped_count}개)", flush=True)
     else:
-        for code, name in stock_list:
-            existing_stock = results_dict.get(code)
-            if existing_stock and 'last_updated' in existing_stock:
-                try:
-                    last_updated = datetime.fromisoformat(existing_stock['last_updated'])
-                    if (current_time - last_updated).total_seconds() < FUNDAMENTALS_REFRESH_SECONDS:
-                        skipped_count += 1
-                        continue
-                except ValueError:
-                    pass  # 파싱 불가하면 다시 크롤링
-            to_crawl.append((code, name))
+        fresh = (current_time.timestamp() - updated_at) < FUNDAMENTALS_REFRESH_SECONDS
+        to_crawl = [item for item, skip in zip(stock_list, fresh.tolist()) if not skip]
+        skipped_count = len(stock_list) - len(to_crawl)
 
         print(f"🔎 재무지표 크롤링 대상 {len(to_crawl)}개 "
               f"(최신이라 건너뜀 {skipped_count}개), 동시 {CRAWL_WORKERS}개", flush=True)
 
     reset_treasury_circuit()
 
-    def _safe_analyze(item):
-        code, name = item
-        try:
-            return code, name, analyze_stock(code)
-        except Exception as e:
-            print(f"❗ 종목 {code} ({name}) 분석 중 오류: {type(e).__name__}", flush=True)
-            return code, name, None
-
     analyzed_count = 0
-    budget_exhausted = False
-
-    # 묶음 단위로 처리한다. 묶음이 끝날 때마다 시간 예산을 확인하고 저장하므로
-    # 스레드 간 락 없이도 결과 병합이 안전하다.
-    for start in range(0, len(to_crawl), CRAWL_CHUNK):
-        if time_budget_seconds is not None and (time.monotonic() - started_at) > time_budget_seconds:
-            budget_exhausted = True
-            print(f"⏱️ 시간 예산 {time_budget_seconds}초 소진 → 재무지표 {analyzed_count}개 갱신 후 중단", flush=True)
-            break
-
-        chunk = to_crawl[start:start + CRAWL_CHUNK]
-        with ThreadPoolExecutor(max_workers=CRAWL_WORKERS) as pool:
-            outcomes = list(pool.map(_safe_analyze, chunk))
-
-        done_names = []
-        for code, name, result in outcomes:
-            if not result or result.get('error'):
-                continue
+    finished = 0
+    last_checkpoint = 0
+
+    # 끝난 종목은 바로 여기로 온다. 엔진이 루프 스레드에서 하나씩 부르므로
+    # 락 없이 병합해도 안전하다.
+    def merge(item, result):
+        nonlocal analyzed_count, finished, last_checkpoint
+        code, name = item
+        finished += 1
+        if result and not result.get('error'):
             # 주가 관련 필드는 1단계에서 refresh_prices()가 KRX 기준으로 이미
             # 채워 놓았다. 여기서 통째로 새 dict를 만들면 price_date와
             # price_updated가 사라져, 재크롤링된 종목만 갱신 시각 표시를 잃는다.
@@ -706,9 +782,17 @@ def analyze_all_stocks(limit: int = 30, time_budget_seconds: int = None,
                 'name': result['stock_name'],
                 'intrinsic_value': result['intrinsic_value'],
                 'treasury_ratio': result['treasury_ratio'],
+                'treasury_shares': result['treasury_shares'],
                 'dividend_yield': result['dividend_yield'],
                 'last_updated': current_time.isoformat(),
             })
+            # 내재가치의 원재료. 공식이 바뀌면 valuation.revalue가 재크롤링 없이
+            # 이 값들로 다시 계산한다
+            for i, period in enumerate(FINANCIAL_PERIODS):
+                year = result['historical_data'][period]
+                entry[EPS_FIELDS[i]] = year['EPS']
+                entry[BPS_FIELDS[i]] = year['BPS']
+                entry[PBR_FIELDS[i]] = year['PBR']
 
             # KRX 주가가 없던 신규 종목만 크롤링으로 얻은 주가를 쓴다.
             if not entry.get('current_price'):
@@ -716,31 +800,52 @@ def analyze_all_stocks(limit: int = 30, time_budget_seconds: int = None,
                 entry['price_updated'] = current_time.isoformat()
 
             # 내재가치가 바뀌었으므로 안전마진을 현재 주가 기준으로 다시 계산한다.
-            iv, price = entry.get('intrinsic_value'), entry.get('current_price')
-            if iv is not None and not (isinstance(iv, float) and math.isnan(iv)) and price:
-                entry['safety_margin'] = ((iv - price) / price) * 100
-            else:
-                entry['safety_margin'] = result['safety_margin']
+            margin = margin_of(entry.get('intrinsic_value'), entry.get('current_price'))
+            entry['safety_margin'] = result['safety_margin'] if margin is None else margin
 
             results_dict[code] = entry
             analyzed_count += 1
-            done_names.append(result['stock_name'])
 
-        # 묶음마다 로컬 저장 (디스크 I/O, 대역폭 없음)
+        if finished % CRAWL_CHUNK:
+            return
+        # CRAWL_CHUNK개가 끝날 때마다 로컬 저장 (디스크 I/O, 대역폭 없음)
         results = sorted(results_dict.values(), key=margin_key, reverse=True)
-        with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False)
+        with stage('json_dump'), open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(results, ensure_ascii=False))
         elapsed = int(time.monotonic() - started_at)
-        print(f"💾 [{min(start + CRAWL_CHUNK, len(to_crawl))}/{len(to_crawl)}] "
-              f"{elapsed}초 경과, 이번 묶음 {len(done_names)}개 성공", flush=True)
+        print(f"💾 [{finished}/{len(to_crawl)}] {elapsed}초 경과, 누적 {analyzed_count}개 성공", flush=True)
 
         # 일정 개수마다 Supabase 체크포인트 (재시작 대비)
-        if analyzed_count and analyzed_count % SUPABASE_CHECKPOINT_EVERY < CRAWL_CHUNK:
-            upload_to_supabase(RESULTS_FILE, list(results_dict.values()))
+        if analyzed_count - last_checkpoint >= SUPABASE_CHECKPOINT_EVERY:
+            last_checkpoint = analyzed_count
+            with stage('upload'):
+                upload_to_supabase(RESULTS_FILE, list(results_dict.values()))
+
+    async def work(engine, item):
+        return await analyze_stock_async(engine, item[0])
+
+    deadline = started_at + time_budget_seconds if time_budget_seconds is not None else None
+    engine = Engine({'naver': NAVER_LIMIT, 'wisereport': WISEREPORT_LIMIT}, deadline)
+    with stage('analyze_stock.pipeline'):
+        unstarted = engine.run(to_crawl, work, merge)
+    budget_exhausted = unstarted > 0
+    if budget_exhausted:
+        print(f"⏱️ 시간 예산 {time_budget_seconds}초 소진 → 재무지표 {analyzed_count}개 갱신 후 중단 "
+              f"(남은 {unstarted}개는 다음 실행에서)", flush=True)
+
+    # ── 3단계: 내재가치·안전마진 재계산 (전 종목 한 번에) ──
+    # 원재료(연도별 EPS·BPS, 자사주 비율)가 저장된 종목은 지금 공식과 지금
+    # 주가로 다시 계산한다. 공식을 고친 뒤 첫 실행(PRICE_ONLY 포함)에 전
+    # 종목이 바뀐다.
+    with stage('valuation'):
+        valued_at = time.perf_counter()
+        revalued, revalue_changed = revalue(results_dict.values())
+        print(f"🧮 내재가치 재계산: {revalued}개 (바뀐 종목 {revalue_changed}개, "
+              f"{(time.perf_counter() - valued_at) * 1000:.1f}ms)", flush=True)
 
     # 최종 저장. 주가든 재무지표든 바뀐 게 있으면 업로드한다.
     results = sorted(results_dict.values(), key=margin_key, reverse=True)
-    changed = analyzed_count > 0 or price_updated > 0 or pruned > 0
+    changed = analyzed_count > 0 or price_updated > 0 or pruned > 0 or revalue_changed > 0
     if not changed:
         print("⏩ 변경된 내용 없음 → Supabase 업로드 생략", flush=True)
         save_results_data(results, upload=False)
@@ -772,7 +877,7 @@ def load_corp_code_map() -> dict:
         import zipfile, io
         from lxml import etree
 
-        resp = requests.get(
+        resp = DART.get(
             'https://opendart.fss.or.kr/api/corpCode.xml',
             params={'crtfc_key': DART_API_KEY},
             timeout=60
@@ -798,17 +903,18 @@ def load_corp_code_map() -> dict:
 def get_dart_financial(corp_code: str, bsns_year: int, reprt_code: str = '11011') -> dict:
     """DART API로 단일회사 주요계정 조회"""
     try:
-        resp = requests.get(
-            'https://opendart.fss.or.kr/api/fnlttSinglAcnt.json',
-            params={
-                'crtfc_key': DART_API_KEY,
-                'corp_code': corp_code,
-                'bsns_year': str(bsns_year),
-                'reprt_code': reprt_code
-            },
-            timeout=REQUEST_TIMEOUT
-        )
-        data = resp.json()
+        with stage('ncav.fetch'):
+            resp = DART.get(
+                'https://opendart.fss.or.kr/api/fnlttSinglAcnt.json',
+                params={
+                    'crtfc_key': DART_API_KEY,
+                    'corp_code': corp_code,
+                    'bsns_year': str(bsns_year),
+                    'reprt_code': reprt_code
+                },
+                timeout=REQUEST_TIMEOUT
+            )
+            data = resp.json()
         if data.get('status') == '000':
             return data
         return None
@@ -817,48 +923,70 @@ def get_dart_financial(corp_code: str, bsns_year: int, reprt_code: str = '11011'
         return None
 
 
-def get_latest_financial(corp_code: str) -> dict:
-    """가장 최근 사업보고서의 재무상태표 데이터를 반환"""
+def _financial_years() -> range:
+    """사업보고서를 찾아볼 연도들 (최근부터 최대 3년)."""
     now = datetime.now()
     # 사업보고서는 보통 3월 말까지 공시 → 4월부터 전년도 사용 가능
     if now.month >= 4:
         start_year = now.year - 1
     else:
         start_year = now.year - 2
+    return range(start_year, start_year - 3, -1)
+
+
+def parse_balance_sheet(data: dict, year: int) -> dict:
+    """주요계정 응답에서 NCAV에 쓰는 재무상태표 항목. 유동자산·부채총계가 없으면 None."""
+    # 연결재무제표 우선, 없으면 별도 재무제표
+    bs = {}
+    for item in data.get('list', []):
+        if item.get('sj_nm') == '재무상태표':
+            fs = item.get('fs_nm', '')
+            acnt = item.get('account_nm', '')
+            val_str = item.get('thstrm_amount', '').replace(',', '')
+            if not val_str or val_str == '-':
+                continue
+            key = f"{fs}_{acnt}"
+            try:
+                bs[key] = int(val_str)
+            except ValueError:
+                continue
+
+    # 연결재무제표 우선
+    유동자산 = bs.get('연결재무제표_유동자산') or bs.get('재무제표_유동자산')
+    부채총계 = bs.get('연결재무제표_부채총계') or bs.get('재무제표_부채총계')
+    자산총계 = bs.get('연결재무제표_자산총계') or bs.get('재무제표_자산총계')
+    자본총계 = bs.get('연결재무제표_자본총계') or bs.get('재무제표_자본총계')
+
+    if 유동자산 is not None and 부채총계 is not None:
+        return {
+            'bsns_year': year,
+            '유동자산': 유동자산,
+            '부채총계': 부채총계,
+            '자산총계': 자산총계,
+            '자본총계': 자본총계,
+        }
+    return None
+
 
-    # 최대 3년 전까지 시도
-    for year in range(start_year, start_year - 3, -1):
+def get_latest_financial(corp_code: str) -> dict:
+    """가장 최근 사업보고서의 재무상태표 데이터를 반환"""
+    for year in _financial_years():
         data = get_dart_financial(corp_code, year)
         if data:
-            # 연결재무제표 우선, 없으면 별도 재무제표
-            bs = {}
-            for item in data.get('list', []):
-                if item.get('sj_nm') == '재무상태표':
-                    fs = item.get('fs_nm', '')
-                    acnt = item.get('account_nm', '')
-                    val_str = item.get('thstrm_amount', '').replace(',', '')
-                    if not val_str or val_str == '-':
-                        continue
-                    key = f"{fs}_{acnt}"
-                    try:
-                        bs[key] = int(val_str)
-                    except ValueError:
-                        continue
+            fin = parse_balance_sheet(data, year)
+            if fin:
+                return fin
+    return None
+
 
-            # 연결재무제표 우선
-            유동자산 = bs.get('연결재무제표_유동자산') or bs.get('재무제표_유동자산')
-            부채총계 = bs.get('연결재무제표_부채총계') or bs.get('재무제표_부채총계')
-            자산총계 = bs.get('연결재무제표_자산총계') or bs.get('재무제표_자산총계')
-            자본총계 = bs.get('연결재무제표_자본총계') or bs.get('재무제표_자본총계')
-
-            if 유동자산 is not None and 부채총계 is not None:
-                return {
-                    'bsns_year': year,
-                    '유동자산': 유동자산,
-                    '부채총계': 부채총계,
-                    '자산총계': 자산총계,
-                    '자본총계': 자본총계,
-                }
+async def get_latest_financial_async(engine, corp_code: str) -> dict:
+    """get_latest_financial과 같은 결과. DART 요청이 dart 동시 요청 상한을 따른다."""
+    for year in _financial_years():
+        data = await engine.call('dart', get_dart_financial, corp_code, year)
+        if data:
+            fin = parse_balance_sheet(data, year)
+            if fin:
+                return fin
     return None
 
 
@@ -880,13 +1008,12 @@ def calculate_ncav_screening(time_budget_seconds: int = None) -> list:
     if not corp_map:
         return []
 
-    # KRX에서 시가총액 매핑
-    marcap_dict = {}
-    for _, row in KRX_STOCKS.iterrows():
-        marcap_dict[row['Code']] = {
-            'name': row['Name'],
-            'marcap': row.get('Marcap', 0)
-        }
+    # KRX에서 시가총액 매핑. tolist()라 값이 numpy가 아닌 파이썬 숫자로 나온다 (JSON 저장용)
+    marcaps = KRX_STOCKS['Marcap'].tolist() if 'Marcap' in KRX_STOCKS.columns else [0] * len(KRX_STOCKS)
+    marcap_dict = {
+        code: {'name': name, 'marcap': marcap}
+        for code, name, marcap in zip(KRX_STOCKS['Code'].tolist(), KRX_STOCKS['Name'].tolist(), marcaps)
+    }
 
     # 기존 NCAV 결과 로드 (로컬 → Supabase 폴백)
     existing_ncav = {}
@@ -903,7 +1030,7 @@ def calculate_ncav_screening(time_budget_seconds: int = None) -> list:
         if existing_list:
             try:
                 with open(NCAV_RESULTS_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(existing_list, f, ensure_ascii=False)
+                    f.write(json.dumps(existing_list, ensure_ascii=False))
                 print(f"📁 NCAV: Supabase에서 다운로드 후 로컬 저장 완료", flush=True)
             except Exception:
                 pass
@@ -944,42 +1071,37 @@ def calculate_ncav_screening(time_budget_seconds: int = None) -> list:
     no_data = 0
     print(f"   동시 {NCAV_WORKERS}개로 조회", flush=True)
 
-    def _safe_financial(code):
+    async def work(engine, code):
         try:
-            return code, get_latest_financial(corp_map[code])
+            return await get_latest_financial_async(engine, corp_map[code])
+        except BudgetExhausted:
+            raise
         except Exception as e:
             print(f"❗ NCAV {code} 조회 오류: {type(e).__name__}", flush=True)
-            return code, None
-
-    targets = [c for c in codes_to_analyze if corp_map.get(c)]
-
-    # 묶음 단위로 처리해 묶음마다 예산을 확인하고 중간 저장한다.
-    for start in range(0, len(targets), NCAV_CHUNK):
-        if time_budget_seconds is not None and (time.monotonic() - started_at) > time_budget_seconds:
-            print(f"⏱️ NCAV 시간 예산 {time_budget_seconds}초 소진 → {analyzed}개 분석 후 중단", flush=True)
-            break
-
-        chunk = targets[start:start + NCAV_CHUNK]
-        with ThreadPoolExecutor(max_workers=NCAV_WORKERS) as pool:
-            outcomes = list(pool.map(_safe_financial, chunk))
-
-        for code, fin in outcomes:
-            if not fin:
-                # 값을 못 구한 종목도 기록해 둔다. 남기지 않으면 다음 실행에도
-                # '결과 없음' 상태라 영원히 재조회된다. 보험·은행처럼 재무상태표에
-                # 유동자산 구분이 없는 업종은 앞으로도 값이 나오지 않는다.
-                ncav_dict[code] = {
-                    'code': code,
-                    'name': marcap_dict[code]['name'],
-                    'ncav': None,
-                    'marcap': marcap_dict[code]['marcap'],
-                    'ncav_ratio': None,
-                    'ncav_positive': False,
-                    'no_data': True,
-                    'last_updated': current_time.isoformat(),
-                }
-                no_data += 1
-                continue
+            return None
+
+    finished = 0
+
+    # 끝난 종목은 바로 병합한다. 엔진이 루프 스레드에서 하나씩 부른다.
+    def merge(code, fin):
+        nonlocal analyzed, no_data, finished
+        finished += 1
+        if not fin:
+            # 값을 못 구한 종목도 기록해 둔다. 남기지 않으면 다음 실행에도
+            # '결과 없음' 상태라 영원히 재조회된다. 보험·은행처럼 재무상태표에
+            # 유동자산 구분이 없는 업종은 앞으로도 값이 나오지 않는다.
+            ncav_dict[code] = {
+                'code': code,
+                'name': marcap_dict[code]['name'],
+                'ncav': None,
+                'marcap': marcap_dict[code]['marcap'],
+                'ncav_ratio': None,
+                'ncav_positive': False,
+                'no_data': True,
+                'last_updated': current_time.isoformat(),
+            }
+            no_data += 1
+        else:
             marcap = marcap_dict[code]['marcap']
             ncav = fin['유동자산'] - fin['부채총계']
 
@@ -999,20 +1121,32 @@ def calculate_ncav_screening(time_budget_seconds: int = None) -> list:
             }
             analyzed += 1
 
-        # 묶음마다 중간 저장 (로컬 디스크, 대역폭 없음)
+        if finished % NCAV_CHUNK:
+            return
+        # NCAV_CHUNK개가 끝날 때마다 중간 저장 (로컬 디스크, 대역폭 없음)
         results = sorted(ncav_dict.values(), key=lambda x: x.get('ncav_ratio') or float('-inf'), reverse=True)
-        with open(NCAV_RESULTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False)
+        with stage('json_dump'), open(NCAV_RESULTS_FILE, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(results, ensure_ascii=False))
         elapsed = int(time.monotonic() - started_at)
-        print(f"💾 NCAV [{min(start + NCAV_CHUNK, len(targets))}/{len(targets)}] "
+        print(f"💾 NCAV [{finished}/{len(targets)}] "
               f"{elapsed}초 경과, 누적 분석 {analyzed}개 / 값없음 {no_data}개", flush=True)
 
+    targets = [c for c in codes_to_analyze if corp_map.get(c)]
+    deadline = started_at + time_budget_seconds if time_budget_seconds is not None else None
+    engine = Engine({'dart': NCAV_WORKERS}, deadline)
+    with stage('ncav.pipeline'):
+        unstarted = engine.run(targets, work, merge)
+    if unstarted:
+        print(f"⏱️ NCAV 시간 예산 {time_budget_seconds}초 소진 → {analyzed}개 분석 후 중단 "
+              f"(남은 {unstarted}개는 다음 실행에서)", flush=True)
+
     # 최종 저장. 실제로 분석된 종목이 있을 때만 Supabase에 업로드
     results = sorted(ncav_dict.values(), key=lambda x: x.get('ncav_ratio') or float('-inf'), reverse=True)
-    with open(NCAV_RESULTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False)
+    with stage('json_dump'), open(NCAV_RESULTS_FILE, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(results, ensure_ascii=False))
     if analyzed > 0 or no_data > 0:
-        upload_to_supabase(NCAV_RESULTS_FILE, results)
+        with stage('upload'):
+            upload_to_supabase(NCAV_RESULTS_FILE, results)
     else:
         print("⏩ NCAV: 신규 분석 결과 없음 → Supabase 업로드 생략", flush=True)
 
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""다조건 종목 스크리닝 (/screen).
+
+숫자 필드마다 float64 배열을 데이터 버전당 한 번 만들어 두고, 요청의
+범위 조건을 불리언 마스크로 겹쳐 평가한다. 정렬은 필드·방향별 순열을
+처음 쓸 때 한 번 구해 두고 마스크로 걸러내기만 하므로, 조건을 어떻게
+조합하든 전 종목에 대해 O(n) 벡터 연산 몇 번이면 끝난다.
+
+값이 없는(None·NaN) 종목은 그 필드에 조건이 걸리면 탈락하고, 그 필드로
+정렬하면 방향과 관계없이 맨 뒤로 간다.
+
+numpy는 이 모듈에서만 쓰고, app.py는 /screen이 처음 불릴 때 이 모듈을
+임포트한다.
+"""
+
+import threading
+
+import numpy as np
+
+# 조건·정렬에 쓰는 필드 이름 → 행에서 값을 꺼낼 키
+FIELDS = {
+    'safety_margin': 'safety_margin',
+    'intrinsic_value': 'intrinsic_value',
+    'dividend_yield': 'dividend_yield',
+    'treasury_ratio': 'treasury_ratio',
+    'ncav_ratio': 'ncav_ratio',
+    'volume': 'volume',
+    'marcap': 'marcap',
+    'price': 'current_price',
+}
+
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return np.nan
+    return value
+
+
+class ScreenTable:
+    """종목 목록 하나의 컬럼 배열. 데이터가 바뀌면 새로 만든다.
+
+    :param rows: 행 목록. 조건이 없을 때의 순서가 된다
+    :param joined: 행에 없는 필드의 값 목록 {키: rows와 같은 순서의 값}
+    """
+
+    def __init__(self, rows, joined=None):
+        joined = joined or {}
+        self.rows = rows
+        self.columns = {}
+        for name, key in FIELDS.items():
+            values = joined[key] if key in joined else [row.get(key) for row in rows]
+            self.columns[name] = np.fromiter((_number(v) for v in values),
+                                             dtype=np.float64, count=len(rows))
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    def order(self, field, descending=True):
+        """field 기준 정렬 순열. 값이 같으면 원래 순서를 따르고 NaN은 맨 뒤다."""
+        key = (field, descending)
+        order = self._orders.get(key)
+        if order is None:
+            column = self.columns[field]
+            # NaN은 오름차순에서 맨 뒤로 간다. 부호를 뒤집어도 NaN이라
+            # 내림차순에서도 맨 뒤에 남는다.
+            order = np.argsort(-column if descending else column, kind='stable')
+            with self._lock:
+                order = self._orders.setdefault(key, order)
+        return order
+
+    def screen(self, ranges, sort=None, descending=True):
+        """조건에 맞는 행 번호를 정렬 순서대로 반환한다.
+
+        :param ranges: [(필드, 하한 또는 None, 상한 또는 None)]. 경계는 포함한다
+        :param sort: 정렬 필드. None이면 rows의 순서를 유지한다
+        """
+        mask = np.ones(len(self.rows), dtype=bool)
+        for field, low, high in ranges:
+            column = self.columns[field]
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        if sort is None:
+            return np.flatnonzero(mask)
+        order = self.order(sort, descending)
+        return order[mask[order]]
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""종목 검색 색인.
+
+검색창은 타이핑할 때마다 /search를 부르므로 가장 자주 호출되는
+엔드포인트다. 매번 전 종목 이름을 소문자로 바꿔 훑는 대신, 데이터가 바뀔
+때 한 번 색인을 만들어 두고 그것으로 답한다.
+
+- 종목명 부분 일치: 글자 n-gram(1글자·2글자) 역색인으로 후보를 좁힌 뒤 확인
+- 초성 검색: 'ㅅㅅㅈㅈ' → 삼성전자. 종목명을 초성으로 바꾼 문자열에 같은 색인
+- 종목코드 앞자리: 접두어 → 종목 목록 사전 (평탄화한 트라이)
+- 순위: 완전 일치 > 앞부분 일치 > 중간 일치. 같은 등급은 입력 순서를 따른다
+  (웹앱은 안전마진 내림차순으로 넘겨준다)
+
+표준 라이브러리만 쓴다. 웹앱의 콜드 스타트 경로에 있기 때문이다.
+"""
+
+import threading
+from collections import OrderedDict
+
+# 한글 음절(가~힣)의 초성 19개. 음절 코드 = 0xAC00 + (초성*21 + 중성)*28 + 종성
+CHOSEONG = 'ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ'
+_CHOSEONG_SET = frozenset(CHOSEONG)
+_HANGUL_FIRST, _HANGUL_LAST = ord('가'), ord('힣')
+
+def normalize(text: str) -> str:
+    """비교용 문자열. 대소문자와 공백 차이를 무시한다 ('sk 하이닉스' → 'sk하이닉스')."""
+    return ''.join((text or '').lower().split())
+
+
+def to_choseong(text: str) -> str:
+    """한글 음절을 초성으로 바꾼다. 한글이 아닌 글자는 그대로 둔다."""
+    out = []
+    for ch in text:
+        code = ord(ch)
+        if _HANGUL_FIRST <= code <= _HANGUL_LAST:
+            out.append(CHOSEONG[(code - _HANGUL_FIRST) // 588])
+        else:
+            out.append(ch)
+    return ''.join(out)
+
+
+def is_choseong_query(text: str) -> bool:
+    return bool(text) and all(ch in _CHOSEONG_SET for ch in text)
+
+
+class _GramIndex:
+    """문자열 목록의 1·2글자 n-gram 역색인."""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self._postings = {}
+        for i, text in enumerate(texts):
+            grams = set(text)
+            grams.update(text[j:j + 2] for j in range(len(text) - 1))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(i)
+
+    def find(self, needle):
+        """needle을 포함하는 항목 번호. 오름차순."""
+        if len(needle) == 1:
+            return self._postings.get(needle, [])
+        grams = {needle[j:j + 2] for j in range(len(needle) - 1)}
+        lists = sorted((self._postings.get(g, []) for g in grams), key=len)
+        if not lists[0]:
+            return []
+        # 가장 짧은 목록을 기준으로 교집합을 구한 뒤, 2-gram이 모두 들어
+        # 있어도 순서가 다를 수 있으므로 실제 포함 여부를 확인한다.
+        candidates = set(lists[0])
+        for other in lists[1:]:
+            candidates.intersection_update(other)
+            if not candidates:
+                return []
+        return sorted(i for i in candidates if needle in self.texts[i])
+
+
+def _prefix_postings(texts, depth):
+    """앞 depth글자까지의 접두어 → 항목 번호(오름차순). 평탄화한 트라이다."""
+    postings = {}
+    for i, text in enumerate(texts):
+        for n in range(1, min(len(text), depth) + 1):
+            postings.setdefault(text[:n], []).append(i)
+    return postings
+
+
+class SearchIndex:
+    """종목 목록 하나에 대한 검색 색인. 데이터가 바뀌면 새로 만든다."""
+
+    # 짧은 검색어는 후보가 수천 개라 앞부분 일치를 걸러내는 데만 시간이 든다.
+    # 이 길이까지는 접두어 목록을 미리 만들어 두고, 그보다 긴 검색어는 후보가
+    # 적으므로 그때그때 확인한다.
+    PREFIX_DEPTH = 2
+
+    def __init__(self, stocks, cache_size: int = 256):
+        self._stocks = stocks
+        names = [normalize(s.get('name')) for s in stocks]
+        initials = [to_choseong(n) for n in names]
+        codes = [(s.get('code') or '').lower() for s in stocks]
+
+        self._names = _GramIndex(names)
+        self._initials = _GramIndex(initials)
+        self._name_prefixes = _prefix_postings(names, self.PREFIX_DEPTH)
+        self._initial_prefixes = _prefix_postings(initials, self.PREFIX_DEPTH)
+        # 종목코드는 6자리라 전 길이의 접두어를 만들어도 종목당 6개다
+        self._code_prefixes = _prefix_postings(codes, max(map(len, codes), default=0))
+        self._codes = codes
+
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """검색어에 맞는 종목을 순위대로 limit개 반환한다."""
+        needle = normalize(query)
+        if not needle or limit <= 0:
+            return []
+
+        key = (needle, limit)
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                return hit
+
+        result = self._rank(needle, limit)
+
+        with self._lock:
+            self._cache[key] = result
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _rank(self, needle, limit):
+        if is_choseong_query(needle):
+            index, prefixes = self._initials, self._initial_prefixes
+        else:
+            index, prefixes = self._names, self._name_prefixes
+        texts = index.texts
+        code_hits = self._code_prefixes.get(needle, [])
+
+        picked, seen = [], set()
+
+        def take(ids):
+            # ids는 오름차순이므로 같은 등급 안에서는 입력 순서가 유지된다
+            for i in ids:
+                if len(picked) >= limit:
+                    return
+                if i not in seen:
+                    seen.add(i)
+                    picked.append(i)
+
+        # 후보는 필요해질 때만 구한다. 완전·앞부분 일치만으로 limit이
+        # 차면 부분 일치 후보를 훑을 필요가 없다.
+        candidates = None
+
+        # 1) 완전 일치 (종목명 또는 종목코드)
+        if len(needle) <= self.PREFIX_DEPTH:
+            exact = [i for i in prefixes.get(needle, []) if texts[i] == needle]
+        else:
+            candidates = index.find(needle)
+            exact = [i for i in candidates if texts[i] == needle]
+        exact_codes = [i for i in code_hits if self._codes[i] == needle]
+        take(sorted(set(exact).union(exact_codes)) if exact_codes else exact)
+
+        # 2) 앞부분 일치
+        if len(picked) < limit:
+            if len(needle) <= self.PREFIX_DEPTH:
+                prefixed = prefixes.get(needle, [])
+            else:
+                prefixed = [i for i in candidates if texts[i].startswith(needle)]
+            take(sorted(set(prefixed).union(code_hits)) if code_hits else prefixed)
+
+        # 3) 중간 일치
+        if len(picked) < limit:
+            take(index.find(needle) if candidates is None else candidates)
+
+        return [self._stocks[i] for i in picked]
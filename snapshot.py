@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""결과 데이터의 컬럼형 바이너리 스냅샷.
+
+JSON을 파이썬 dict 목록으로 풀면 종목마다 키 문자열 10여 개와 값 객체가
+생기고, 그것이 워커 프로세스마다 따로 있다. 스냅샷은 같은 데이터를
+컬럼별 고정폭 배열과 중복을 없앤 문자열 테이블로 파일 하나에 쓴다.
+같은 호스트의 모든 워커가 그 파일을 읽기 전용으로 mmap하므로 물리
+메모리에는 한 벌만 올라가고, 갱신할 때 파싱할 것이 없다.
+
+파일 구조 (모든 구역은 8바이트 정렬):
+  MAGIC(8) | 헤더 길이(u32) | 헤더(JSON) | 컬럼 배열들 | 문자열 오프셋 | 문자열 본문
+
+컬럼 종류:
+  f  float64. NaN이 None이다 (원본의 NaN도 None이 된다). 정수와 실수가
+     섞인 컬럼은 행별 정수 표시(u8)를 따로 두어 정수는 정수로 돌려준다
+  i  int64. INT_NONE이 None이다
+  b  int8. -1이 None이다
+  s  int32 문자열 번호. -1이 None이다
+  j  int32 문자열 번호. 그 문자열을 JSON으로 읽는다 (dict·list 값)
+어떤 행에 키 자체가 없으면 컬럼에 행별 존재 표시(u8)를 따로 둔다.
+
+표준 라이브러리만 쓴다. 웹앱이 읽으므로 콜드 스타트 경로에 있다.
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from collections.abc import Mapping, Sequence
+
+MAGIC = b'IVCSNAP1'
+INT_NONE = -(2 ** 63)
+_MISSING = object()
+# float64가 정확히 나타내는 정수의 범위
+_EXACT_INT = 2 ** 53
+
+
+def _infer_kind(values):
+    kinds = set()
+    for v in values:
+        if v is None or v is _MISSING:
+            continue
+        if isinstance(v, bool):
+            kinds.add('b')
+        elif isinstance(v, int):
+            kinds.add('i')
+        elif isinstance(v, float):
+            kinds.add('f')
+        elif isinstance(v, str):
+            kinds.add('s')
+        else:
+            kinds.add('j')
+    if kinds == {'i', 'f'}:
+        # float64로 정확히 담기지 않는 정수가 있으면 값을 그대로 JSON으로 둔다
+        exact = all(not isinstance(v, int) or -_EXACT_INT <= v <= _EXACT_INT for v in values)
+        return 'f' if exact else 'j'
+    if not kinds or kinds == {'f'}:
+        return 'f'
+    if len(kinds) == 1:
+        return kinds.pop()
+    return 'j'
+
+
+def write_snapshot(rows, path):
+    """dict 목록을 스냅샷 파일로 쓴다. 다른 프로세스가 반쯤 쓴 파일을 열지
+    않도록 임시 파일에 쓴 뒤 이름을 바꾼다."""
+    keys = {}
+    for row in rows:
+        for key in row:
+            keys.setdefault(key, None)
+
+    strings, string_ids = [], {}
+
+    def intern(text):
+        idx = string_ids.get(text)
+        if idx is None:
+            idx = string_ids[text] = len(strings)
+            strings.append(text)
+        return idx
+
+    columns = []
+    for key in keys:
+        values = [row.get(key, _MISSING) for row in rows]
+        kind = _infer_kind(values)
+        if kind == 'f':
+            arr = array('d', (float('nan') if v is None or v is _MISSING else float(v) for v in values))
+        elif kind == 'i':
+            arr = array('q', (INT_NONE if v is None or v is _MISSING else v for v in values))
+        elif kind == 'b':
+            arr = array('b', (-1 if v is None or v is _MISSING else int(v) for v in values))
+        elif kind == 's':
+            arr = array('i', (-1 if v is None or v is _MISSING else intern(v) for v in values))
+        else:
+            arr = array('i', (-1 if v is None or v is _MISSING
+                              else intern(json.dumps(v, ensure_ascii=False)) for v in values))
+        present = None
+        if any(v is _MISSING for v in values):
+            present = array('B', (0 if v is _MISSING else 1 for v in values))
+        ints = None
+        if kind == 'f' and any(type(v) is int for v in values):
+            ints = array('B', (type(v) is int for v in values))
+        columns.append((key, kind, arr, present, ints))
+
+    blob = bytearray()
+    offsets = array('Q', [0])
+    for text in strings:
+        blob += text.encode('utf-8')
+        offsets.append(len(blob))
+
+    # 본문 구역을 먼저 배치해 오프셋을 정한 뒤 헤더를 만든다. 헤더 길이가
+    # 오프셋에 영향을 주므로 헤더 다음부터를 상대 위치로 계산하고 나중에 더한다.
+    sections, layout, pos = [], [], 0
+
+    def place(data):
+        nonlocal pos
+        start = pos
+        sections.append(data)
+        pos += len(data)
+        pad = -pos % 8
+        if pad:
+            sections.append(b'\0' * pad)
+            pos += pad
+        return start
+
+    for key, kind, arr, present, ints in columns:
+        layout.append({
+            'name': key,
+            'kind': kind,
+            'offset': place(arr.tobytes()),
+            'present': place(present.tobytes()) if present is not None else None,
+            'ints': place(ints.tobytes()) if ints is not None else None,
+        })
+    strings_at = place(offsets.tobytes())
+    blob_at = place(bytes(blob))
+
+    def header_for(base):
+        def shift(v):
+            return None if v is None else v + base
+        return json.dumps({
+            'rows': len(rows),
+            'columns': [dict(c, offset=shift(c['offset']), present=shift(c['present']), ints=shift(c['ints']))
+                        for c in layout],
+            'strings': len(strings),
+            'strings_offset': strings_at + base,
+            'blob_offset': blob_at + base,
+            'blob_length': len(blob),
+        }, ensure_ascii=False).encode('utf-8')
+
+    # 헤더 길이는 base 자릿수에 따라 달라질 수 있으므로 안정될 때까지 맞춘다
+    base = 0
+    while True:
+        header = header_for(base)
+        needed = len(MAGIC) + 4 + len(header)
+        needed += -needed % 8
+        if needed == base:
+            break
+        base = needed
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            f.write(b'\0' * (base - len(MAGIC) - 4 - len(header)))
+            for chunk in sections:
+                f.write(chunk)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class Record(Mapping):
+    """스냅샷의 한 행. dict처럼 읽을 수 있고 값은 접근할 때 꺼낸다."""
+
+    __slots__ = ('_snap', '_row')
+
+    def __init__(self, snap, row):
+        self._snap = snap
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._snap._value(self._row, key)
+
+    def __iter__(self):
+        return (name for name in self._snap.columns if self._snap._has(self._row, name))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'Record({dict(self)!r})'
+
+
+class Snapshot(Sequence):
+    """mmap으로 연 스냅샷. 행(Record)의 시퀀스다."""
+
+    # NaN은 쓸 때 이미 None이 되므로 호출부가 따로 정제할 필요가 없다
+    scrubbed = True
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mm)
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f'스냅샷 형식이 아님: {path}')
+        (hlen,) = struct.unpack_from('<I', buf, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(buf[start:start + hlen]).decode('utf-8'))
+
+        n = header['rows']
+        fmt = {'f': 'd', 'i': 'q', 'b': 'b', 's': 'i', 'j': 'i'}
+        self.columns = []
+        self._cols = {}
+        for col in header['columns']:
+            kind = col['kind']
+            size = struct.calcsize(fmt[kind])
+            values = buf[col['offset']:col['offset'] + n * size].cast(fmt[kind])
+            present = None
+            if col['present'] is not None:
+                present = buf[col['present']:col['present'] + n]
+            ints = None
+            if col.get('ints') is not None:
+                ints = buf[col['ints']:col['ints'] + n]
+            self.columns.append(col['name'])
+            self._cols[col['name']] = (kind, values, present, ints)
+
+        s_at = header['strings_offset']
+        self._offsets = buf[s_at:s_at + (header['strings'] + 1) * 8].cast('Q')
+        b_at = header['blob_offset']
+        self._blob = buf[b_at:b_at + header['blob_length']]
+        self._strings = {}
+        self._rows = [Record(self, i) for i in range(n)]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, i):
+        return self._rows[i]
+
+    def _string(self, idx):
+        text = self._strings.get(idx)
+        if text is None:
+            text = bytes(self._blob[self._offsets[idx]:self._offsets[idx + 1]]).decode('utf-8')
+            self._strings[idx] = text
+        return text
+
+    def _has(self, row, key):
+        present = self._cols[key][2]
+        return present is None or bool(present[row])
+
+    def _value(self, row, key):
+        kind, values, present, ints = self._cols[key]
+        if present is not None and not present[row]:
+            raise KeyError(key)
+        v = values[row]
+        if kind == 'f':
+            if v != v:
+                return None
+            return int(v) if ints is not None and ints[row] else v
+        if kind == 'i':
+            return None if v == INT_NONE else v
+        if kind == 'b':
+            return None if v < 0 else bool(v)
+        if v < 0:
+            return None
+        text = self._string(v)
+        return text if kind == 's' else json.loads(text)
+
+
+class SnapshotStore:
+    """데이터 버전별 스냅샷 파일을 한 디렉터리에서 관리한다.
+
+    같은 호스트의 워커들이 같은 디렉터리를 보면, 먼저 받은 워커가 쓴 파일을
+    나머지가 다운로드 없이 연다. /dev/shm처럼 메모리에 있는 디렉터리가 좋다.
+    """
+
+    def __init__(self, directory, filename, keep=3):
+        self.directory = directory
+        self.stem = os.path.splitext(os.path.basename(filename))[0]
+        self.keep = keep
+
+    def path(self, version):
+        return os.path.join(self.directory, f'{self.stem}.{version}.snap')
+
+    def load(self, version):
+        """그 버전의 스냅샷이 있으면 연다. 없거나 깨졌으면 None."""
+        path = self.path(version)
+        if not version or not os.path.exists(path):
+            return None
+        try:
+            return Snapshot(path)
+        except Exception as e:
+            print(f"⚠️ 스냅샷 열기 실패: {path} — {e}", flush=True)
+            return None
+
+    def save(self, rows, version):
+        """rows를 그 버전의 스냅샷으로 쓰고 연다. 실패하면 None."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if not os.path.exists(self.path(version)):
+                write_snapshot(rows, self.path(version))
+            self._prune(version)
+            return Snapshot(self.path(version))
+        except Exception as e:
+            print(f"⚠️ 스냅샷 쓰기 실패: {self.path(version)} — {e}", flush=True)
+            return None
+
+    def _prune(self, current):
+        # 다른 워커가 아직 옛 파일을 mmap하고 있어도 지워도 된다. 매핑은
+        # 닫힐 때까지 유효하다. 그래도 직전 몇 개는 남겨 둔다.
+        prefix = self.stem + '.'
+        snaps = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.startswith(prefix) and name.endswith('.snap')]
+        snaps.sort(key=os.path.getmtime, reverse=True)
+        for path in snaps[self.keep:]:
+            if path != self.path(current):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
@@ -55,17 +55,9 @@ class WatchlistManager {
     // 엑셀 내보내기
     async exportToExcel(stocks, limit, dividendFilter) {
         try {
-            const response = await fetch('/watchlist/export', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    stocks: stocks,
-                    dividend_filter: dividendFilter,
-                    limit: limit
-                })
-            });
+            // 행은 서버가 자기 데이터에서 뽑으므로 종목코드만 보낸다
+            const codes = stocks.map(stock => stock.code).join(',');
+            const response = await fetch(`/export?source=watchlist&codes=${encodeURIComponent(codes)}`);
 
             if (!response.ok) {
                 throw new Error('엑셀 다운로드 중 오류가 발생했습니다.');
@@ -1,5 +1,5 @@
 // 캐시 버전. 값을 바꾸면 activate에서 이전 캐시를 전부 삭제한다.
-const CACHE_VERSION = 'v2';
+const CACHE_VERSION = 'v3';
 const CACHE_NAME = `intrinsic-value-calculator-${CACHE_VERSION}`;
 
 // 오프라인 대비로 미리 받아둘 정적 자원.
@@ -18,7 +18,7 @@ const PRECACHE_URLS = [
 ];
 
 // 시세·스크리닝 응답. 캐시하면 낡은 가격을 보여주게 되므로 손대지 않는다.
-const NETWORK_ONLY = ['/search', '/filter', '/ncav', '/watchlist', '/sitemap.xml', '/robots.txt'];
+const NETWORK_ONLY = ['/search', '/filter', '/ncav', '/screen', '/export', '/changes', '/events', '/watchlist', '/sitemap.xml', '/robots.txt'];
 
 self.addEventListener('install', event => {
     event.waitUntil(
@@ -9,15 +9,19 @@
 requests·lxml·FinanceDataReader·tqdm까지 전부 임포트하게 된다.
 콜드 스타트가 느려지고 배포 번들이 불필요하게 커진다.
 
-의존성은 supabase와 python-dotenv뿐이다.
+의존성은 supabase와 python-dotenv뿐이다. STORAGE_LOCAL_DIR을 주면 같은
+파일 이름으로 로컬 디렉터리에 읽고 쓴다(벤치마크용).
 """
 
+import hashlib
 import json
 import os
+from datetime import datetime, timezone
 
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv('SUPABASE_URL')
@@ -26,10 +30,15 @@ SUPABASE_URL = os.getenv('SUPABASE_URL')
 USING_SERVICE_KEY = bool(os.getenv('SUPABASE_SERVICE_KEY'))
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY') or os.getenv('SUPABASE_KEY')
 SUPABASE_BUCKET = os.getenv('SUPABASE_BUCKET', 'stock-data')
+# 지정하면 Supabase 대신 이 디렉터리를 저장소로 쓴다. 벤치마크(bench/)와
+# 오프라인 개발용이다. 파일 이름과 매니페스트 규칙은 Supabase와 같다.
+STORAGE_LOCAL_DIR = os.getenv('STORAGE_LOCAL_DIR', '').strip()
 
 
 def key_kind() -> str:
     """어느 키로 동작 중인지. 키 값 자체는 절대 로그에 남기지 않는다."""
+    if STORAGE_LOCAL_DIR:
+        return f'로컬 디렉터리({STORAGE_LOCAL_DIR})'
     if not SUPABASE_KEY:
         return '없음'
     return 'service_role' if USING_SERVICE_KEY else 'anon(폴백)'
@@ -45,50 +54,165 @@ def get_supabase_client():
     return supabase
 
 
-def upload_to_supabase(file_name: str, data: list) -> bool:
-    """JSON 데이터를 Supabase Storage에 업로드"""
+def manifest_name(file_name: str) -> str:
+    """데이터 파일 옆에 두는 매니페스트의 이름 (foo.json → foo.manifest.json)."""
+    stem, _ = os.path.splitext(file_name)
+    return f"{stem}.manifest.json"
+
+
+def build_manifest(json_bytes: bytes, data) -> dict:
+    """업로드하는 바이트를 설명하는 작은 객체.
+
+    웹앱은 큰 파일을 받기 전에 이것부터 받아 sha256이 가진 것과 같으면
+    다운로드·파싱을 건너뛴다. 밤·주말에는 크롤러가 돌지 않으므로 대부분의
+    캐시 갱신이 여기서 끝난다.
+    """
+    price_dates = [row.get('price_date') for row in data
+                   if isinstance(row, dict) and row.get('price_date')] if isinstance(data, list) else []
+    return {
+        'sha256': hashlib.sha256(json_bytes).hexdigest(),
+        'rows': len(data) if isinstance(data, list) else None,
+        'price_date': max(price_dates) if price_dates else None,
+        'published_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def _local_path(file_name: str) -> str:
+    return os.path.join(STORAGE_LOCAL_DIR, file_name)
+
+
+def _local_read(file_name: str) -> bytes:
+    try:
+        with open(_local_path(file_name), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _remove(client, file_name: str):
     try:
-        client = get_supabase_client()
         if client is None:
+            os.unlink(_local_path(file_name))
+        else:
+            client.storage.from_(SUPABASE_BUCKET).remove([file_name])
+    except Exception:
+        pass  # 파일이 없으면 무시
+
+
+def _replace(client, file_name: str, body: bytes):
+    if client is None:
+        # 로컬 디렉터리. 임시 파일에 쓰고 이름을 바꿔 반쯤 쓴 파일을 읽는 일이 없게 한다
+        os.makedirs(STORAGE_LOCAL_DIR, exist_ok=True)
+        tmp = _local_path(f'.{file_name}.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, _local_path(file_name))
+        return
+
+    # 기존 파일 삭제 후 업로드 (upsert)
+    _remove(client, file_name)
+
+    client.storage.from_(SUPABASE_BUCKET).upload(
+        file_name,
+        body,
+        file_options={"content-type": "application/json"}
+    )
+
+
+def upload_to_supabase(file_name: str, data: list, manifest: bool = True) -> bool:
+    """JSON 데이터를 Supabase Storage에 업로드
+
+    manifest=True면 매니페스트(manifest_name 참고)도 함께 올린다. 순서가
+    중요하다. 옛 매니페스트를 먼저 지우고, 데이터를 올린 뒤, 새 매니페스트를
+    올린다. 매니페스트가 데이터보다 늦게 바뀌어야 웹앱이 옛 해시를 보고
+    새 데이터를 건너뛰는 일이 없다. 매니페스트가 없으면 웹앱은 그냥 전체를
+    받는다.
+    """
+    try:
+        client = None if STORAGE_LOCAL_DIR else get_supabase_client()
+        if client is None and not STORAGE_LOCAL_DIR:
             print("Supabase 클라이언트 없음, 로컬 저장만 수행", flush=True)
             return False
 
         json_bytes = json.dumps(data, ensure_ascii=False).encode('utf-8')
 
-        # 기존 파일 삭제 후 업로드 (upsert)
-        try:
-            client.storage.from_(SUPABASE_BUCKET).remove([file_name])
-        except Exception:
-            pass  # 파일이 없으면 무시
-
-        client.storage.from_(SUPABASE_BUCKET).upload(
-            file_name,
-            json_bytes,
-            file_options={"content-type": "application/json"}
-        )
+        if manifest:
+            _remove(client, manifest_name(file_name))
+
+        _replace(client, file_name, json_bytes)
         print(f"✅ Supabase Storage 업로드 완료: {file_name}", flush=True)
-        return True
     except Exception as e:
         print(f"❌ Supabase Storage 업로드 실패: {e}", flush=True)
         return False
 
+    if manifest:
+        # 매니페스트 실패는 업로드 실패가 아니다. 웹앱이 전체를 받을 뿐이다.
+        try:
+            meta = build_manifest(json_bytes, data)
+            _replace(client, manifest_name(file_name),
+                     json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+        except Exception as e:
+            print(f"⚠️ 매니페스트 업로드 실패: {manifest_name(file_name)} — {e}", flush=True)
+    return True
 
-def download_from_supabase(file_name: str) -> list:
-    """Supabase Storage에서 JSON 데이터 다운로드.
 
-    실패하면 None을 반환한다. 호출부가 '못 받았다'와 '받았는데 비었다'를
-    구분할 수 있어야 하므로 빈 리스트를 대신 돌려주지 않는다.
+def download_manifest(file_name: str) -> dict:
+    """데이터 파일의 매니페스트. 없거나 읽지 못하면 None."""
+    try:
+        if STORAGE_LOCAL_DIR:
+            raw = _local_read(manifest_name(file_name))
+            if raw is None:
+                return None
+        else:
+            client = get_supabase_client()
+            if client is None:
+                return None
+            raw = client.storage.from_(SUPABASE_BUCKET).download(manifest_name(file_name))
+        meta = json.loads(raw.decode('utf-8'))
+        return meta if isinstance(meta, dict) and meta.get('sha256') else None
+    except Exception:
+        # 매니페스트를 아직 올리지 않은 크롤러와도 동작해야 하므로 조용히 넘어간다
+        return None
+
+
+def download_bytes_from_supabase(file_name: str) -> bytes:
+    """Supabase Storage에서 파일을 원본 바이트 그대로 받는다.
+
+    웹앱은 이 바이트의 해시를 데이터 버전으로 쓴다. 파싱 후 다시 직렬화하면
+    같은 내용도 키 순서 등에 따라 해시가 달라질 수 있다.
+    실패하면 None을 반환한다.
     """
+    if STORAGE_LOCAL_DIR:
+        raw = _local_read(file_name)
+        if raw is None:
+            print(f"⚠️ 로컬 저장소에 파일 없음: {_local_path(file_name)}", flush=True)
+        return raw
+
     try:
         client = get_supabase_client()
         if client is None:
             print("⚠️ Supabase 자격증명 없음 (SUPABASE_URL/SUPABASE_KEY)", flush=True)
             return None
 
-        response = client.storage.from_(SUPABASE_BUCKET).download(file_name)
-        data = json.loads(response.decode('utf-8'))
-        print(f"✅ Supabase Storage에서 다운로드 완료: {file_name} ({len(data)}개 항목)", flush=True)
-        return data
+        return client.storage.from_(SUPABASE_BUCKET).download(file_name)
+    except Exception as e:
+        print(f"⚠️ Supabase Storage 다운로드 실패: {file_name} — {e}", flush=True)
+        return None
+
+
+def download_from_supabase(file_name: str) -> list:
+    """Supabase Storage에서 JSON 데이터 다운로드.
+
+    실패하면 None을 반환한다. 호출부가 '못 받았다'와 '받았는데 비었다'를
+    구분할 수 있어야 하므로 빈 리스트를 대신 돌려주지 않는다.
+    """
+    raw = download_bytes_from_supabase(file_name)
+    if raw is None:
+        return None
+    try:
+        data = json.loads(raw.decode('utf-8'))
     except Exception as e:
         print(f"⚠️ Supabase Storage 다운로드 실패: {file_name} — {e}", flush=True)
         return None
+    print(f"✅ Supabase Storage에서 다운로드 완료: {file_name} ({len(data)}개 항목)", flush=True)
+    return data
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+# 모듈이 저장소 최상위에 평평하게 있으므로 그 경로에서 임포트한다
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def store(tmp_path_factory):
+    """bench/synth.py의 합성 데이터를 임시 로컬 저장소에 올려 둔다. 안전마진 행을 돌려준다."""
+    import storage
+    from bench import synth
+
+    directory = str(tmp_path_factory.mktemp('storage'))
+    patch = pytest.MonkeyPatch()
+    patch.setattr(storage, 'STORAGE_LOCAL_DIR', directory)
+    results, ncav = synth.generate(1, seed=3)
+    storage.upload_to_supabase('all_safety_margin_results.json', results)
+    storage.upload_to_supabase('ncav_results.json', ncav)
+    yield results
+    patch.undo()
+
+
+@pytest.fixture(scope='session')
+def app_module(store):
+    import app
+    app._results_cache.refresh_now()
+    app._ncav_cache.refresh_now()
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
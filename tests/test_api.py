@@ -0,0 +1,222 @@
+"""웹앱 라우트 테스트. bench/synth.py의 합성 데이터를 로컬 저장소에 써 두고 읽는다."""
+
+import gzip
+import json
+import threading
+import time
+
+import pytest
+
+import storage
+
+
+def _version(client):
+    return client.get('/filter?limit=1').headers['X-Data-Version'].split('.')[0]
+
+
+def test_cursor_walks_every_row_once(client):
+    whole = client.get('/filter?limit=100').get_json()
+    seen, url = [], '/filter?limit=7'
+    while True:
+        page = client.get(url).get_json()
+        seen += page['stocks']
+        if not page.get('next_cursor'):
+            break
+        url = f"/filter?limit=7&cursor={page['next_cursor']}"
+        if len(seen) >= 100:
+            break
+    assert [s['code'] for s in seen[:100]] == [s['code'] for s in whole['stocks']]
+
+
+def test_cursor_errors(app_module, client):
+    assert client.get('/filter?cursor=!!!').status_code == 400
+    stale = app_module.encode_cursor('old-version', 10)
+    assert client.get(f'/filter?cursor={stale}').status_code == 409
+    assert client.get('/filter?offset=-1').status_code == 400
+
+
+def test_field_projection(client):
+    stocks = client.get('/filter?limit=5&fields=code,safety_margin').get_json()['stocks']
+    assert stocks and all(set(s) == {'code', 'safety_margin'} for s in stocks)
+
+
+def test_delta_feed(app_module, client, store):
+    before = _version(client)
+    assert client.get(f'/changes?since={before}').get_json() == {
+        'version': before, 'since': before, 'resync': False, 'changed': {}, 'removed': []}
+
+    rows = json.loads(json.dumps(store))
+    moved, gone = rows[0], rows[1]
+    moved['current_price'] = (moved.get('current_price') or 0) + 1
+    del rows[1]
+    storage.upload_to_supabase('all_safety_margin_results.json', rows)
+    assert app_module._results_cache.refresh_now()
+
+    after = _version(client)
+    delta = client.get(f'/changes?since={before}').get_json()
+    assert delta['version'] == after and not delta['resync']
+    assert delta['changed'] == {moved['code']: {'current_price': moved['current_price']}}
+    assert delta['removed'] == [gone['code']]
+
+    only = client.get(f"/changes?since={before}&codes={gone['code']}").get_json()
+    assert only['changed'] == {} and only['removed'] == [gone['code']]
+    assert client.get('/changes?since=unknown').get_json() == {'version': after, 'resync': True}
+
+
+def test_single_flight_runs_once(app_module):
+    flight = app_module.SingleFlight()
+    calls, results = [], []
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return 'value'
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do('k', work))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert calls == [1] and results == ['value'] * 8
+    # 끝난 키는 다음 호출 때 다시 계산한다
+    assert flight.do('k', lambda: 'again') == 'again'
+
+
+def test_single_flight_shares_errors(app_module):
+    flight = app_module.SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('boom')
+
+    def call():
+        try:
+            flight.do('k', fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+    assert errors == ['boom', 'boom']
+
+
+def test_events_latest_is_cached_with_etag(client):
+    first = client.get('/events/latest')
+    assert first.status_code == 200
+    assert first.get_json()['version'] == first.headers['X-Data-Version']
+    again = client.get('/events/latest', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_events_over_cap_answers_204(app_module, client, monkeypatch):
+    if not app_module.EVENTS_ENABLED:
+        pytest.skip('EVENTS_ENABLED=0')
+    monkeypatch.setattr(app_module._broadcaster, 'max_streams', 1)
+    opened = client.get('/events', buffered=False)
+    assert opened.status_code == 200
+    full = client.get('/events')
+    assert full.status_code == 204 and full.headers['Retry-After']
+    opened.close()
+    assert app_module._broadcaster.streams == 0
+
+
+def test_if_none_match_gives_304(client):
+    for encoding in ('', 'gzip', 'br'):
+        first = client.get('/filter?limit=50', headers={'Accept-Encoding': encoding})
+        assert first.status_code == 200
+        again = client.get('/filter?limit=50', headers={'Accept-Encoding': encoding,
+                                                          'If-None-Match': first.headers['ETag']})
+        assert again.status_code == 304 and again.data == b''
+        assert again.headers['ETag'] == first.headers['ETag']
+    # 다른 압축 방식으로 받은 ETag도 같은 데이터다
+    plain = client.get('/filter?limit=50').headers['ETag'].strip('"')
+    assert client.get('/filter?limit=50', headers={'Accept-Encoding': 'gzip',
+                                                    'If-None-Match': f'"{plain}-br"'}).status_code == 304
+
+
+def test_encoding_prefers_br_then_gzip(client):
+    brotli = pytest.importorskip('brotli')
+    plain = client.get('/filter?limit=50', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    etag = plain.headers['ETag'].strip('"')
+
+    br = client.get('/filter?limit=50', headers={'Accept-Encoding': 'gzip, deflate, br'})
+    assert br.headers['Content-Encoding'] == 'br' and br.headers['ETag'] == f'"{etag}-br"'
+    assert brotli.decompress(br.data) == plain.data
+
+    gz = client.get('/filter?limit=50', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert gz.headers['Content-Encoding'] == 'gzip' and gz.headers['ETag'] == f'"{etag}-gz"'
+    assert gzip.decompress(gz.data) == plain.data
+    assert 'Accept-Encoding' in gz.headers.get('Vary', '')
+
+
+def test_new_data_version_gives_new_etag(app_module, client, store):
+    before = client.get('/filter?limit=20')
+    rows = json.loads(json.dumps(store))
+    rows[-1]['volume'] = (rows[-1].get('volume') or 0) + 12345
+    storage.upload_to_supabase('all_safety_margin_results.json', rows)
+    assert app_module._results_cache.refresh_now()
+
+    after = client.get('/filter?limit=20', headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != before.headers['ETag']
+    assert after.headers['X-Data-Version'] != before.headers['X-Data-Version']
+
+
+def test_unchanged_manifest_skips_download(app_module, monkeypatch, store):
+    downloads = []
+    fetch = app_module.download_bytes_from_supabase
+
+    def counting(name):
+        downloads.append(name)
+        return fetch(name)
+
+    monkeypatch.setattr(app_module, 'download_bytes_from_supabase', counting)
+    cache = app_module.RemoteDataCache('ncav_results.json')
+    cache.refresh_now()
+    assert downloads == ['ncav_results.json'] and cache.version
+
+    # 매니페스트의 해시가 가진 버전과 같으면 본문을 받지 않는다
+    assert not cache.refresh_now()
+    assert downloads == ['ncav_results.json']
+
+    ncav = storage.download_from_supabase('ncav_results.json')
+    storage.upload_to_supabase('ncav_results.json', ncav[1:])
+    assert cache.refresh_now()
+    assert downloads == ['ncav_results.json'] * 2
+
+
+def _download_name(resp):
+    from urllib.parse import unquote
+    return unquote(resp.headers['Content-Disposition'].split("filename*=UTF-8''")[1])
+
+
+@pytest.mark.parametrize('dividend, suffix', [(None, ''), (0, '_배당수익률0%이상'), ('2.50', '_배당수익률2.5%이상'),
+                                              (3, '_배당수익률3%이상'), ('', '')])
+def test_watchlist_export_filename(client, store, dividend, suffix):
+    body = {'stocks': [{'code': store[0]['code']}], 'limit': 10}
+    if dividend is not None:
+        body['dividend_filter'] = dividend
+    resp = client.post('/watchlist/export', json=body)
+    assert resp.status_code == 200
+    assert _download_name(resp) == f'안전마진_상위10종목{suffix}.xlsx'
+
+
+@pytest.mark.parametrize('query, suffix', [('', ''), ('&dividend=0', '_배당수익률0%이상'), ('&dividend=2.5', '_배당수익률2.5%이상')])
+def test_export_filename(client, query, suffix):
+    resp = client.get(f'/export?source=filter&limit=5&format=csv{query}')
+    assert resp.status_code == 200
+    assert _download_name(resp) == f'안전마진_상위5종목{suffix}.csv'
@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+from changes import ChangeLog, diff_rows
+
+
+def _view(version, rows):
+    return SimpleNamespace(version=version, by_code={row['code']: row for row in rows})
+
+
+def test_diff_rows():
+    old = {'A': {'code': 'A', 'price': 1, 'note': 'x'}, 'B': {'code': 'B', 'price': 2}}
+    new = {'A': {'code': 'A', 'price': 3}, 'C': {'code': 'C', 'price': 4}}
+    changed, removed = diff_rows(old, new)
+    assert changed == {'A': {'price': 3, 'note': None}, 'C': {'code': 'C', 'price': 4}}
+    assert removed == ['B']
+
+
+def test_diff_rows_field_appears_with_none():
+    changed, _ = diff_rows({'A': {'code': 'A'}}, {'A': {'code': 'A', 'eps': None}})
+    assert changed == {'A': {'eps': None}}
+
+
+def test_since_merges_steps():
+    log = ChangeLog()
+    v1 = _view('v1', [{'code': 'A', 'p': 1}, {'code': 'B', 'p': 1}, {'code': 'C', 'p': 1}])
+    v2 = _view('v2', [{'code': 'A', 'p': 2}, {'code': 'C', 'p': 1}])
+    v3 = _view('v3', [{'code': 'A', 'p': 2}, {'code': 'B', 'p': 5}, {'code': 'C', 'p': 3}])
+    log.record(v1, v2)
+    log.record(v2, v3)
+
+    assert log.since('v1', 'v2') == ({'A': {'p': 2}}, ['B'])
+    # v2에서 빠졌다가 v3에서 돌아온 B는 행 전체로 나온다
+    assert log.since('v1', 'v3') == ({'A': {'p': 2}, 'B': {'code': 'B', 'p': 5}, 'C': {'p': 3}}, [])
+    assert log.since('v2', 'v3') == ({'B': {'code': 'B', 'p': 5}, 'C': {'p': 3}}, [])
+    assert log.since('v3', 'v3') == ({}, [])
+    assert log.since('v1', 'v3', codes=['C', 'Z']) == ({'C': {'p': 3}}, [])
+    assert log.since('v1', 'v2', codes=['B']) == ({}, ['B'])
+
+
+def test_since_unknown_version_needs_resync():
+    log = ChangeLog()
+    log.record(_view('v1', [{'code': 'A', 'p': 1}]), _view('v2', [{'code': 'A', 'p': 2}]))
+    assert log.since('v0', 'v2') is None
+    # 고리가 아직 기록하지 않은 버전까지는 이을 수 없다
+    assert log.since('v1', 'v9') is None
+
+
+def test_gap_clears_ring():
+    log = ChangeLog()
+    log.record(_view('v1', [{'code': 'A', 'p': 1}]), _view('v2', [{'code': 'A', 'p': 2}]))
+    # v3을 놓치고 v4 → v5를 받았다
+    log.record(_view('v4', [{'code': 'A', 'p': 4}]), _view('v5', [{'code': 'A', 'p': 5}]))
+    assert log.since('v1', 'v5') is None
+    assert log.since('v4', 'v5') == ({'A': {'p': 5}}, [])
+
+
+def test_ring_drops_old_versions():
+    log = ChangeLog(size=2)
+    views = [_view(f'v{i}', [{'code': 'A', 'p': i}]) for i in range(4)]
+    for old, new in zip(views, views[1:]):
+        log.record(old, new)
+    assert log.since('v0', 'v3') is None
+    assert log.since('v1', 'v3') == ({'A': {'p': 3}}, [])
+
+
+def test_first_view_is_not_recorded():
+    log = ChangeLog()
+    log.record(None, _view('v1', []))
+    log.record(_view('', []), _view('v1', []))
+    assert log.since('', 'v1') is None
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from crawl_engine import Engine
+from crawl_rate import AdaptiveLimit
+
+
+class Hosts:
+    """블로킹 요청 흉내. 호스트별로 동시에 돈 요청 수의 최댓값과 시작 시각을 남긴다."""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.inflight = {}
+        self.peak = {}
+        self.starts = []
+        self._lock = threading.Lock()
+
+    def request(self, host, item):
+        with self._lock:
+            self.starts.append(time.monotonic())
+            self.inflight[host] = self.inflight.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.inflight[host])
+        time.sleep(self.delay)
+        with self._lock:
+            self.inflight[host] -= 1
+        return item
+
+
+def _two_hosts(hosts):
+    async def work(engine, item):
+        a = await engine.call('naver', hosts.request, 'naver', item)
+        b = await engine.call('wisereport', hosts.request, 'wisereport', item)
+        return a + b
+    return work
+
+
+def test_every_item_done_within_host_limits():
+    hosts = Hosts()
+    engine = Engine({'naver': 3, 'wisereport': AdaptiveLimit('wisereport', 2, ceiling=2)})
+    results = {}
+    unstarted = engine.run(range(40), _two_hosts(hosts), results.__setitem__)
+    assert unstarted == 0 and engine.started == engine.completed == 40
+    assert results == {i: 2 * i for i in range(40)}
+    assert hosts.peak == {'naver': 3, 'wisereport': 2}
+
+
+def test_expired_deadline_starts_nothing():
+    hosts = Hosts()
+    engine = Engine({'naver': 4, 'wisereport': 4}, deadline=time.monotonic() - 1)
+    results = []
+    assert engine.run(range(10), _two_hosts(hosts), lambda item, r: results.append(item)) == 10
+    assert results == [] and hosts.starts == [] and engine.started == 0
+
+
+def test_deadline_stops_new_requests_and_finishes_sent_ones():
+    hosts = Hosts(delay=0.05)
+    deadline = time.monotonic() + 0.2
+    engine = Engine({'naver': 2, 'wisereport': 2}, deadline=deadline)
+    results = {}
+    unstarted = engine.run(range(100), _two_hosts(hosts), results.__setitem__)
+    # 마감 뒤에는 요청을 시작하지 않는다. 보낸 요청은 마저 받는다.
+    # 마감 확인과 스레드에서 시작하는 사이의 틈만큼은 봐준다
+    assert hosts.starts and max(hosts.starts) <= deadline + 0.02
+    assert all(v == 0 for v in hosts.inflight.values())
+    assert 0 < len(results) < 100
+    assert engine.completed == engine.started == len(results)
+    assert unstarted == engine.unstarted == 100 - len(results)
+
+
+def test_budget_exhausted_midway_counts_item_as_unstarted():
+    hosts = Hosts()
+    engine = Engine({'naver': 1, 'wisereport': 1})
+
+    async def work(engine, item):
+        await engine.call('naver', hosts.request, 'naver', item)
+        if item == 1:
+            # 첫 요청 뒤에 예산이 다했다
+            engine.deadline = time.monotonic() - 1
+        return await engine.call('wisereport', hosts.request, 'wisereport', item)
+
+    results = {}
+    unstarted = engine.run([0, 1, 2], work, results.__setitem__)
+    assert 1 not in results and unstarted == engine.unstarted >= 1
+    assert engine.completed == len(results) and engine.completed + engine.unstarted == 3
+
+
+def test_work_errors_propagate():
+    engine = Engine({'naver': 1})
+
+    async def work(engine, item):
+        raise ValueError(item)
+
+    with pytest.raises(ValueError):
+        engine.run([1], work, lambda item, r: None)
+
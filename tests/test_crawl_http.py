@@ -0,0 +1,97 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import crawl_http
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    statuses = {'/ok': 200, '/throttled': 429, '/blocked': 403, '/error': 503}
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        self.server.headers.append(dict(self.headers))
+        if self.path == '/slow':
+            time.sleep(0.5)
+        body = b'{}'
+        self.send_response(self.statuses.get(self.path, 200))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except BrokenPipeError:
+            pass                    # 클라이언트가 타임아웃으로 먼저 끊었다
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.connections, httpd.headers = set(), []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class _Controller:
+    def __init__(self):
+        self.outcomes = []
+
+    def record(self, seconds, outcome):
+        self.outcomes.append(outcome)
+
+
+def test_connections_are_reused_across_threads(server):
+    httpd, base = server
+    c = crawl_http.HostClient('local', pool_size=3, headers={'Referer': 'https://example.com'})
+
+    def crawl():
+        for _ in range(20):
+            assert c.get(f'{base}/ok').status_code == 200
+
+    threads = [threading.Thread(target=crawl) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = c.stats()
+    c.close()
+    assert stats['requests'] == 60 and stats['errors'] == 0
+    assert stats['connections'] == len(httpd.connections) <= 3
+    assert stats['reused'] == 60 - stats['connections']
+    assert all(h['Accept-Encoding'] == 'gzip, deflate' and h['Referer'] == 'https://example.com'
+               for h in httpd.headers)
+
+
+def test_outcomes_reach_the_controller(server):
+    _, base = server
+    controller = _Controller()
+    c = crawl_http.HostClient('local', pool_size=1, controller=controller)
+    for path in ('/ok', '/throttled', '/blocked', '/error'):
+        c.get(f'{base}{path}')
+    with pytest.raises(requests.Timeout):
+        c.get(f'{base}/slow', timeout=0.1)
+    assert controller.outcomes == ['ok', 'throttled', 'throttled', 'error', 'timeout']
+    assert c.stats()['requests'] == 5 and c.stats()['errors'] == 1
+    c.close()
+
+
+def test_report_skips_idle_hosts(server, monkeypatch):
+    _, base = server
+    monkeypatch.setattr(crawl_http, '_clients', [])
+    assert crawl_http.report() == '🔌 연결 요청 없음'
+    busy = crawl_http.client('busy', 1)
+    crawl_http.client('idle', 1)
+    for _ in range(4):
+        busy.get(f'{base}/ok')
+    assert crawl_http.report() == '🔌 연결 busy 요청 4회 / 새 연결 1개 / 재사용 75% / 실패 0회'
+    busy.close()
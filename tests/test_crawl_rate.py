@@ -0,0 +1,43 @@
+from crawl_rate import SLOW_FACTOR, AdaptiveLimit
+
+
+def test_success_grows_limit_up_to_ceiling():
+    lim = AdaptiveLimit('t', 2, ceiling=4)
+    for _ in range(200):
+        lim.record(0.1, 'ok')
+    assert lim.limit == 4
+
+
+def test_throttle_during_hold_off_clamps_limit_to_ceiling():
+    lim = AdaptiveLimit('t', 10, ceiling=16)
+    lim.record(0.1, 'timeout')          # 줄이고 쿨다운에 들어간다
+    before = lim.limit
+    lim.record(0.1, 'throttled')        # 쿨다운이라 곱해서 줄이지는 않는다
+    assert lim.ceiling < before
+    assert lim.limit <= lim.ceiling
+
+
+def test_baseline_follows_a_new_normal_latency():
+    lim = AdaptiveLimit('t', 8, ceiling=16)
+    for _ in range(50):
+        lim.record(0.1, 'ok')
+    lim._hold_until = float('inf')      # 감속은 보지 않고 '평소'만 본다
+    # 예전 최솟값의 몇 배지만 일정한 응답 시간이 오래 이어진다
+    for _ in range(1000):
+        lim.record(0.1 * SLOW_FACTOR * 2, 'ok')
+    assert lim._latency <= lim._baseline * SLOW_FACTOR
+    # 그 상태에서 평범한 요청은 다시 상한을 늘린다
+    lim._hold_until = 0.0
+    limit = lim.limit
+    lim.record(0.1 * SLOW_FACTOR * 2, 'ok')
+    assert lim.limit >= limit
+
+
+def test_sudden_slowdown_backs_off():
+    lim = AdaptiveLimit('t', 8, ceiling=16)
+    for _ in range(50):
+        lim.record(0.1, 'ok')
+    limit = lim.limit
+    for _ in range(30):
+        lim.record(5.0, 'ok')
+    assert lim.limit < limit
@@ -0,0 +1,100 @@
+"""RemoteDataCache의 stale-while-revalidate."""
+
+import threading
+import time
+
+import pytest
+
+import storage
+
+FILE = 'swr_test.json'
+
+
+@pytest.fixture
+def cache(app_module, monkeypatch):
+    storage.upload_to_supabase(FILE, [{'code': 'A', 'v': 1}])
+    cache = app_module.RemoteDataCache(FILE)
+    cache.refresh_now()
+    storage.upload_to_supabase(FILE, [{'code': 'A', 'v': 2}])
+    return cache
+
+
+@pytest.fixture
+def gate(app_module, monkeypatch):
+    """본문 다운로드를 세고, release()할 때까지 붙잡는다."""
+    fetch = app_module.download_bytes_from_supabase
+    calls = []
+    opened = threading.Event()
+
+    def blocked(name):
+        calls.append(name)
+        opened.wait(5)
+        return fetch(name)
+
+    monkeypatch.setattr(app_module, 'download_bytes_from_supabase', blocked)
+    return calls, opened
+
+
+def _expire(app_module, cache):
+    cache._fetched_at -= app_module.CACHE_TTL + 1
+
+
+def _wait_for(predicate):
+    deadline = time.monotonic() + 5
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_fresh_data_is_served_without_download(cache, gate):
+    calls, _ = gate
+    assert cache.get() == [{'code': 'A', 'v': 1}]
+    assert calls == []
+
+
+def test_stale_data_is_served_while_one_refresh_runs(app_module, cache, gate):
+    calls, opened = gate
+    _expire(app_module, cache)
+    before = cache.version
+    # 다운로드가 막혀 있어도 옛 데이터가 바로 나온다. 갱신은 한 번만 돈다
+    for _ in range(5):
+        assert cache.get() == [{'code': 'A', 'v': 1}]
+    _wait_for(lambda: calls)
+    assert calls == [FILE] and cache.status()['refreshing']
+
+    opened.set()
+    _wait_for(lambda: cache.version != before)
+    assert cache.get() == [{'code': 'A', 'v': 2}]
+    _wait_for(lambda: not cache.status()['refreshing'])
+    assert calls == [FILE]
+
+
+def test_failed_refresh_keeps_old_data(app_module, cache, monkeypatch):
+    monkeypatch.setattr(app_module, 'download_bytes_from_supabase', lambda name: None)
+    monkeypatch.setattr(app_module, 'download_manifest', lambda name: None)
+    _expire(app_module, cache)
+    before = cache.version
+    assert cache.get() == [{'code': 'A', 'v': 1}]
+    _wait_for(lambda: cache.failures == 1 and not cache.status()['refreshing'])
+    assert cache.version == before and cache.last_error
+    assert cache.get() == [{'code': 'A', 'v': 1}]
+
+
+def test_without_swr_the_request_waits_for_new_data(app_module, cache, gate, monkeypatch):
+    calls, opened = gate
+    monkeypatch.setattr(app_module, 'CACHE_STALE_WHILE_REVALIDATE', False)
+    opened.set()
+    _expire(app_module, cache)
+    assert cache.get() == [{'code': 'A', 'v': 2}]
+    assert calls == [FILE]
+
+
+def test_refresh_ahead_starts_before_expiry(app_module, cache, gate, monkeypatch):
+    calls, opened = gate
+    monkeypatch.setattr(app_module, 'CACHE_REFRESH_AHEAD', 60)
+    cache._fetched_at -= app_module.CACHE_TTL - 30      # 만료 30초 전
+    before = cache.version
+    assert cache.get() == [{'code': 'A', 'v': 1}]
+    opened.set()
+    _wait_for(lambda: cache.version != before)
+    assert calls == [FILE]
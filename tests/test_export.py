@@ -0,0 +1,54 @@
+"""/export가 /filter·/ncav와 같은 종목을 같은 순서로 내보내는지."""
+
+import csv
+import io
+
+import pytest
+
+
+def _csv_codes(resp):
+    assert resp.status_code == 200, resp.get_json()
+    rows = list(csv.reader(io.StringIO(resp.data.decode('utf-8-sig'))))
+    assert rows[0][0] == '종목코드'
+    return [row[0] for row in rows[1:]]
+
+
+def _api_codes(client, url):
+    return [s['code'] for s in client.get(url).get_json()['stocks']]
+
+
+@pytest.mark.parametrize('query', ['limit=30', 'limit=30&dividend=0', 'limit=50&dividend=2.5'])
+def test_filter_rows_match_api(client, query):
+    exported = _csv_codes(client.get(f'/export?source=filter&format=csv&{query}'))
+    assert exported == _api_codes(client, f'/filter?{query}')
+
+
+def test_filter_without_limit_exports_everything_ranked(app_module, client):
+    exported = _csv_codes(client.get('/export?source=filter&format=csv'))
+    ranked = app_module.get_market_view().results.ranked
+    assert exported == [s['code'] for s in ranked]
+
+
+@pytest.mark.parametrize('query', ['limit=40', 'limit=40&positive=true', 'limit=40&positive=true&dividend=1'])
+def test_ncav_rows_match_api(client, query):
+    exported = _csv_codes(client.get(f'/export?source=ncav&format=csv&{query}'))
+    assert exported == _api_codes(client, f'/ncav?{query}')
+
+
+def test_watchlist_keeps_given_order(app_module, client):
+    ranked = app_module.get_market_view().results.ranked
+    codes = [ranked[5]['code'], 'NOPE00', ranked[0]['code'], ranked[3]['code']]
+    exported = _csv_codes(client.get(f"/export?source=watchlist&format=csv&codes={','.join(codes)}"))
+    assert exported == [codes[0], codes[2], codes[3]]
+
+
+def test_xlsx_is_a_workbook(client):
+    resp = client.get('/export?source=filter&limit=5')
+    assert resp.status_code == 200
+    assert resp.mimetype.endswith('spreadsheetml.sheet') and resp.data[:2] == b'PK'
+
+
+@pytest.mark.parametrize('query', ['source=filter&format=pdf', 'source=filter&limit=-1', 'source=unknown',
+                                   'source=watchlist&codes=NOPE00'])
+def test_bad_requests(client, query):
+    assert client.get(f'/export?{query}').status_code == 400
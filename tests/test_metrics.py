@@ -0,0 +1,54 @@
+import os
+import time
+
+import metrics
+
+
+def _lines(text, prefix):
+    return [line for line in text.splitlines() if line.startswith(prefix)]
+
+
+def test_histogram_buckets_are_cumulative():
+    h = metrics.Histogram('test_latency_seconds', '테스트', ('route',), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        h.observe(('/a',), value)
+    text = metrics.render({'7': {h.name: h._dump()}})
+    assert _lines(text, 'test_latency_seconds_bucket') == [
+        'test_latency_seconds_bucket{route="/a",worker="7",le="0.1"} 2',
+        'test_latency_seconds_bucket{route="/a",worker="7",le="1"} 3',
+        'test_latency_seconds_bucket{route="/a",worker="7",le="+Inf"} 4',
+    ]
+    assert 'test_latency_seconds_sum{route="/a",worker="7"} 3.65' in text
+    assert 'test_latency_seconds_count{route="/a",worker="7"} 4' in text
+    assert '# TYPE test_latency_seconds histogram' in text
+
+
+def test_workers_keep_their_own_series():
+    c = metrics.Counter('test_hits_total', '테스트', ('path',))
+    c.inc(('/x"y',), 2)
+    one = {c.name: c._dump()}
+    text = metrics.render({'1': one, '2': one})
+    assert _lines(text, 'test_hits_total{') == ['test_hits_total{path="/x\\"y",worker="1"} 2',
+                                               'test_hits_total{path="/x\\"y",worker="2"} 2']
+    assert text.count('# HELP test_hits_total') == 1
+
+
+def test_worker_snapshots_expire(tmp_path):
+    metrics.write_worker_snapshot(tmp_path, 'live', {'m': {}})
+    metrics.write_worker_snapshot(tmp_path, 'dead', {'m': {}})
+    old = time.time() - 600
+    os.utime(tmp_path / 'dead.json', (old, old))
+    assert set(metrics.read_worker_snapshots(tmp_path, max_age=60)) == {'live'}
+    assert not (tmp_path / 'dead.json').exists()
+
+
+def test_metrics_route_counts_requests(app_module, client, monkeypatch):
+    client.get('/filter?limit=1')
+    text = client.get('/metrics').get_data(as_text=True)
+    worker = str(os.getpid())
+    assert f'ivc_requests_total{{route="/filter",method="GET",status="200",worker="{worker}"}}' in text
+    assert f'ivc_request_duration_seconds_count{{route="/filter",worker="{worker}"}}' in text
+
+    monkeypatch.setattr(app_module, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
@@ -0,0 +1,63 @@
+"""main.naver 파서 테스트.
+
+fixtures/naver_main_*.html은 main.naver의 구조(종목명, #chart_area의 현재가,
+#_dvr, #content 다섯째 구역의 기업실적분석 표)를 그대로 따르고 나머지는 줄인
+페이지다. naver_main_expected.json은 같은 페이지를 pandas로 읽던 이전
+파서가 낸 값이다.
+"""
+
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+smc = pytest.importorskip('safety_margin_calc_naver')
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PAGES = ('naver_main_005930', 'naver_main_edge')
+
+
+def _fetch(monkeypatch, name):
+    with open(os.path.join(FIXTURES, f'{name}.html'), encoding='utf-8') as f:
+        text = f.read()
+    response = SimpleNamespace(text=text, raise_for_status=lambda: None)
+    monkeypatch.setattr(smc, 'NAVER', SimpleNamespace(get=lambda url, timeout=None: response))
+    return smc.fetch_stock_page('005930')
+
+
+@pytest.mark.parametrize('name', PAGES)
+def test_matches_previous_parser(monkeypatch, name):
+    with open(os.path.join(FIXTURES, 'naver_main_expected.json'), encoding='utf-8') as f:
+        expected = json.load(f)[name]
+    result = smc.build_stock_result(_fetch(monkeypatch, name), {'shares': 0, 'ratio': 0})
+    assert {key: result[key] for key in expected} == expected
+
+
+def test_financial_rows_and_types(monkeypatch):
+    page = _fetch(monkeypatch, 'naver_main_005930')
+    assert page['financials'] == {
+        'EPS': (5777, 8057, 2131),
+        'BPS': (43611, 50817, 52002),
+        'PBR': (1.80, 1.09, 1.51),
+    }
+    assert all(type(v) is int for v in page['financials']['EPS'])
+
+
+def test_negative_and_missing_cells(monkeypatch):
+    page = _fetch(monkeypatch, 'naver_main_edge')
+    assert page['financials'] == {
+        'EPS': (-1234, -356, None),
+        'BPS': (12345, None, 11908),
+        'PBR': (0.87, None, 1.02),
+    }
+    assert page['dividend_yield'] is None
+
+
+def test_page_without_table(monkeypatch):
+    response = SimpleNamespace(text='<html><body><div id="middle"></div></body></html>',
+                               raise_for_status=lambda: None)
+    monkeypatch.setattr(smc, 'NAVER', SimpleNamespace(get=lambda url, timeout=None: response))
+    page = smc.fetch_stock_page('000000')
+    assert page['stock_name'] == 'Unknown' and page['current_price'] is None
+    assert page['financials'] == {name: (None, None, None) for name in ('EPS', 'BPS', 'PBR')}
@@ -0,0 +1,71 @@
+"""렌더링한 페이지 캐시: 키는 (화면, 격언 번호[, 데이터 버전])."""
+
+import gzip
+import json
+
+import pytest
+
+import storage
+
+QUOTES = [{'quote': f'격언 {i}번', 'author': f'저자{i}', 'source': '', 'original': ''} for i in range(3)]
+
+
+@pytest.fixture
+def pages(app_module, monkeypatch):
+    """빈 페이지 캐시와 고정된 격언 목록. 렌더링 횟수를 센다."""
+    monkeypatch.setattr(app_module, '_pages', app_module.ResponseCache(64, 'page'))
+    monkeypatch.setattr(app_module, '_quotes', QUOTES)
+    picked = {'i': 0}
+    monkeypatch.setattr(app_module.random, 'randrange', lambda n: picked['i'])
+    renders = []
+    render = app_module.render_template
+
+    def counting(name, **context):
+        renders.append((name, context.get('quote', {}).get('quote')))
+        return render(name, **context)
+
+    monkeypatch.setattr(app_module, 'render_template', counting)
+    return picked, renders
+
+
+@pytest.mark.parametrize('path, template', [('/', 'index.html'), ('/top-stocks', 'top-stocks.html')])
+def test_same_quote_renders_once(client, pages, path, template):
+    picked, renders = pages
+    first = client.get(path)
+    second = client.get(path)
+    assert first.status_code == second.status_code == 200
+    assert first.data == second.data and '격언 0번' in first.get_data(as_text=True)
+    assert renders == [(template, '격언 0번')]
+
+
+def test_each_quote_has_its_own_entry(client, pages):
+    picked, renders = pages
+    bodies = []
+    for i in (0, 1, 2, 1, 0):
+        picked['i'] = i
+        bodies.append(client.get('/').data)
+    assert [quote for _, quote in renders] == ['격언 0번', '격언 1번', '격언 2번']
+    assert bodies[0] == bodies[4] and bodies[1] == bodies[3] and len(set(bodies)) == 3
+
+
+def test_new_data_version_renders_again(app_module, client, pages, store):
+    picked, renders = pages
+    client.get('/top-stocks')
+    rows = json.loads(json.dumps(store))
+    rows[0]['volume'] = (rows[0].get('volume') or 0) + 777
+    storage.upload_to_supabase('all_safety_margin_results.json', rows)
+    assert app_module._results_cache.refresh_now()
+    client.get('/top-stocks')
+    client.get('/top-stocks')
+    # 데이터와 무관한 첫 화면은 그대로다
+    client.get('/')
+    client.get('/')
+    assert renders == [('top-stocks.html', '격언 0번')] * 2 + [('index.html', '격언 0번')]
+
+
+def test_compressed_page_is_the_same_page(client, pages):
+    plain = client.get('/', headers={'Accept-Encoding': 'identity'})
+    gz = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in plain.headers and 'ETag' not in plain.headers
+    assert gz.headers['Content-Encoding'] == 'gzip' and gzip.decompress(gz.data) == plain.data
+    assert len(pages[1]) == 1
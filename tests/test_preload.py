@@ -0,0 +1,58 @@
+"""gunicorn preload: 마스터가 받아 둔 데이터를 fork한 워커가 그대로 쓴다."""
+
+import gc
+import os
+import weakref
+
+import pytest
+
+
+@pytest.fixture
+def unfreeze():
+    yield
+    gc.unfreeze()
+
+
+class _Node:
+    pass
+
+
+def test_refreeze_releases_old_objects(app_module, unfreeze):
+    old = _Node()
+    old.cycle = old
+    ref = weakref.ref(old)
+    app_module._freeze()
+    assert gc.get_freeze_count() > 0
+    # 새 버전으로 바뀌어 옛 객체를 아무도 가리키지 않는다
+    del old
+    app_module._freeze()
+    assert ref() is None
+
+
+def test_preload_warms_views_and_freezes(app_module, monkeypatch, unfreeze):
+    monkeypatch.setattr(app_module, '_snapshot_master', False)
+    app_module.preload_snapshot()
+    market = app_module.get_market_view()
+    assert market._screen is not None and market._valuation is not None
+    assert gc.get_freeze_count() > 0
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='fork 없음')
+def test_forked_worker_keeps_pinned_data(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, '_snapshot_master', True)
+    cache = app_module._results_cache
+    version = cache.version
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            # 워커는 만료돼도 스스로 받지 않는다. 받으려 하면 실패로 끝낸다
+            app_module.download_bytes_from_supabase = lambda name: os._exit(3)
+            app_module.download_manifest = lambda name: os._exit(4)
+            cache._fetched_at -= app_module.CACHE_TTL + 1
+            if cache.pinned and cache.get() and cache.version == version and not cache._lock.locked():
+                code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
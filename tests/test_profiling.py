@@ -0,0 +1,82 @@
+import os
+import pstats
+import threading
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    monkeypatch.setattr(profiling, '_stages', None)
+
+
+def test_stages_off_by_default_record_nothing(stages):
+    with profiling.stage('a'):
+        pass
+    profiling.add_stage('b', 1.0)
+    assert profiling.stage('a') is profiling._NO_STAGE
+    assert profiling.stage_report() == {}
+
+
+def test_stages_count_total_and_max(stages):
+    profiling.enable_stages()
+    for seconds in (0.5, 2.0, 1.5):
+        profiling.add_stage('fetch', seconds)
+    with profiling.stage('parse'):
+        pass
+    report = profiling.stage_report()
+    assert list(report) == ['fetch', 'parse']
+    assert report['fetch'] == {'count': 3, 'total': 4.0, 'max': 2.0}
+    assert report['parse']['count'] == 1
+    # 다시 켜면 이전 기록은 지운다
+    profiling.enable_stages()
+    assert profiling.stage_report() == {}
+
+
+def test_stage_records_even_when_body_raises(stages):
+    profiling.enable_stages()
+    with pytest.raises(KeyError):
+        with profiling.stage('boom'):
+            raise KeyError()
+    assert profiling.stage_report()['boom']['count'] == 1
+
+
+def test_diff_stages():
+    before = {'fetch': {'total': 10.0}, 'gone': {'total': 1.0}}
+    after = {'fetch': {'total': 5.0}, 'new': {'total': 2.0}}
+    lines = profiling.diff_stages(before, after)
+    assert [line.split()[0] for line in lines[1:]] == ['fetch', 'gone', 'new']
+    assert lines[1].endswith('-50%') and lines[3].endswith('신규')
+
+
+def test_sampler_sees_other_threads():
+    release = threading.Event()
+
+    def parked_in_test():
+        release.wait(5)
+
+    worker = threading.Thread(target=parked_in_test, name='ThreadPoolExecutor-3_1')
+    worker.start()
+    sampler = profiling.Sampler(interval=0.005).start()
+    while sampler.samples < 5:
+        release.wait(0.01)
+    sampler.stop()
+    release.set()
+    worker.join()
+    stacks = [s for s in sampler.counts if 'test_profiling.py:parked_in_test' in s]
+    assert stacks and all(s.startswith('ThreadPoolExecutor;') for s in stacks)
+
+
+def test_profiled_request_writes_pstats(app_module, client, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, 'PROFILE_TOKEN', 'tok')
+    monkeypatch.setattr(app_module, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(app_module, 'PROFILE_KEEP', 2)
+    assert 'X-Profile' not in client.get('/filter?limit=1').headers
+    names = [client.get('/filter?limit=1', headers={'X-Profile-Token': 'tok'}).headers['X-Profile']
+             for _ in range(3)]
+    assert all(name.endswith('-filter.prof') for name in names) and len(set(names)) == 3
+    kept = sorted(os.listdir(tmp_path))
+    assert len(kept) == 2
+    assert pstats.Stats(str(tmp_path / kept[0])).total_calls > 0
@@ -0,0 +1,90 @@
+"""refresh_prices(컬럼 단위)가 예전의 종목별 루프와 같은 결과를 내는지."""
+
+import copy
+import math
+import random
+from datetime import datetime
+
+import pandas as pd
+import pytest
+import pytz
+
+import safety_margin_calc_naver as smc
+
+NOW = datetime(2026, 10, 16, 18, 0, tzinfo=pytz.timezone('Asia/Seoul'))
+
+
+def _loop_refresh(results_dict, krx, trading_date):
+    """예전 구현. 다만 예전에는 NaN 종가가 `price <= 0`을 빠져나가 NaN 주가로
+    덮어썼는데, 지금은 건너뛰므로 그 부분만 맞춰 두었다."""
+    stamp, updated = NOW.isoformat(), 0
+    for row in krx.itertuples(index=False):
+        stock = results_dict.get(row.Code)
+        if stock is None:
+            continue
+        try:
+            price = float(row.Close)
+        except (TypeError, ValueError):
+            continue
+        if not price > 0:
+            continue
+        stock['current_price'] = price
+        stock['price_updated'] = stamp
+        stock['price_date'] = trading_date
+        try:
+            stock['volume'] = int(row.Volume)
+        except (TypeError, ValueError):
+            stock['volume'] = None
+        iv = stock.get('intrinsic_value')
+        if iv is not None and not (isinstance(iv, float) and math.isnan(iv)):
+            stock['safety_margin'] = ((iv - price) / price) * 100
+        updated += 1
+    return updated
+
+
+def _market(n, seed=5):
+    rng = random.Random(seed)
+    results, rows = {}, []
+    for i in range(n):
+        code = f'{i:06d}'
+        results[code] = {'code': code, 'current_price': 1.0, 'safety_margin': 'old', 'volume': -1,
+                         'intrinsic_value': rng.choice((None, math.nan, 0, rng.uniform(-1e4, 1e6)))}
+        close = rng.choice((rng.randint(1, 10 ** 6), str(rng.randint(1, 10 ** 5)), 0, -5, None, '1,000', math.nan))
+        volume = rng.choice((rng.randint(0, 10 ** 7), None, math.nan))
+        rows.append({'Code': code, 'Name': code, 'Close': close, 'Volume': volume})
+    # KRX에만 있는 종목
+    rows += [{'Code': f'9{i:05d}', 'Name': '신규', 'Close': 1000, 'Volume': 1} for i in range(20)]
+    return results, pd.DataFrame(rows)
+
+
+@pytest.fixture
+def krx(monkeypatch):
+    results, frame = _market(3000)
+    monkeypatch.setattr(smc, 'KRX_STOCKS', frame)
+    monkeypatch.setattr(smc, 'get_latest_trading_date', lambda: '2026-10-16')
+    return results, frame
+
+
+def _same(a, b):
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return a == b and type(a) is type(b)
+
+
+def test_matches_row_loop(krx):
+    results, frame = krx
+    expected = copy.deepcopy(results)
+    count = _loop_refresh(expected, frame, '2026-10-16')
+    assert smc.refresh_prices(results, NOW) == count
+    assert results.keys() == expected.keys()
+    for code in results:
+        assert results[code].keys() == expected[code].keys(), code
+        for key in results[code]:
+            assert _same(results[code][key], expected[code][key]), (code, key)
+
+
+def test_missing_close_column_skips(monkeypatch):
+    monkeypatch.setattr(smc, 'KRX_STOCKS', pd.DataFrame({'Code': ['000001'], 'Name': ['x']}))
+    results = {'000001': {'code': '000001', 'current_price': 5}}
+    assert smc.refresh_prices(results, NOW) == 0
+    assert results == {'000001': {'code': '000001', 'current_price': 5}}
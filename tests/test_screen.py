@@ -0,0 +1,72 @@
+import math
+import random
+
+import numpy as np
+
+from screen import FIELDS, ScreenTable
+
+
+def _rows():
+    return [
+        {'code': 'A', 'safety_margin': 30.0, 'current_price': 1000, 'volume': 5},
+        {'code': 'B', 'safety_margin': None, 'current_price': 2000, 'volume': 7},
+        {'code': 'C', 'safety_margin': 10.0, 'current_price': float('nan'), 'volume': 5},
+        {'code': 'D', 'safety_margin': 30.0, 'current_price': 500, 'volume': True},
+        {'code': 'E', 'safety_margin': -5.0, 'current_price': 'x'},
+    ]
+
+
+def test_columns_treat_non_numbers_as_nan():
+    table = ScreenTable(_rows())
+    volume = table.columns['volume']
+    assert volume[0] == 5 and np.isnan(volume[3]) and np.isnan(volume[4])
+    assert np.isnan(table.columns['price'][2]) and np.isnan(table.columns['price'][4])
+
+
+def test_missing_values_sort_last_in_both_directions():
+    table = ScreenTable(_rows())
+    # 동점(A·D)은 원래 순서를 따른다
+    assert table.order('safety_margin').tolist() == [0, 3, 2, 4, 1]
+    assert table.order('safety_margin', descending=False).tolist() == [4, 2, 0, 3, 1]
+    assert table.order('price', descending=False).tolist() == [3, 0, 1, 2, 4]
+
+
+def test_ranges_are_inclusive_and_drop_missing():
+    table = ScreenTable(_rows())
+    assert table.screen([('safety_margin', 10, 30)]).tolist() == [0, 2, 3]
+    assert table.screen([('safety_margin', None, 10)]).tolist() == [2, 4]
+    assert table.screen([('safety_margin', 0, None), ('price', 600, None)]).tolist() == [0]
+    assert table.screen([('safety_margin', 0, None)], sort='price').tolist() == [0, 3, 2]
+    assert table.screen([]).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_joined_values_override_rows():
+    rows = _rows()
+    table = ScreenTable(rows, joined={'dividend_yield': [1.0, None, 3.0, 2.0, None]})
+    assert table.screen([('dividend_yield', 2, None)], sort='dividend_yield').tolist() == [2, 3]
+
+
+def test_matches_brute_force():
+    rng = random.Random(5)
+    rows = [{key: rng.choice((None, rng.randint(-50, 50), rng.uniform(-50, 50)))
+             for key in FIELDS.values()} for _ in range(300)]
+    table = ScreenTable(rows)
+
+    def number(v):
+        return v if isinstance(v, (int, float)) and not math.isnan(v) else None
+
+    for _ in range(100):
+        field = rng.choice(list(FIELDS))
+        sort = rng.choice([None] + list(FIELDS))
+        descending = rng.random() < 0.5
+        low, high = sorted(rng.uniform(-60, 60) for _ in range(2))
+        got = table.screen([(field, low, high)], sort, descending).tolist()
+
+        hits = [i for i, row in enumerate(rows)
+                if number(row[FIELDS[field]]) is not None and low <= row[FIELDS[field]] <= high]
+        if sort is not None:
+            present = [i for i in hits if number(rows[i][FIELDS[sort]]) is not None]
+            missing = [i for i in hits if number(rows[i][FIELDS[sort]]) is None]
+            sign = -1 if descending else 1
+            hits = sorted(present, key=lambda i: (sign * rows[i][FIELDS[sort]], i)) + missing
+        assert got == hits
@@ -0,0 +1,93 @@
+import random
+
+from search_index import SearchIndex, is_choseong_query, normalize, to_choseong
+
+STOCKS = [
+    {'code': '005930', 'name': '삼성전자'},
+    {'code': '005935', 'name': '삼성전자우'},
+    {'code': '000660', 'name': 'SK하이닉스'},
+    {'code': '028260', 'name': '삼성물산'},
+    {'code': '006400', 'name': '삼성SDI'},
+    {'code': '000810', 'name': '삼성화재'},
+    {'code': '035420', 'name': 'NAVER'},
+    {'code': '207940', 'name': '삼성바이오로직스'},
+    {'code': '032830', 'name': '삼성생명'},
+    {'code': '000000', 'name': '전자'},
+]
+
+
+def _names(results):
+    return [s['name'] for s in results]
+
+
+def test_choseong():
+    assert to_choseong('삼성전자') == 'ㅅㅅㅈㅈ'
+    assert to_choseong('SK하이닉스') == 'SKㅎㅇㄴㅅ'
+    assert is_choseong_query('ㅅㅅ') and not is_choseong_query('ㅅa') and not is_choseong_query('')
+
+
+def test_normalize():
+    assert normalize(' SK 하이닉스 ') == 'sk하이닉스'
+    assert normalize(None) == ''
+
+
+def test_ranking_exact_then_prefix_then_infix():
+    index = SearchIndex(STOCKS)
+    assert _names(index.search('전자')) == ['전자', '삼성전자', '삼성전자우']
+    assert _names(index.search('삼성전자')) == ['삼성전자', '삼성전자우']
+    assert _names(index.search('sk 하이')) == ['SK하이닉스']
+
+
+def test_choseong_search():
+    index = SearchIndex(STOCKS)
+    assert _names(index.search('ㅅㅅㅈㅈ')) == ['삼성전자', '삼성전자우']
+    assert _names(index.search('ㅈㅈ')) == ['전자', '삼성전자', '삼성전자우']
+
+
+def test_code_prefix():
+    index = SearchIndex(STOCKS)
+    assert _names(index.search('00593')) == ['삼성전자', '삼성전자우']
+    assert _names(index.search('005935')) == ['삼성전자우']
+
+
+def test_limit_and_empty():
+    index = SearchIndex(STOCKS)
+    assert len(index.search('삼성', limit=3)) == 3
+    assert index.search('삼성', limit=0) == []
+    assert index.search('   ') == []
+    assert index.search('없는종목') == []
+
+
+def _reference(stocks, query, limit):
+    needle = normalize(query)
+    choseong = is_choseong_query(needle)
+    tiers = []
+    for i, s in enumerate(stocks):
+        text = normalize(s['name'])
+        if choseong:
+            text = to_choseong(text)
+        code = s['code'].lower()
+        if text == needle or code == needle:
+            tier = 0
+        elif text.startswith(needle) or code.startswith(needle):
+            tier = 1
+        elif needle in text:
+            tier = 2
+        else:
+            continue
+        tiers.append((tier, i))
+    return [stocks[i] for _, i in sorted(tiers)[:limit]]
+
+
+def test_matches_brute_force():
+    rng = random.Random(1)
+    syllables = '삼성전자하이닉스물산바이오'
+    stocks = [{'code': f'{rng.randint(0, 999999):06d}',
+               'name': ''.join(rng.choice(syllables) for _ in range(rng.randint(1, 5)))}
+              for _ in range(500)]
+    index = SearchIndex(stocks)
+    queries = ['삼', '삼성', '전자하', 'ㅅ', 'ㅅㅅ', 'ㅈㅈㅎ', '0', '12', '123']
+    queries += [s['name'][:rng.randint(1, len(s['name']))] for s in stocks[:50]]
+    for query in queries:
+        for limit in (1, 5, 50, 1000):
+            assert index.search(query, limit) == _reference(stocks, query, limit), (query, limit)
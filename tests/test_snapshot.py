@@ -0,0 +1,64 @@
+import math
+
+import pytest
+
+from snapshot import Snapshot, SnapshotStore, write_snapshot
+
+ROWS = [
+    {'code': '005930', 'name': '삼성전자', 'current_price': 70000, 'safety_margin': 12.5,
+     'treasury_ratio': 0, 'listed': True, 'tags': ['반도체'], 'eps_1y': None},
+    {'code': '000660', 'name': 'SK하이닉스', 'current_price': 123456.5, 'safety_margin': None,
+     'treasury_ratio': 1.25, 'listed': False, 'tags': None, 'eps_1y': 3000},
+    {'code': '035420', 'name': '네이버', 'current_price': None, 'safety_margin': -3.0,
+     'treasury_ratio': 7, 'listed': None, 'tags': {'a': 1}, 'eps_1y': 12.0},
+    # 키가 빠진 행
+    {'code': '999999', 'name': '빈 종목'},
+]
+
+
+@pytest.fixture
+def snap(tmp_path):
+    path = tmp_path / 'rows.snap'
+    write_snapshot(ROWS, str(path))
+    return Snapshot(str(path))
+
+
+def test_roundtrip_every_row(snap):
+    assert len(snap) == len(ROWS)
+    for record, row in zip(snap, ROWS):
+        assert dict(record) == row
+
+
+def test_mixed_int_float_column_keeps_types(snap):
+    assert type(snap[0]['current_price']) is int
+    assert type(snap[1]['current_price']) is float
+    assert type(snap[0]['treasury_ratio']) is int
+    assert type(snap[1]['eps_1y']) is int
+    assert type(snap[2]['eps_1y']) is float
+
+
+def test_missing_key(snap):
+    assert 'current_price' not in snap[3]
+    with pytest.raises(KeyError):
+        snap[3]['current_price']
+
+
+def test_nan_reads_back_as_none(tmp_path):
+    path = str(tmp_path / 'nan.snap')
+    write_snapshot([{'v': math.nan}, {'v': 1.5}], path)
+    assert [r['v'] for r in Snapshot(path)] == [None, 1.5]
+
+
+def test_large_int_mixed_with_float_is_exact(tmp_path):
+    rows = [{'v': 2 ** 60 + 1}, {'v': 0.5}]
+    path = str(tmp_path / 'big.snap')
+    write_snapshot(rows, path)
+    assert [dict(r) for r in Snapshot(path)] == rows
+
+
+def test_store_reuses_written_version(tmp_path):
+    store = SnapshotStore(str(tmp_path), 'results.json')
+    assert store.load('v1') is None
+    saved = store.save(ROWS, 'v1')
+    assert [dict(r) for r in saved] == ROWS
+    assert [dict(r) for r in store.load('v1')] == ROWS
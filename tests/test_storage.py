@@ -0,0 +1,45 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import storage
+
+
+@pytest.fixture
+def local_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'STORAGE_LOCAL_DIR', str(tmp_path))
+    return tmp_path
+
+
+def test_upload_writes_data_then_manifest(local_dir):
+    rows = [{'code': 'A', 'price_date': '2026-10-16'}, {'code': 'B', 'price_date': '2026-10-17'}]
+    assert storage.upload_to_supabase('r.json', rows)
+    raw = storage.download_bytes_from_supabase('r.json')
+    meta = storage.download_manifest('r.json')
+    assert json.loads(raw) == rows
+    assert meta['sha256'] == hashlib.sha256(raw).hexdigest()
+    assert meta['rows'] == 2 and meta['price_date'] == '2026-10-17'
+    assert storage.download_from_supabase('r.json') == rows
+
+
+def test_upload_without_manifest(local_dir):
+    assert storage.upload_to_supabase('state.json', {'a': 1}, manifest=False)
+    assert storage.download_manifest('state.json') is None
+    assert not os.path.exists(local_dir / storage.manifest_name('state.json'))
+
+
+def test_missing_file(local_dir):
+    assert storage.download_from_supabase('none.json') is None
+    assert storage.download_manifest('none.json') is None
+
+
+def test_does_not_import_profiler():
+    # 웹앱의 저장소 계층은 supabase·python-dotenv 말고는 끌어오지 않는다
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, '-c', 'import storage, sys; print("profiling" in sys.modules)'],
+                         cwd=root, capture_output=True, text=True, check=True).stdout
+    assert out.strip() == 'False'
@@ -0,0 +1,122 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from valuation import BPS_FIELDS, EPS_FIELDS, ValuationTable, intrinsic_values, revalue, safety_margins
+
+
+def _row(eps, bps, ratio=0, price=10000, code='000000'):
+    row = {'code': code, 'treasury_ratio': ratio, 'current_price': price}
+    row.update(zip(EPS_FIELDS, eps))
+    row.update(zip(BPS_FIELDS, bps))
+    return row
+
+
+def _random_rows(n, seed=7):
+    rng = random.Random(seed)
+
+    def value(scale):
+        return None if rng.random() < 0.05 else round(rng.uniform(-0.2, 1) * scale, rng.choice((0, 2)))
+
+    rows = []
+    for _ in range(n):
+        if rng.random() < 0.05:
+            # 내재가치가 0인 종목
+            eps, bps = [0, 0, 0], [0, 0, 0]
+        else:
+            eps, bps = [value(5000) for _ in range(3)], [value(50000) for _ in range(3)]
+        rows.append(_row(eps, bps, ratio=rng.choice((0, 0, rng.uniform(0, 60), 100, 120)),
+                         price=rng.choice((None, 0, rng.randint(100, 500000)))))
+    return rows
+
+
+def _same(a, b):
+    if a is None or b is None:
+        return a is b
+    return (math.isnan(a) and math.isnan(b)) or a == b
+
+
+def test_parity_with_crawler():
+    smc = pytest.importorskip('safety_margin_calc_naver')
+    rows = _random_rows(3000)
+    revalued = [dict(r) for r in rows]
+    revalue(revalued)
+
+    for row, vector in zip(rows, revalued):
+        page = {'stock_name': row['code'], 'current_price': row['current_price'], 'dividend_yield': None,
+                'financials': {'EPS': tuple(row[f] for f in EPS_FIELDS),
+                               'BPS': tuple(row[f] for f in BPS_FIELDS),
+                               'PBR': (None, None, None)}}
+        scalar = smc.build_stock_result(page, {'ratio': row['treasury_ratio'], 'shares': 0})
+        # 비트 단위로 같고, None·NaN도 같은 자리에 나온다
+        assert _same(scalar['intrinsic_value'], vector['intrinsic_value']), row
+        assert _same(scalar['safety_margin'], vector['safety_margin']), row
+
+
+def test_zero_intrinsic_value_gives_minus_100():
+    rows = [_row([0, 0, 0], [0, 0, 0], price=5000)]
+    revalue(rows)
+    assert rows[0]['intrinsic_value'] == 0 and rows[0]['safety_margin'] == -100
+
+
+def test_treasury_ratio_of_100_or_more_is_nan():
+    values, undefined = intrinsic_values([[1, 1, 1]] * 3, [[1, 1, 1]] * 3, [100, 150, 50])
+    assert math.isnan(values[0]) and math.isnan(values[1])
+    assert values[2] == pytest.approx((10 + 1) / 2 * 2)
+    assert not undefined.any()
+
+
+def test_safety_margin_edges():
+    values = np.array([0.0, 150.0, 150.0, np.nan])
+    undefined = np.array([False, False, False, False])
+    margins = safety_margins(values, undefined, [100, 0, np.nan, 100])
+    assert margins[0] == -100
+    assert np.isnan(margins[1:]).all()
+
+
+def test_revalue_keeps_none_and_nan_apart():
+    rows = [_row([1, 2, None], [None, 1, 2]),           # 양쪽에 빈 값 → None
+            _row([1, 2, 3], [None, 1, None]),           # 한쪽만 → NaN
+            _row([100, 100, 100], [1000, 1000, 1000], price=None),
+            {'code': 'old', 'intrinsic_value': 5.0, 'safety_margin': 1.0}]
+    # 0번 행은 전에도 값이 없었으므로 바뀐 것으로 치지 않는다
+    assert revalue(rows) == (3, 2)
+    assert rows[0]['intrinsic_value'] is None and rows[0]['safety_margin'] is None
+    assert math.isnan(rows[1]['intrinsic_value']) and math.isnan(rows[1]['safety_margin'])
+    assert rows[2]['intrinsic_value'] == 1000 and rows[2]['safety_margin'] is None
+    assert rows[3]['intrinsic_value'] == 5.0
+    assert revalue(rows) == (3, 0)
+
+
+def test_top_breaks_ties_by_row_order():
+    # 행 1~6의 안전마진이 모두 같다. 경계에 걸린 동점은 앞 행이 든다
+    rows = [_row([100] * 3, [1000] * 3, price=500)]
+    rows += [_row([100] * 3, [1000] * 3, price=800, code=str(i)) for i in range(6)]
+    rows += [_row([None] * 3, [None] * 3)]
+    table = ValuationTable(rows)
+    for count in range(1, 9):
+        picked, values, margins, ranked = table.top(count)
+        assert picked.tolist() == list(range(min(count, 7)))
+        assert ranked == 7
+    assert table.covered == len(rows)
+
+
+def test_top_matches_full_sort():
+    rows = _random_rows(2000, seed=3)
+    # 동점을 많이 만든다
+    for r in rows[::3]:
+        r.update(current_price=1000, eps_3y=50, eps_2y=50, eps_1y=50, bps_1y=500, treasury_ratio=0)
+    table = ValuationTable(rows)
+    _, margins = table.evaluate()
+    order = sorted((i for i in range(len(rows)) if not math.isnan(margins[i])), key=lambda i: (-margins[i], i))
+    for count in (1, 10, 500, 5000):
+        assert table.top(count)[0].tolist() == order[:count]
+
+
+def test_top_with_custom_parameters():
+    rows = [_row([100, 0, 0], [0, 0, 0], price=100), _row([0, 0, 100], [0, 0, 0], price=100, code='1')]
+    table = ValuationTable(rows)
+    assert table.top(1)[0].tolist() == [1]
+    assert table.top(1, eps_weights=(3, 2, 1))[0].tolist() == [0]
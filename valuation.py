@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""내재가치·안전마진 계산을 전 종목에 대해 한 번에 한다.
+
+크롤러는 종목마다 연도별 EPS·BPS·PBR과 자사주 비율을 결과 행에 남기고,
+내재가치와 안전마진은 매 실행(PRICE_ONLY 포함) 끝에 이 모듈이 그 값들로
+다시 구한다. 공식(EPS 연도 가중치, EPS 배수, 자사주 조정)을 바꿔도 재크롤링
+없이 다음 실행에 전 종목이 새 공식으로 바뀐다.
+
+공식과 아래 규칙은 크롤러의 종목별 계산(safety_margin_calc_naver의
+calculate_intrinsic_value·build_stock_result)과 같다. 안전마진은 양쪽 모두
+safety_margin()이나 그 벡터판 safety_margins()로 구하고, 기본값이면 결과가
+비트 단위로 같다.
+
+  EPS 가중평균 = (직전년도×3 + 2년전×2 + 3년전×1) / 6
+  내재가치     = (EPS 가중평균×10 + 직전년도 BPS) / 2
+  자사주 비율 r > 0이면 × 100 / (100 - r)
+
+값이 없을 때의 규칙도 그대로다.
+- EPS와 BPS 양쪽에 빈 연도가 있으면 계산 불가(None)
+- 한쪽에만 있으면 NaN (웹앱은 '계산 불가'로 표시)
+- 자사주 비율이 100% 이상이면 잘못 긁힌 값이므로 NaN
+- 안전마진은 내재가치가 None이거나 주가가 없으면(None·0·NaN) None, 내재가치가
+  NaN이면 NaN. 내재가치가 0이면 -100이다
+
+웹앱의 /whatif는 ValuationTable로 같은 계산을 사용자가 준 가중치·배수로
+한다. 원재료 배열은 데이터 버전마다 한 번 만들고, 요청마다 하는 일은 벡터
+연산 몇 번과 상위 N개 고르기뿐이다.
+
+numpy를 쓴다. 웹앱은 이 모듈을 쓰는 경로에서만 임포트한다.
+"""
+
+import math
+from operator import itemgetter
+
+import numpy as np
+
+# 결과 행의 키. 순서는 3년전, 2년전, 직전년도다
+EPS_FIELDS = ('eps_3y', 'eps_2y', 'eps_1y')
+BPS_FIELDS = ('bps_3y', 'bps_2y', 'bps_1y')
+PBR_FIELDS = ('pbr_3y', 'pbr_2y', 'pbr_1y')
+
+# 3년전, 2년전, 직전년도 EPS의 가중치
+EPS_WEIGHTS = (1, 2, 3)
+# EPS 가중평균에 곱하는 배수 (PER 10배)
+EPS_MULTIPLE = 10
+# 내재가치에서 BPS가 차지하는 비중. 나머지가 EPS 쪽이다
+BPS_WEIGHT = 0.5
+
+
+def intrinsic_values(eps, bps, treasury_ratio, eps_weights=EPS_WEIGHTS, eps_multiple=EPS_MULTIPLE,
+                     bps_weight=BPS_WEIGHT, treasury_adjust=True):
+    """전 종목의 내재가치.
+
+    :param eps: (종목 수, 3) float64. 3년전, 2년전, 직전년도 순이고 빈 값은 NaN
+    :param bps: eps와 같은 모양
+    :param treasury_ratio: (종목 수,) 자사주 비율(%). NaN이면 0으로 본다
+    :return: (내재가치, 계산 불가 마스크). 계산 불가인 자리의 값은 NaN이다
+    """
+    eps = np.asarray(eps, dtype=np.float64)
+    bps = np.asarray(bps, dtype=np.float64)
+    undefined = np.isnan(eps).any(axis=1) & np.isnan(bps).any(axis=1)
+
+    # 행렬곱 대신 직접 더한다. 더하는 순서가 스칼라 공식과 같아야 값이 같다
+    w0, w1, w2 = eps_weights
+    weighted_eps = (eps[:, 2] * w2 + eps[:, 1] * w1 + eps[:, 0] * w0) / (w0 + w1 + w2)
+    # 기본값(0.5)이면 (EPS 쪽 + BPS) / 2와 비트 단위로 같다. 0.5를 곱하는 것은 오차가 없다
+    values = weighted_eps * eps_multiple * (1 - bps_weight) + bps[:, 2] * bps_weight
+
+    if treasury_adjust:
+        ratio = np.nan_to_num(np.asarray(treasury_ratio, dtype=np.float64), nan=0.0)
+        held = ratio > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factor = np.where(held, 100 / (100 - ratio), 1.0)
+            # 100% 이상은 잘못 긁힌 값이다. 나누기가 터지는 대신 NaN으로 둔다
+            values = np.where(held & (ratio >= 100), np.nan, values * factor)
+
+    values[undefined] = np.nan
+    return values, undefined
+
+
+def has_price(price):
+    """안전마진을 구할 수 있는 주가인가. None·0·NaN은 아니다."""
+    return isinstance(price, (int, float)) and price == price and price != 0
+
+
+def safety_margin(value, price):
+    """한 종목의 안전마진. safety_margins와 같은 규칙이다.
+
+    :param value: 내재가치. None이면 계산 불가다
+    """
+    if value is None or not has_price(price):
+        return None
+    return (value - price) / price * 100
+
+
+def safety_margins(values, undefined, price):
+    """(내재가치 - 주가) / 주가 × 100. 주가가 없거나 0이면 NaN."""
+    price = np.asarray(price, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        margins = (values - price) / price * 100
+    margins[undefined | ~(price != 0) | np.isnan(price)] = np.nan
+    return margins
+
+
+def has_fundamentals(row):
+    """연도별 EPS·BPS가 저장된 행인가. 이 필드가 생기기 전에 긁은 행은 없다."""
+    return EPS_FIELDS[-1] in row
+
+
+def _matrix(rows, fields):
+    """(행 수, 필드 수) float64. None은 NaN이 된다."""
+    pick = itemgetter(*fields)
+    try:
+        # 크롤러가 쓴 행은 키가 다 있고 값이 숫자나 None이다. 행마다 튜플 하나만 만든다
+        data = np.array([pick(row) for row in rows], dtype=np.float64)
+    except (KeyError, TypeError, ValueError):
+        data = np.array([[_number(row.get(f)) for f in fields] for row in rows], dtype=np.float64)
+    return data.reshape(len(rows), len(fields))
+
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return math.nan
+    return value
+
+
+def _same(a, b):
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return a == b and (a is None) == (b is None)
+
+
+def revalue(rows):
+    """원재료가 저장된 행의 intrinsic_value·safety_margin을 다시 계산해 행에 쓴다.
+
+    원재료가 없는 행(예전 형식)은 다음에 재크롤링될 때까지 저장된 값을 둔다.
+
+    :return: (다시 계산한 행 수, 그중 값이 바뀐 행 수)
+    """
+    rows = [row for row in rows if has_fundamentals(row)]
+    if not rows:
+        return 0, 0
+    eps = _matrix(rows, EPS_FIELDS)
+    bps = _matrix(rows, BPS_FIELDS)
+    ratio, price = _matrix(rows, ('treasury_ratio', 'current_price')).T
+
+    values, undefined = intrinsic_values(eps, bps, ratio)
+    margins = safety_margins(values, undefined, price)
+    # 주가가 없는 것과 내재가치가 NaN인 것은 안전마진에서 다르게 남는다 (None / NaN)
+    no_price = ~(price != 0) | np.isnan(price)
+
+    changed = 0
+    for row, value, margin, none, priceless in zip(rows, values.tolist(), margins.tolist(),
+                                                    undefined.tolist(), no_price.tolist()):
+        value = None if none else value
+        margin = None if none or priceless else margin
+        if not (_same(row.get('intrinsic_value'), value) and _same(row.get('safety_margin'), margin)):
+            changed += 1
+        row['intrinsic_value'] = value
+        row['safety_margin'] = margin
+    return len(rows), changed
+
+
+class ValuationTable:
+    """종목 목록 하나의 원재료 배열. 데이터가 바뀌면 새로 만든다.
+
+    원재료가 없는 행(예전 형식)은 계산 불가로 보고 순위에서 뺀다.
+
+    :param rows: 행 목록. 안전마진이 같으면 이 순서를 따른다
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.eps = _matrix(rows, EPS_FIELDS)
+        self.bps = _matrix(rows, BPS_FIELDS)
+        self.treasury_ratio, self.price = _matrix(rows, ('treasury_ratio', 'current_price')).T
+        self.covered = sum(1 for row in rows if has_fundamentals(row))
+
+    def evaluate(self, **params):
+        """(내재가치, 안전마진). 계산할 수 없는 자리는 NaN이다.
+
+        :param params: intrinsic_values의 eps_weights·eps_multiple·bps_weight·treasury_adjust
+        """
+        values, undefined = intrinsic_values(self.eps, self.bps, self.treasury_ratio, **params)
+        return values, safety_margins(values, undefined, self.price)
+
+    def top(self, count, **params):
+        """안전마진 상위 count개.
+
+        :return: (행 번호 배열, 내재가치 배열, 안전마진 배열, 순위에 든 종목 수)
+        """
+        values, margins = self.evaluate(**params)
+        ranked = np.flatnonzero(~np.isnan(margins))
+        count = min(max(count, 0), len(ranked))
+        if count == 0:
+            return ranked[:0], values[:0], margins[:0], len(ranked)
+        # 전체를 정렬하지 않고 상위 count개만 골라 그것만 정렬한다
+        key = margins[ranked]
+        if count < len(ranked):
+            # argpartition은 경계의 동점 중 아무거나 고른다. 경계값과 같은 것을
+            # 모두 넣어 정렬한 뒤 자르면 동점이어도 늘 같은 종목이 든다
+            cutoff = -np.partition(-key, count - 1)[count - 1]
+            part = np.flatnonzero(key >= cutoff)
+        else:
+            part = np.arange(len(ranked))
+        # 값이 같으면 원래 순서(작은 행 번호)가 먼저다
+        picked = ranked[part[np.lexsort((ranked[part], -key[part]))]][:count]
+        return picked, values[picked], margins[picked], len(ranked)